@@ -0,0 +1,159 @@
+"""Throughput of the transfers between wofi-pubs and a DPT-RP1.
+
+Runs the real `dptrp1.DigitalPaper` client and the upload and
+synchronization code of wofi-pubs against the local stand-in of the device
+(``fake_dpt_server.py``), with documents of several sizes:
+
+* ``to_dpt``: single document sent with the legacy function.
+* ``batch``: several documents sent through the upload queue.
+* ``batch again``: same request once the documents are in the device, which
+  is answered from the inventory.
+* ``sync-back``: download of the documents annotated in the device.
+
+Usage::
+
+    python benchmarks/bench_dpt.py [--sizes-mb 1 10 50] [--batch 8]
+        [--latency 0.02] [--bandwidth-mbps 10] [--parallel 2]
+
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from fake_dpt_server import FakeDptServer, make_client_credentials
+from sample_pdf import make_pdf
+
+from wofi_pubs import print_to_dpt
+from wofi_pubs.print_to_dpt import (
+    Document,
+    DptInventory,
+    DptSessionPool,
+    DptUploadQueue,
+    library_name,
+    sync_annotated_docs,
+    to_dpt,
+)
+
+
+class BenchRepo:
+    """Minimal stand-in of a pubs repository, with one article per citekey."""
+
+    def __init__(self, docs):
+        self.conf = {"main": {"pubsdir": "/tmp/bench_library"}}
+        self.databroker = self
+        self._docs = docs
+
+    def pull_bibentry(self, key):
+        return {key: {"ENTRYTYPE": "article", "year": "2024", "title": key}}
+
+    def pull_docpath(self, key):
+        return self._docs[key]
+
+
+class _Silent:
+    """Notifications are not part of the measurements."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    new = staticmethod(lambda *args, **kwargs: _Silent())
+
+
+def make_documents(directory, prefix, n, size):
+    docs = dict()
+    for k in range(n):
+        path = Path(directory) / f"{prefix}_{k}.pdf"
+        make_pdf(path, pages=3, padding=size)
+        docs[f"{prefix}_{k}"] = str(path)
+    return docs
+
+
+def report(name, size_mb, n, elapsed):
+    rate = size_mb * n / elapsed if elapsed > 0 else float("inf")
+    print(
+        f"{size_mb:8.1f} MB  {name:<12} {n:3d} docs  {elapsed:8.3f} s  "
+        + f"{rate:8.2f} MB/s"
+    )
+
+
+def upload(queue, docs, addr):
+    done = threading.Event()
+    results = []
+
+    def on_done(res):
+        results.extend(res)
+        done.set()
+
+    start = time.perf_counter()
+    queue.submit(docs, addr, on_done)
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    failed = [(key, err) for key, _, status, err in results if status == "failed"]
+    if failed:
+        raise RuntimeError(f"Upload failed: {failed}")
+
+    return elapsed
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 10, 50])
+    pars.add_argument("--batch", type=int, default=8, help="Documents per batch")
+    pars.add_argument("--latency", type=float, default=0.02, help="Seconds")
+    pars.add_argument("--bandwidth-mbps", type=float, default=10, help="MB/s")
+    pars.add_argument("--parallel", type=int, default=2, help="Concurrent uploads")
+    args = pars.parse_args()
+
+    print_to_dpt.Notify.Notification = _Silent
+
+    bandwidth = args.bandwidth_mbps * 2**20 if args.bandwidth_mbps else None
+    with tempfile.TemporaryDirectory() as tmp, FakeDptServer(
+        latency=args.latency, bandwidth=bandwidth
+    ) as server:
+        addr = server.addr
+        dev_id, dev_key = make_client_credentials(tmp)
+        sessions = DptSessionPool(dev_id=dev_id, dev_key=dev_key)
+        dpt = sessions.get(addr)
+
+        for size_mb in args.sizes_mb:
+            size = int(size_mb * 2**20)
+            tag = f"s{size}"
+            paths = make_documents(tmp, tag, args.batch + 1, size)
+            repo = BenchRepo(paths)
+            lib_name = library_name(repo)
+            keys = list(paths)
+
+            start = time.perf_counter()
+            to_dpt(repo, keys[0], addr, sessions)
+            report("to_dpt", size_mb, 1, time.perf_counter() - start)
+
+            docs = [Document(key=k, repo=repo, lib_name=lib_name) for k in keys[1:]]
+            inventory = DptInventory(str(Path(tmp) / f"{tag}_inventory.json"))
+            queue = DptUploadQueue(sessions, args.parallel, inventory)
+            report("batch", size_mb, len(docs), upload(queue, docs, addr))
+            report("batch again", size_mb, len(docs), upload(queue, docs, addr))
+
+            # Let the inventory record the revisions of the uploaded files
+            sync_annotated_docs(dpt, addr, docs, inventory)
+            for doc in docs:
+                server.storage.annotate(doc.remote_path())
+            start = time.perf_counter()
+            synced = sync_annotated_docs(
+                dpt, addr, docs, inventory, parallel=args.parallel
+            )
+            elapsed = time.perf_counter() - start
+            if any(path is None for *_, path in synced):
+                raise RuntimeError(f"Synchronization failed: {synced}")
+            report("sync-back", size_mb, len(synced), elapsed)
+
+        print("\nRequests per endpoint:")
+        for name, count in sorted(server.requests.items()):
+            print(f"  {name:<36} {count:6d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Per-document latency of the PDF metadata update.
+
+Compares starting one exiftool process per document with sending the
+commands to a persistent ``exiftool -stay_open`` process.
+
+Usage::
+
+    python benchmarks/bench_exiftool.py [-n 50]
+
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sample_pdf import make_pdf
+
+from wofi_pubs.exiftool import ExifTool
+from wofi_pubs.update_metadata import write_pdf_metadata
+
+
+def run(paths, exiftool=None):
+    timings = []
+    for k, path in enumerate(paths):
+        start = time.perf_counter()
+        write_pdf_metadata(str(path), f"Title {k}", "Doe, John", exiftool)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    ms = [t * 1e3 for t in timings]
+    print(
+        f"{name:<12} mean {statistics.mean(ms):8.2f} ms   "
+        + f"median {statistics.median(ms):8.2f} ms   max {max(ms):8.2f} ms"
+    )
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("-n", type=int, default=50, help="Number of documents")
+    args = pars.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [Path(tmp) / f"doc_{k}.pdf" for k in range(args.n)]
+        for p in paths:
+            make_pdf(p)
+
+        report("subprocess", run(paths))
+
+        exiftool = ExifTool()
+        # The first command pays the start of the process
+        report("stay_open", run(paths, exiftool))
+        exiftool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Native incremental update of the PDF metadata against exiftool.
+
+Writes the title and author of sample files with every kind of
+cross-reference section, checks that the new values can be read back and
+reports the time needed and the growth of the file.
+
+Usage::
+
+    python benchmarks/bench_pdf_info.py [--size-mb 50]
+
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from sample_pdf import XREF_STYLES, make_pdf
+
+from wofi_pubs.pdf_info import read_info
+from wofi_pubs.update_metadata import write_pdf_metadata
+
+TITLE = "On the (in)stability of Ünïcode titles \\ a study"
+AUTHOR = "Doe, John; Roe, Jane"
+
+
+def run(path, backend):
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    ok = write_pdf_metadata(str(path), TITLE, AUTHOR, backend=backend)
+    elapsed = time.perf_counter() - start
+    return ok, elapsed, os.path.getsize(path) - size
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("--size-mb", type=float, default=50, help="Size of the files")
+    args = pars.parse_args()
+
+    backends = ["native"]
+    if shutil.which("exiftool"):
+        backends.append("exiftool")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for style in XREF_STYLES:
+            for backend in backends:
+                path = Path(tmp) / f"{style}_{backend}.pdf"
+                make_pdf(path, pages=3, padding=int(args.size_mb * 2**20), xref=style)
+                ok, elapsed, growth = run(path, backend)
+                back = read_info(path)
+                check = "ok" if back == (TITLE, AUTHOR) else f"read back {back}"
+                print(
+                    f"{style:<11} {backend:<9} {elapsed * 1e3:9.2f} ms "
+                    + f"{growth:+12d} bytes  {'written' if ok else 'FAILED'}, {check}"
+                )
+
+
+if __name__ == "__main__":
+    main()
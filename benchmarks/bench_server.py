@@ -0,0 +1,358 @@
+"""End-to-end benchmark of the wofi-pubs server on synthetic libraries.
+
+For each library size a synthetic pubs library is generated (see
+``synthetic_library.py``, the libraries are reused between runs) and a
+`PubsServer` is started on it in a fresh interpreter. The following is
+measured:
+
+* ``startup``: creation of the server, and ``reload``: a second call of
+  ``_load_publications``.
+* ``get-publication-list`` without tag, with the most used tag and with
+  the least used tag, ``get-publication-info`` of random papers and
+  ``add-reference`` of a DOI, whose bibliographic data comes from a
+  stand-in resolver instead of the web APIs. Each command is run directly
+  on the server (``direct``, handler only) and through the socket
+  (``socket``, round trip seen by a client; ``add-reference`` is sent in a
+  ``batch`` to get a reply).
+* ``rss``: memory of the server after the start-up and peak memory.
+
+The results are written to a JSON file, and can be compared with an
+earlier run.
+
+Usage::
+
+    python benchmarks/bench_server.py [--sizes 1000 10000 100000] [-n 50]
+        [--workdir /tmp/wofi-pubs-bench] [--output results.json]
+        [--compare old.json]
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from multiprocessing.connection import Client
+from pathlib import Path
+
+from synthetic_library import PaperFactory, make_library
+
+OPERATIONS = (
+    "get-publication-list",
+    "get-publication-list (common tag)",
+    "get-publication-list (rare tag)",
+    "get-publication-info",
+    "add-reference",
+)
+
+
+class _Silent:
+    """Notifications are not part of the measurements."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    new = staticmethod(lambda *args, **kwargs: _Silent())
+
+
+class _Replies(list):
+    def send(self, obj):
+        self.append(obj)
+
+
+class StandInResolver:
+    """Bibliographic data of DOIs, in place of the web APIs used by pubs.
+
+    Has the signature of `pubs.commands.add_cmd.bibentry_from_api`, and
+    always returns the same entry for a DOI.
+
+    """
+
+    def __init__(self, seed=0):
+        self._factory = PaperFactory(1000, seed + 1)
+        self._entries = dict()
+
+    def __call__(self, args, ui, raw=False):
+        if args.doi not in self._entries:
+            citekey, bibdata, *_ = self._factory.paper()
+            self._entries[args.doi] = {citekey: dict(bibdata, doi=args.doi)}
+        return self._entries[args.doi]
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def summarize(timings):
+    ms = sorted(t * 1e3 for t in timings)
+    q = statistics.quantiles(ms, n=100) if len(ms) > 1 else ms * 99
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.mean(ms),
+        "p50_ms": q[49],
+        "p90_ms": q[89],
+        "p99_ms": q[98],
+        "max_ms": ms[-1],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def messages(info, keys, repeat, rng):
+    """Messages of each operation, `repeat` times."""
+    library = info["library"]
+    tags = sorted(info["tags"].items(), key=lambda kv: kv[1])
+    msgs = {
+        "get-publication-list": {
+            "cmd": "get-publication-list",
+            "library": library,
+            "tag": None,
+        },
+        "get-publication-list (common tag)": {
+            "cmd": "get-publication-list",
+            "library": library,
+            "tag": tags[-1][0],
+        },
+        "get-publication-list (rare tag)": {
+            "cmd": "get-publication-list",
+            "library": library,
+            "tag": tags[0][0],
+        },
+    }
+    out = {name: [msg] * repeat for name, msg in msgs.items()}
+    out["get-publication-info"] = [
+        {"cmd": "get-publication-info", "library": library, "citekey": key}
+        for key in rng.choices(keys, k=repeat)
+    ]
+    return out
+
+
+def add_message(library, doi):
+    from wofi_pubs.wofi_pubs_server import PubsArgs
+
+    args = PubsArgs()
+    args.doi = doi
+    msg = {"cmd": "add-reference", "args": args}
+    if library is not None:
+        msg["library"] = library
+    return msg
+
+
+def run_server(root, size, seed, repeat, port):
+    """Measurements of one library, run in a fresh interpreter."""
+    import pubs.commands.add_cmd
+
+    from wofi_pubs import wofi_pubs_server
+    from wofi_pubs.wofi_pubs_server import PubsServer
+
+    info = make_library(root, size, seed)
+    rng = random.Random(seed)
+    resolver = StandInResolver(seed)
+    wofi_pubs_server.bibentry_from_api = resolver
+    pubs.commands.add_cmd.bibentry_from_api = resolver
+    wofi_pubs_server.Notify.Notification = _Silent
+
+    start = time.perf_counter()
+    server = PubsServer(info["config"])
+    startup = time.perf_counter() - start
+    rss_startup = rss_mb()
+    start = time.perf_counter()
+    server._load_publications()
+    reload = time.perf_counter() - start
+
+    library = info["library"]
+    initial_keys = set(server.keys[library])
+    msgs = messages(info, list(initial_keys), repeat, rng)
+    results = {"startup_s": startup, "reload_s": reload, "direct": {}, "socket": {}}
+
+    for name, ops in msgs.items():
+        timings = []
+        for msg in ops:
+            start = time.perf_counter()
+            server._dispatch(_Replies(), msg)
+            timings.append(time.perf_counter() - start)
+        results["direct"][name] = summarize(timings)
+
+    timings = []
+    for k in range(repeat):
+        msg = add_message(library, f"10.5555/direct.{k}")
+        start = time.perf_counter()
+        server._dispatch(_Replies(), msg)
+        timings.append(time.perf_counter() - start)
+    results["direct"]["add-reference"] = summarize(timings)
+
+    # The completion is measured on the same port as the other commands
+    threading.Thread(
+        target=server.start_listening, args=(("localhost", port), None), daemon=True
+    ).start()
+    for _ in range(100):
+        try:
+            conn = Client(("localhost", port))
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+    for name, ops in msgs.items():
+        timings = []
+        for msg in ops:
+            start = time.perf_counter()
+            conn.send(msg)
+            conn.recv()
+            timings.append(time.perf_counter() - start)
+        results["socket"][name] = summarize(timings)
+
+    timings = []
+    for k in range(repeat):
+        msg = add_message(None, f"10.5555/socket.{k}")
+        start = time.perf_counter()
+        conn.send({"cmd": "batch", "library": library, "ops": [msg]})
+        (result,) = conn.recv()
+        timings.append(time.perf_counter() - start)
+        if not result["ok"]:
+            raise RuntimeError(f"add-reference failed: {result['error']}")
+    results["socket"]["add-reference"] = summarize(timings)
+    conn.close()
+
+    # Leave the library as it was generated
+    for key in set(server.keys[library]) - initial_keys:
+        for sub, ext in (("bib", ".bib"), ("meta", ".yaml")):
+            Path(info["pubsdir"], sub, key + ext).unlink(missing_ok=True)
+
+    results["rss_startup_mb"] = rss_startup
+    # In kilobytes on Linux
+    results["rss_peak_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return results
+
+
+def git_commit():
+    sp = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        encoding="UTF-8",
+    )
+    return sp.stdout.strip() or None
+
+
+def report(size, results):
+    print(
+        f"\n{size} papers: startup {results['startup_s']:.2f} s, "
+        + f"reload {results['reload_s']:.2f} s, "
+        + f"RSS {results['rss_startup_mb']:.0f} MB "
+        + f"(peak {results['rss_peak_mb']:.0f} MB)"
+    )
+    print(f"  {'':<36} {'direct p50':>11} {'p99':>9} {'socket p50':>11} {'p99':>9}")
+    for name in OPERATIONS:
+        d = results["direct"][name]
+        s = results["socket"][name]
+        print(
+            f"  {name:<36} {d['p50_ms']:9.2f}ms {d['p99_ms']:7.2f}ms "
+            + f"{s['p50_ms']:9.2f}ms {s['p99_ms']:7.2f}ms"
+        )
+
+
+def compare(old, new):
+    """Print the ratio new/old of the main measurements."""
+    print(f"\nCompared with {old['meta']['date']} ({old['meta']['commit']}):")
+    for size, res in new["results"].items():
+        ref = old["results"].get(size)
+        if ref is None:
+            continue
+        rows = [("startup", res["startup_s"], ref["startup_s"])]
+        rows.append(("rss peak", res["rss_peak_mb"], ref["rss_peak_mb"]))
+        for mode in ("direct", "socket"):
+            for name in OPERATIONS:
+                rows.append(
+                    (
+                        f"{mode} {name}",
+                        res[mode][name]["p50_ms"],
+                        ref[mode][name]["p50_ms"],
+                    )
+                )
+        print(f"  {size} papers")
+        for name, value, ref_value in rows:
+            ratio = value / ref_value if ref_value else float("inf")
+            print(f"    {name:<44} x{ratio:5.2f}")
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    pars.add_argument("-n", type=int, default=50, help="Repetitions per command")
+    pars.add_argument("--seed", type=int, default=0)
+    pars.add_argument(
+        "--workdir",
+        type=str,
+        default=os.path.join(tempfile.gettempdir(), "wofi-pubs-bench"),
+        help="Where the synthetic libraries are kept",
+    )
+    pars.add_argument("--output", type=str, default=None, help="JSON results")
+    pars.add_argument("--compare", type=str, default=None, help="Earlier results")
+    pars.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = pars.parse_args()
+
+    if args.worker:
+        # Measurements of a single size, run in a separate interpreter
+        root, result_file = args.worker.split(os.pathsep)
+        results = run_server(root, args.sizes[0], args.seed, args.n, free_port())
+        Path(result_file).write_text(json.dumps(results))
+        return
+
+    now = datetime.now()
+    output = args.output or f"bench-server-{now:%Y%m%d-%H%M%S}.json"
+    data = {
+        "meta": {
+            "date": now.isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "seed": args.seed,
+            "repeat": args.n,
+        },
+        "results": {},
+    }
+
+    for size in args.sizes:
+        root = os.path.join(args.workdir, f"n{size}")
+        start = time.perf_counter()
+        make_library(root, size, args.seed)
+        print(f"Library of {size} papers ready ({time.perf_counter() - start:.1f} s)")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            result_file = os.path.join(tmp, "results.json")
+            subprocess.run(
+                [sys.executable, __file__, "--sizes", str(size), "-n", str(args.n)]
+                + ["--seed", str(args.seed)]
+                + ["--worker", os.pathsep.join((root, result_file))],
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            results = json.loads(Path(result_file).read_text())
+
+        data["results"][str(size)] = results
+        report(size, results)
+
+    Path(output).write_text(json.dumps(data, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Import time of the clients.
+
+The time between the key press and the menu is dominated by the imports of
+the client. Each client module is imported in a fresh interpreter with
+``python -X importtime``, and the slowest imports are reported. The script
+fails if the import takes longer than the threshold, or if a module that is
+only needed to add references (GTK dialogs, bibtexparser) is imported.
+
+Usage::
+
+    python benchmarks/bench_startup.py [--max-ms 150] [-n 5]
+
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+
+CLIENTS = ("wofi_pubs.wofi_pubs", "wofi_pubs.rofi_pubs")
+# Only needed to add references
+LAZY = ("gi", "bibtexparser", "wofi_pubs.dialogs")
+
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+
+def import_times(module):
+    """Import a module in a new interpreter.
+
+    Returns
+    -------
+    dict :
+        Maps each imported module to its cumulative import time in
+        microseconds.
+
+    """
+    sp = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        encoding="UTF-8",
+    )
+    times = dict()
+    errors = []
+    for line in sp.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m is None:
+            errors.append(line)
+            continue
+        times[m.group(4)] = int(m.group(2))
+    if sp.returncode != 0:
+        raise RuntimeError(f"Unable to import {module}:\n" + "\n".join(errors))
+
+    return times
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("--max-ms", type=float, default=150, help="Threshold")
+    pars.add_argument("-n", type=int, default=5, help="Runs per client (best kept)")
+    pars.add_argument("--top", type=int, default=8, help="Slowest imports shown")
+    args = pars.parse_args()
+
+    failed = False
+    for module in CLIENTS:
+        runs = [import_times(module) for _ in range(args.n)]
+        best = min(runs, key=lambda t: t[module])
+        total_ms = best[module] / 1e3
+
+        lazy = sorted(m for m in best if m.split(".")[0] in LAZY or m in LAZY)
+        ok = total_ms <= args.max_ms and not lazy
+        failed |= not ok
+
+        print(f"{module:<22} {total_ms:8.1f} ms  {'ok' if ok else 'FAILED'}")
+        if lazy:
+            print(f"    imported at start-up: {', '.join(lazy)}")
+        slowest = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        for name, us in slowest[1 : args.top + 1]:
+            print(f"    {us / 1e3:8.1f} ms  {name}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+"""Local stand-in for the REST API of a Sony DPT-RP1.
+
+Implements the subset of the Digital Paper API used by `dptrp1.DigitalPaper`
+(authentication, storage status, path resolution, folder creation, document
+upload, download, listing and deletion, and display of a document), so that
+the real client and the upload code of wofi-pubs can be exercised without a
+device. The latency of every request and the bandwidth of the transfers can
+be configured.
+
+The documents are kept in memory. The server speaks HTTPS with a self-signed
+certificate, as the device does; `DigitalPaper` does not verify it.
+
+Usage::
+
+    python benchmarks/fake_dpt_server.py [--port 8443] [--latency 0.02]
+        [--bandwidth-mbps 5]
+
+"""
+
+import argparse
+import json
+import re
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path, PurePath
+from urllib.parse import unquote_plus, urlsplit
+
+ROOT_ID = "root"
+
+
+class DptError(Exception):
+    """Error answered to the client."""
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class Storage:
+    """In-memory file system of the device."""
+
+    def __init__(self):
+        self.entries: dict[str, dict] = dict()
+        self.data: dict[str, bytes] = dict()
+        self.displayed: list[tuple[str, int]] = []
+        self._lock = threading.Lock()
+        now = self._now()
+        self.entries[ROOT_ID] = {
+            "entry_type": "folder",
+            "entry_id": ROOT_ID,
+            "entry_name": "Document",
+            "entry_path": "Document",
+            "created_date": now,
+        }
+        self.new_folder("Note", ROOT_ID)
+
+    @staticmethod
+    def _now():
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    def resolve(self, path):
+        path = str(PurePath(path))
+        with self._lock:
+            for entry in self.entries.values():
+                if entry["entry_path"] == path:
+                    return entry
+        raise DptError(404, "40401", f"Entry not found: {path}")
+
+    def get(self, entry_id, entry_type=None):
+        with self._lock:
+            entry = self.entries.get(entry_id)
+        if entry is None or entry_type not in (None, entry["entry_type"]):
+            raise DptError(404, "40401", f"Entry not found: {entry_id}")
+        return entry
+
+    def _child(self, name, parent_id, entry_type):
+        parent = self.get(parent_id, "folder")
+        path = f"{parent['entry_path']}/{name}"
+        with self._lock:
+            if any(e["entry_path"] == path for e in self.entries.values()):
+                raise DptError(409, "40902", f"Entry already exists: {path}")
+            entry_id = str(uuid.uuid4())
+            self.entries[entry_id] = {
+                "entry_type": entry_type,
+                "entry_id": entry_id,
+                "entry_name": name,
+                "entry_path": path,
+                "parent_folder_id": parent_id,
+                "created_date": self._now(),
+            }
+        return entry_id
+
+    def new_folder(self, name, parent_id):
+        return self._child(name, parent_id, "folder")
+
+    def new_document(self, name, parent_id):
+        entry_id = self._child(name, parent_id, "document")
+        self.write(entry_id, b"")
+        return entry_id
+
+    def write(self, entry_id, data):
+        entry = self.get(entry_id, "document")
+        with self._lock:
+            self.data[entry_id] = data
+            revision = int(entry.get("file_revision", "0").split("-")[0]) + 1
+            entry.update(
+                {
+                    "document_type": "normal",
+                    "mime_type": "application/pdf",
+                    "file_size": str(len(data)),
+                    "file_revision": f"{revision}-{uuid.uuid4().hex[:8]}",
+                    "modified_date": self._now(),
+                }
+            )
+
+    def read(self, entry_id):
+        self.get(entry_id, "document")
+        with self._lock:
+            return self.data[entry_id]
+
+    def children(self, folder_id):
+        self.get(folder_id, "folder")
+        with self._lock:
+            return [
+                dict(e)
+                for e in self.entries.values()
+                if e.get("parent_folder_id") == folder_id
+            ]
+
+    def documents(self):
+        with self._lock:
+            return [dict(e) for e in self.entries.values() if e["entry_id"] != ROOT_ID]
+
+    def delete(self, entry_id, entry_type):
+        # Not found, or not of this type
+        self.get(entry_id, entry_type)
+        if entry_type == "folder" and self.children(entry_id):
+            raise DptError(400, "40001", "Folder is not empty")
+        with self._lock:
+            del self.entries[entry_id]
+            self.data.pop(entry_id, None)
+
+    def annotate(self, path, extra=b"% annotation\n"):
+        """Emulate the annotation of a document in the device."""
+        entry = self.resolve(path)
+        self.write(entry["entry_id"], self.read(entry["entry_id"]) + extra)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    routes = [
+        ("GET", r"/auth/nonce/(?P<client_id>[^/]+)", "nonce", False),
+        ("PUT", r"/auth", "auth", False),
+        ("GET", r"/system/status/storage", "storage", True),
+        ("GET", r"/resolve/entry/path/(?P<path>.+)", "resolve", True),
+        ("POST", r"/folders2", "new_folder", True),
+        ("GET", r"/folders/(?P<entry_id>[^/]+)/entries", "entries", True),
+        ("DELETE", r"/folders/(?P<entry_id>[^/]+)", "delete_folder", True),
+        ("GET", r"/documents2", "list_documents", True),
+        ("POST", r"/documents2", "new_document", True),
+        ("GET", r"/documents/(?P<entry_id>[^/]+)/file", "download", True),
+        ("PUT", r"/documents/(?P<entry_id>[^/]+)/file", "upload", True),
+        ("GET", r"/documents/(?P<entry_id>[^/]+)", "document_info", True),
+        ("DELETE", r"/documents/(?P<entry_id>[^/]+)", "delete_document", True),
+        ("PUT", r"/viewer/controls/open2", "display", True),
+    ]
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        path = urlsplit(self.path).path
+        self._consumed = False
+        self.server.count(method, path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        try:
+            for route_method, pattern, name, private in self.routes:
+                m = re.fullmatch(pattern, path)
+                if route_method == method and m is not None:
+                    if private and not self._authenticated():
+                        raise DptError(401, "40101", "Authentication is required")
+                    getattr(self, "_" + name)(**m.groupdict())
+                    return
+            raise DptError(404, "40401", f"No endpoint {method} {path}")
+        except DptError as e:
+            self._body()
+            self._send_json({"error_code": e.code, "message": e.message}, e.status)
+
+    # Transport
+
+    def _authenticated(self):
+        cookie = self.headers.get("Cookie", "")
+        return f"Credentials={self.server.credentials}" in cookie
+
+    def _body(self):
+        if self._consumed:
+            return b""
+        self._consumed = True
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            out = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(out)
+                out += self._read(size)
+                self.rfile.readline()
+        return self._read(int(self.headers.get("Content-Length", 0)))
+
+    def _read(self, size):
+        out = bytearray()
+        while len(out) < size:
+            chunk = self.rfile.read(min(self.server.chunk, size - len(out)))
+            if not chunk:
+                break
+            out += chunk
+            self.server.throttle(len(chunk))
+        return bytes(out)
+
+    def _json(self):
+        body = self._body()
+        return json.loads(body) if body else {}
+
+    def _send(self, data=b"", status=200, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        view = memoryview(data)
+        for k in range(0, len(view), self.server.chunk):
+            chunk = view[k : k + self.server.chunk]
+            self.wfile.write(chunk)
+            self.server.throttle(len(chunk))
+
+    def _send_json(self, obj, status=200, headers=()):
+        self._send(json.dumps(obj).encode("UTF-8"), status, headers=headers)
+
+    # Endpoints
+
+    def _nonce(self, client_id):
+        self._body()
+        self._send_json({"nonce": uuid.uuid4().hex})
+
+    def _auth(self):
+        data = self._json()
+        if not data.get("client_id") or not data.get("nonce_signed"):
+            raise DptError(400, "40001", "Invalid authentication request")
+        cookie = f"Credentials={self.server.credentials}; Path=/; Secure; HttpOnly"
+        self._send(status=204, headers=[("Set-Cookie", cookie)])
+
+    def _storage(self):
+        self._body()
+        used = sum(len(d) for d in self.server.storage.data.values())
+        capacity = 16 * 2**30
+        self._send_json({"capacity": str(capacity), "available": str(capacity - used)})
+
+    def _resolve(self, path):
+        self._body()
+        self._send_json(self.server.storage.resolve(unquote_plus(path)))
+
+    def _new_folder(self):
+        data = self._json()
+        entry_id = self.server.storage.new_folder(
+            data["folder_name"], data["parent_folder_id"]
+        )
+        self._send_json({"folder_id": entry_id})
+
+    def _entries(self, entry_id):
+        self._body()
+        entries = self.server.storage.children(entry_id)
+        self._send_json({"entry_list": entries, "count": len(entries)})
+
+    def _delete_folder(self, entry_id):
+        self._body()
+        self.server.storage.delete(entry_id, "folder")
+        self._send(status=204)
+
+    def _list_documents(self):
+        self._body()
+        entries = self.server.storage.documents()
+        self._send_json({"entry_list": entries, "count": len(entries)})
+
+    def _new_document(self):
+        data = self._json()
+        entry_id = self.server.storage.new_document(
+            data["file_name"], data["parent_folder_id"]
+        )
+        self._send_json({"document_id": entry_id})
+
+    def _download(self, entry_id):
+        self._body()
+        self._send(self.server.storage.read(entry_id), content_type="application/pdf")
+
+    def _upload(self, entry_id):
+        m = re.search(r"boundary=([^;]+)", self.headers.get("Content-Type", ""))
+        if m is None:
+            raise DptError(400, "40001", "multipart/form-data expected")
+        boundary = b"--" + m.group(1).strip('"').encode("ascii")
+        body = self._body()
+        start = body.find(b"\r\n\r\n", body.find(boundary)) + 4
+        end = body.rfind(b"\r\n" + boundary)
+        if start < 4 or end < start:
+            raise DptError(400, "40001", "Invalid multipart body")
+        self.server.storage.write(entry_id, body[start:end])
+        self._send(status=204)
+
+    def _document_info(self, entry_id):
+        self._body()
+        self._send_json(self.server.storage.get(entry_id, "document"))
+
+    def _delete_document(self, entry_id):
+        self._body()
+        self.server.storage.delete(entry_id, "document")
+        self._send(status=204)
+
+    def _display(self):
+        data = self._json()
+        self.server.storage.get(data["document_id"], "document")
+        self.server.storage.displayed.append((data["document_id"], data.get("page")))
+        self._send(status=204)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, storage, latency, bandwidth, verbose):
+        super().__init__(address, _Handler)
+        self.storage = storage
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.verbose = verbose
+        self.chunk = 64 * 1024
+        self.credentials = uuid.uuid4().hex
+        self.requests: dict[str, int] = dict()
+        self._lock = threading.Lock()
+
+    def count(self, method, path):
+        # Group the requests by endpoint, without the identifiers
+        path = re.sub(r"^(/resolve/entry/path)/.*", r"\1/*", path)
+        path = re.sub(r"/([0-9a-f]{8}-[0-9a-f-]{27}|root)(?=/|$)", "/*", path)
+        name = method + " " + path
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def throttle(self, n):
+        if self.bandwidth:
+            time.sleep(n / self.bandwidth)
+
+
+def make_certificate(directory):
+    """Create a self-signed certificate with openssl.
+
+    Returns
+    -------
+    certfile : str
+    keyfile : str
+
+    """
+    certfile = str(Path(directory) / "cert.pem")
+    keyfile = str(Path(directory) / "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes"]
+        + ["-keyout", keyfile, "-out", certfile, "-days", "1"]
+        + ["-subj", "/CN=digitalpaper.local"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return certfile, keyfile
+
+
+def make_client_credentials(directory):
+    """Create the client ID and private key files used to authenticate.
+
+    The server accepts any signature, but `DigitalPaper.authenticate` needs a
+    valid RSA key to sign the nonce.
+
+    Returns
+    -------
+    dev_id : str
+    dev_key : str
+
+    """
+    dev_id = Path(directory) / "deviceid.dat"
+    dev_key = Path(directory) / "privatekey.dat"
+    dev_id.write_text(str(uuid.uuid4()) + "\n")
+    subprocess.run(
+        ["openssl", "genrsa", "-traditional", "-out", str(dev_key), "2048"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return str(dev_id), str(dev_key)
+
+
+class FakeDptServer:
+    """HTTPS server emulating a DPT-RP1, running in a background thread.
+
+    Parameters
+    ----------
+    port : int
+        Port to listen on; 0 picks a free port.
+    latency : float
+        Seconds added to every request.
+    bandwidth : float
+        Transfer rate in bytes per second of the request and response
+        bodies; None for no limit.
+    tls : bool
+        Serve HTTPS (as the device) or plain HTTP.
+    verbose : bool
+        Log every request.
+
+    Examples
+    --------
+    >>> with FakeDptServer(latency=0.01) as server:
+    ...     dpt = DigitalPaper(server.addr)
+
+    """
+
+    def __init__(self, port=0, latency=0.0, bandwidth=None, tls=True, verbose=False):
+        self.storage = Storage()
+        self._server = _Server(
+            ("127.0.0.1", port), self.storage, latency, bandwidth, verbose
+        )
+        self._tmp = None
+        if tls:
+            self._tmp = tempfile.TemporaryDirectory()
+            certfile, keyfile = make_certificate(self._tmp.name)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self._server.socket = context.wrap_socket(
+                self._server.socket, server_side=True
+            )
+        self._thread = None
+
+    @property
+    def addr(self):
+        """Address to give to `DigitalPaper`.
+
+        It contains the port, so `DigitalPaper` does not add the default one.
+
+        """
+        return f"127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def url(self):
+        scheme = "http" if self._tmp is None else "https"
+        return f"{scheme}://{self.addr}"
+
+    @property
+    def requests(self):
+        """Number of requests received per endpoint."""
+        return dict(self._server.requests)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("--port", type=int, default=8443)
+    pars.add_argument("--latency", type=float, default=0.0, help="Seconds")
+    pars.add_argument("--bandwidth-mbps", type=float, default=None, help="MB/s")
+    pars.add_argument("--http", action="store_true", help="Serve plain HTTP")
+    args = pars.parse_args()
+
+    bandwidth = args.bandwidth_mbps * 2**20 if args.bandwidth_mbps else None
+    server = FakeDptServer(
+        args.port, args.latency, bandwidth, tls=not args.http, verbose=True
+    )
+    print(f"Fake DPT-RP1 listening on {server.url}")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Generation of small PDF files used by the benchmarks.
+
+The files can be written with the different kinds of cross-reference
+sections found in the wild, to check the PDF metadata writers against them.
+"""
+
+import zlib
+
+XREF_STYLES = ("table", "stream", "compressed", "hybrid", "updated")
+
+
+def make_pdf(path, pages=1, padding=0, xref="table"):
+    """Write a minimal PDF file.
+
+    Parameters
+    ----------
+    path : str
+        Output file.
+    pages : int
+        Number of (empty) pages.
+    padding : int
+        Size in bytes of an extra stream, used to emulate large documents.
+    xref : str
+        Kind of cross-reference section:
+
+        * ``table``: classic cross-reference table.
+        * ``stream``: uncompressed cross-reference stream (PDF 1.5).
+        * ``compressed``: cross-reference stream with Flate compression and
+          PNG predictor, as written by most modern producers.
+        * ``hybrid``: table with an additional ``/XRefStm``.
+        * ``updated``: table followed by an incremental update that already
+          contains a document information dictionary.
+
+    """
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids ["
+        + b" ".join(b"%d 0 R" % (5 + k) for k in range(pages))
+        + b"] /Count %d >>" % pages,
+        b"<< /Length %d >>\nstream\n" % padding + b"0" * padding + b"\nendstream",
+        b"<< /Producer (sample_pdf) /Title (Old \\(title\\)) >>",
+    ]
+    objs += [
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>" for _ in range(pages)
+    ]
+
+    out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, obj in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + obj + b"\nendobj\n"
+
+    size = len(objs) + 1
+    trailer = b"/Root 1 0 R /Info 4 0 R /ID [<0123456789ABCDEF><0123456789ABCDEF>]"
+
+    if xref in ("table", "hybrid", "updated"):
+        extra = b""
+        if xref == "hybrid":
+            # Empty cross-reference stream only referenced by /XRefStm
+            stm_off = len(out)
+            out += (
+                b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] /Index [%d 1]"
+                % (size, size + 1, size)
+                + b" /Length 7 >>\nstream\n"
+                + b"\x01"
+                + stm_off.to_bytes(4, "big")
+                + b"\x00\x00"
+                + b"\nendstream\nendobj\n"
+            )
+            extra = b" /XRefStm %d" % stm_off
+            size += 1
+        xref_off = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+        for off in offsets:
+            out += b"%010d 00000 n \n" % off
+        out += b"trailer\n<< /Size %d " % size + trailer + extra + b" >>\n"
+        out += b"startxref\n%d\n%%%%EOF\n" % xref_off
+
+        if xref == "updated":
+            info_off = len(out)
+            out += (
+                b"%d 0 obj\n<< /Producer (sample_pdf) /Title (Updated) >>\nendobj\n"
+                % size
+            )
+            prev = xref_off
+            xref_off = len(out)
+            out += b"xref\n0 1\n0000000000 65535 f \n"
+            out += b"%d 1\n%010d 00000 n \n" % (size, info_off)
+            out += b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R /Prev %d >>\n" % (
+                size + 1,
+                size,
+                prev,
+            )
+            out += b"startxref\n%d\n%%%%EOF\n" % xref_off
+    else:
+        xref_off = len(out)
+        offsets.append(xref_off)
+        rows = [b"\x00\x00\x00\x00\x00\xff\xff"]
+        rows += [b"\x01" + off.to_bytes(4, "big") + b"\x00\x00" for off in offsets]
+        if xref == "compressed":
+            # PNG "Up" predictor on each row, then Flate compression
+            prev_row = bytes(7)
+            pred = bytearray()
+            for row in rows:
+                pred += b"\x02" + bytes((a - b) % 256 for a, b in zip(row, prev_row))
+                prev_row = row
+            data = zlib.compress(bytes(pred))
+            params = (
+                b" /Filter /FlateDecode /DecodeParms << /Predictor 12 /Columns 7 >>"
+            )
+        else:
+            data = b"".join(rows)
+            params = b""
+        out += (
+            b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] " % (size, size + 1)
+            + trailer
+            + params
+            + b" /Length %d >>\nstream\n" % len(data)
+            + data
+            + b"\nendstream\nendobj\n"
+        )
+        out += b"startxref\n%d\n%%%%EOF\n" % xref_off
+
+    with open(path, "wb") as f:
+        f.write(out)
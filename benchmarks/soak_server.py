@@ -0,0 +1,598 @@
+"""Load and soak test of the wofi-pubs server with concurrent clients.
+
+A server is started in its own process on a synthetic library (see
+``synthetic_library.py``, regenerated at each run since the test modifies
+it), and N client processes connect to it through the socket, as the menus
+do: each client opens a connection, sends a few requests drawn from the
+mix, closes the connection and waits a random time before the next one.
+
+The requests of the mix are:
+
+* ``list``: ``get-publication-list`` of the whole library,
+* ``list-tag``: ``get-publication-list`` of a random tag,
+* ``info``: ``get-publication-info`` of a random paper,
+* ``tag``: ``add-tag`` of one of a few soak tags to a random paper,
+* ``complete``: ``complete`` of the first letters of a random citekey,
+* ``add``: ``add-reference`` of a new DOI (in a ``batch``, to get a reply),
+  whose bibliographic data comes from a stand-in resolver.
+
+The server accepts one client at a time, so that the time spent by a client
+waiting for its connection is reported separately (``connect``).
+
+Every ``--interval`` seconds a sample is taken: throughput, latency and
+errors of each request over the interval, resident memory of the server,
+number of entries of the library and, every ``--heap-interval`` seconds,
+the objects tracked by the garbage collector of the server. The samples are
+written as JSON lines to follow a long run, and a summary is printed at the
+end: the memory growth rate (least squares over the samples after the
+warm-up), the growth of the entries compared with the references added, and
+the types of objects whose number grew the most. The exit status is 1 if
+the memory grows faster than ``--max-rss-growth`` or if the number of
+entries does not match the references added.
+
+Usage::
+
+    python benchmarks/soak_server.py [--size 10000] [--clients 8]
+        [--duration 2h] [--mix list=30,list-tag=10,info=30,tag=10,complete=15,add=5]
+        [--interval 60] [--output soak.jsonl]
+
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from multiprocessing.connection import Client
+
+from bench_server import StandInResolver, add_message, free_port
+from synthetic_library import make_library
+
+from wofi_pubs.stats import LatencyHistogram
+
+DEFAULT_MIX = "list=30,list-tag=10,info=30,tag=10,complete=15,add=5"
+OPERATIONS = ("list", "list-tag", "info", "tag", "complete", "add")
+SOAK_TAGS = [f"soak-{k}" for k in range(10)]
+# Time to get a connection before counting an error
+CONNECT_TIMEOUT = 30.0
+
+
+def parse_duration(text):
+    """Seconds of a duration such as ``90``, ``90s``, ``30m`` or ``2h``."""
+    m = re.fullmatch(r"(\d+(?:\.\d*)?)([smh]?)", text.strip())
+    if m is None:
+        raise argparse.ArgumentTypeError(f"Invalid duration: {text}")
+    return float(m.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[m.group(2)]
+
+
+def parse_mix(text):
+    """Weights of the requests, from ``name=weight,...``."""
+    mix = dict()
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown request in the mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def server_rss_mb(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def connect(port, deadline=None):
+    """Connection to the server, retried while it serves another client.
+
+    Returns
+    -------
+    conn : :obj:`Connection`
+    refused : int
+        Number of attempts refused before the connection.
+
+    """
+    deadline = deadline or time.monotonic() + CONNECT_TIMEOUT
+    refused = 0
+    while True:
+        try:
+            return Client(("localhost", port)), refused
+        except (ConnectionRefusedError, ConnectionResetError):
+            refused += 1
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.005 * min(refused, 10))
+
+
+def request(conn, msg):
+    conn.send(msg)
+    return conn.recv()
+
+
+def run_server(root, size, seed, port):
+    """Server of the soak test, run in its own process.
+
+    It is started as ``wofi-pubs-server`` does, except for the resolver of
+    DOIs. The notifications are the real ones, so that their leaks show up.
+
+    """
+    import pubs.commands.add_cmd
+    from gi.repository import GLib
+
+    from wofi_pubs import wofi_pubs_server
+    from wofi_pubs.wofi_pubs_server import PubsServer
+
+    info = make_library(root, size, seed)
+    resolver = StandInResolver(seed)
+    wofi_pubs_server.bibentry_from_api = resolver
+    pubs.commands.add_cmd.bibentry_from_api = resolver
+
+    server = PubsServer(info["config"])
+    threading.Thread(target=GLib.MainLoop().run, daemon=True).start()
+    # The completion is served on the same port as the other commands
+    server.start_listening(("localhost", port), complete_address=None)
+
+
+class SoakClient:
+    """Client sending requests drawn from the mix until the deadline.
+
+    The results are sent every second to the main process through `results`.
+
+    """
+
+    def __init__(self, index, port, info, keys, mix, args, results):
+        self._index = index
+        self._port = port
+        self._library = info["library"]
+        self._tags = list(info["tags"])
+        self._keys = keys
+        self._ops, self._weights = zip(*mix.items())
+        self._args = args
+        self._results = results
+        self._rng = random.Random(args.seed * 1000 + index)
+        self._added = 0
+        self._reset()
+
+    def _reset(self):
+        self._latencies = {op: [] for op in OPERATIONS}
+        self._errors = Counter()
+        self._connect = []
+        self._refused = 0
+        self._dropped = 0
+        self._list_len = 0
+        self._added_ok = 0
+
+    def _flush(self):
+        self._results.put(
+            {
+                "latencies": self._latencies,
+                "errors": dict(self._errors),
+                "connect": self._connect,
+                "refused": self._refused,
+                "dropped": self._dropped,
+                "list_len": self._list_len,
+                "added": self._added_ok,
+            }
+        )
+        self._reset()
+
+    def _message(self, op):
+        rng = self._rng
+        if op == "list":
+            return {
+                "cmd": "get-publication-list",
+                "library": self._library,
+                "tag": None,
+            }
+        if op == "list-tag":
+            return {
+                "cmd": "get-publication-list",
+                "library": self._library,
+                "tag": rng.choice(self._tags),
+            }
+        if op == "info":
+            return {
+                "cmd": "get-publication-info",
+                "library": self._library,
+                "citekey": rng.choice(self._keys),
+            }
+        if op == "tag":
+            return {
+                "cmd": "add-tag",
+                "library": self._library,
+                "citekey": rng.choice(self._keys),
+                "tag": rng.choice(SOAK_TAGS),
+            }
+        if op == "complete":
+            return {
+                "cmd": "complete",
+                "library": self._library,
+                "query": rng.choice(self._keys)[: rng.randint(3, 6)],
+            }
+        self._added += 1
+        doi = f"10.5555/soak.{self._index}.{self._added}"
+        return {
+            "cmd": "batch",
+            "library": self._library,
+            "ops": [add_message(None, doi)],
+        }
+
+    def _check(self, op, reply):
+        if op in ("list", "list-tag"):
+            entries, keys = reply
+            if len(entries) != len(keys):
+                raise ValueError(f"{len(entries)} entries for {len(keys)} keys")
+            if op == "list":
+                self._list_len = max(self._list_len, len(entries))
+        elif op == "add":
+            (result,) = reply
+            if not result["ok"]:
+                raise ValueError(result["error"])
+            self._added_ok += 1
+
+    def run(self, deadline):
+        rng = self._rng
+        last_flush = time.monotonic()
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                conn, refused = connect(self._port)
+            except (ConnectionRefusedError, ConnectionResetError):
+                self._errors["connect"] += 1
+                continue
+            self._connect.append(time.monotonic() - start)
+            self._refused += refused
+
+            for k in range(rng.randint(1, self._args.session_ops)):
+                op = rng.choices(self._ops, self._weights)[0]
+                msg = self._message(op)
+                start = time.monotonic()
+                try:
+                    reply = request(conn, msg)
+                except (EOFError, ConnectionResetError) as e:
+                    if k == 0:
+                        # Accepted, but closed by the server before serving
+                        # anything: the listener should keep the connection
+                        self._dropped += 1
+                    else:
+                        self._errors[f"{op}: {type(e).__name__}"] += 1
+                    break
+                except OSError as e:
+                    self._errors[f"{op}: {type(e).__name__}"] += 1
+                    break
+                self._latencies[op].append(time.monotonic() - start)
+                try:
+                    self._check(op, reply)
+                except Exception as e:
+                    self._errors[f"{op}: {type(e).__name__}"] += 1
+            conn.close()
+
+            if time.monotonic() - last_flush > 1.0:
+                self._flush()
+                last_flush = time.monotonic()
+            time.sleep(rng.expovariate(1 / self._args.think))
+        self._flush()
+
+
+def run_client(index, port, info, keys, mix, args, results, deadline):
+    SoakClient(index, port, info, keys, mix, args, results).run(deadline)
+
+
+class Aggregate:
+    """Results of the clients over an interval, or over the whole run."""
+
+    def __init__(self):
+        self.latency = {op: LatencyHistogram() for op in OPERATIONS}
+        self.connect = LatencyHistogram()
+        self.errors = Counter()
+        self.refused = 0
+        self.dropped = 0
+        self.list_len = 0
+        self.added = 0
+
+    def add(self, result):
+        for op, values in result["latencies"].items():
+            for value in values:
+                self.latency[op].record(value)
+        for value in result["connect"]:
+            self.connect.record(value)
+        self.errors.update(result["errors"])
+        self.refused += result["refused"]
+        self.dropped += result["dropped"]
+        self.list_len = max(self.list_len, result["list_len"])
+        self.added += result["added"]
+
+    @property
+    def requests(self):
+        return sum(h.n for h in self.latency.values())
+
+    def as_dict(self, elapsed):
+        return {
+            "requests": self.requests,
+            "throughput": self.requests / elapsed if elapsed else 0.0,
+            "errors": dict(self.errors),
+            "refused": self.refused,
+            "dropped": self.dropped,
+            "connect": _short(self.connect),
+            "latency": {op: _short(h) for op, h in self.latency.items() if h.n},
+        }
+
+
+def _short(hist):
+    d = hist.as_dict()
+    return {k: d[k] for k in ("n", "p50_ms", "p99_ms", "max_ms")}
+
+
+def slope_per_hour(samples, key, skip):
+    """Least-squares growth rate of a sampled value, per hour."""
+    points = [(s["elapsed_s"], s[key]) for s in samples if s["elapsed_s"] >= skip]
+    if len(points) < 3:
+        return None
+    n = len(points)
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    if sxx == 0:
+        return None
+    return sum((x - mx) * (y - my) for x, y in points) / sxx * 3600
+
+
+class Monitor:
+    """Samples of the server and of the clients, written as JSON lines."""
+
+    def __init__(self, pid, port, library, output, heap_interval):
+        self._pid = pid
+        self._port = port
+        self._library = library
+        self._output = open(output, "w")
+        self._heap_interval = heap_interval
+        self._last_heap = None
+        self.samples = []
+        self.heaps = []
+
+    def _server_info(self):
+        now = time.monotonic()
+        msgs = [{"cmd": "stats"}]
+        if self._heap_interval and (
+            self._last_heap is None or now - self._last_heap >= self._heap_interval
+        ):
+            msgs.append({"cmd": "heap-summary"})
+            self._last_heap = now
+
+        while True:
+            conn, _ = connect(self._port)
+            try:
+                replies = [request(conn, msg) for msg in msgs]
+                break
+            except (EOFError, ConnectionResetError):
+                # Dropped connection, see `SoakClient.run`
+                continue
+            finally:
+                conn.close()
+        return replies[0], replies[1] if len(replies) > 1 else None
+
+    def sample(self, elapsed, interval, agg, total):
+        stats, heap = self._server_info()
+        sample = {
+            "elapsed_s": elapsed,
+            "rss_mb": server_rss_mb(self._pid),
+            "entries": stats["entries"].get(self._library),
+            "list_len": agg.list_len or None,
+            "added": total.added,
+            **agg.as_dict(interval),
+        }
+        if heap is not None:
+            sample["gc_objects"] = heap["gc_objects"]
+            sample["types"] = heap["types"]
+            self.heaps.append((elapsed, heap))
+        self.samples.append(sample)
+        self._output.write(json.dumps(sample) + "\n")
+        self._output.flush()
+        return sample
+
+    def close(self):
+        self._output.close()
+
+
+def print_sample(sample):
+    lat = sample["latency"]
+    worst = max((h["p99_ms"] for h in lat.values()), default=0.0)
+    errors = sum(sample["errors"].values())
+    print(
+        f"{sample['elapsed_s'] / 60:7.1f} min  {sample['throughput']:7.1f} req/s  "
+        + f"p99 {worst:7.1f} ms  connect p99 {sample['connect']['p99_ms']:7.1f} ms  "
+        + f"errors {errors:4d}  RSS {sample['rss_mb']:7.1f} MB  "
+        + f"entries {sample['entries']}",
+        flush=True,
+    )
+
+
+def summary(monitor, total, elapsed, initial_entries, args):
+    """Print the summary of the run, and return the problems found."""
+    problems = []
+    print(f"\n{total.requests} requests in {elapsed / 60:.1f} min", end="")
+    print(f" ({total.requests / elapsed:.1f} req/s)")
+    print(f"  {'':<10} {'n':>9} {'p50':>9} {'p99':>9} {'max':>9}")
+    for name, hist in (("connect", total.connect), *total.latency.items()):
+        if hist.n:
+            print(
+                f"  {name:<10} {hist.n:9d} {hist.percentile(50):7.1f}ms "
+                + f"{hist.percentile(99):7.1f}ms {hist.max:7.1f}ms"
+            )
+    n_errors = sum(total.errors.values())
+    print(f"Errors: {n_errors} ({100 * n_errors / max(total.requests, 1):.3f} %)")
+    for name, count in total.errors.most_common():
+        print(f"  {name}: {count}")
+    print(f"Connections refused while the server was busy: {total.refused}")
+    print(f"Connections dropped by the server before a reply: {total.dropped}")
+
+    samples = monitor.samples
+    rss = [s["rss_mb"] for s in samples]
+    print(f"\nRSS of the server: {rss[0]:.1f} MB -> {rss[-1]:.1f} MB")
+    slope = slope_per_hour(samples, "rss_mb", args.warmup)
+    if slope is not None:
+        print(f"  growth after the warm-up: {slope:+.1f} MB/h")
+        if slope > args.max_rss_growth:
+            problems.append(f"RSS grows by {slope:.1f} MB/h")
+
+    entries = samples[-1]["entries"]
+    expected = initial_entries + total.added
+    print(f"Entries: {initial_entries} -> {entries} ({total.added} references added)")
+    if entries != expected:
+        problems.append(f"{entries} entries, {expected} expected")
+    list_len = max((s["list_len"] or 0) for s in samples)
+    if list_len > expected:
+        problems.append(f"Lists of {list_len} entries for {expected} papers")
+
+    if len(monitor.heaps) > 1:
+        (t0, first), (t1, last) = monitor.heaps[0], monitor.heaps[-1]
+        print(
+            f"Objects tracked by the GC: {first['gc_objects']} -> "
+            + f"{last['gc_objects']} in {(t1 - t0) / 60:.1f} min"
+        )
+        growth = Counter(last["types"])
+        growth.subtract(first["types"])
+        for name, count in growth.most_common(5):
+            if count > 0:
+                print(f"  {name}: +{count}")
+
+    for problem in problems:
+        print(f"PROBLEM: {problem}")
+    return problems
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("--size", type=int, default=10000, help="Papers of the library")
+    pars.add_argument("--clients", type=int, default=8)
+    pars.add_argument("--duration", type=parse_duration, default="10m")
+    pars.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    pars.add_argument(
+        "--session-ops", type=int, default=5, help="Maximum requests per connection"
+    )
+    pars.add_argument(
+        "--think", type=float, default=0.2, help="Mean pause between connections (s)"
+    )
+    pars.add_argument("--interval", type=parse_duration, default="60s")
+    pars.add_argument(
+        "--heap-interval",
+        type=parse_duration,
+        default="10m",
+        help="Time between two heap summaries of the server (0 disables them)",
+    )
+    pars.add_argument(
+        "--warmup", type=parse_duration, default="5m", help="Ignored for the growth"
+    )
+    pars.add_argument(
+        "--max-rss-growth", type=float, default=20.0, help="Allowed MB per hour"
+    )
+    pars.add_argument("--seed", type=int, default=0)
+    pars.add_argument(
+        "--workdir",
+        type=str,
+        default=os.path.join(tempfile.gettempdir(), "wofi-pubs-bench"),
+    )
+    pars.add_argument("--output", type=str, default=None, help="Samples (JSON lines)")
+    pars.add_argument("--serve", type=str, default=None, help=argparse.SUPPRESS)
+    args = pars.parse_args()
+
+    if args.serve:
+        root, port = args.serve.split(os.pathsep)
+        run_server(root, args.size, args.seed, int(port))
+        return
+
+    root = os.path.join(args.workdir, f"soak-n{args.size}")
+    start = time.perf_counter()
+    info = make_library(root, args.size, args.seed, regenerate=True)
+    print(f"Library of {args.size} papers ready ({time.perf_counter() - start:.1f} s)")
+
+    port = free_port()
+    log_file = os.path.join(root, "server.log")
+    output = args.output or os.path.join(root, "soak.jsonl")
+    with open(log_file, "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, __file__, "--size", str(args.size)]
+            + ["--seed", str(args.seed), "--serve", os.pathsep.join((root, str(port)))],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    try:
+        conn = wait_for_server(server, port)
+        _, keys = request(
+            conn,
+            {"cmd": "get-publication-list", "library": info["library"], "tag": None},
+        )
+        conn.close()
+        print(f"Server started (pid {server.pid}, log in {log_file})")
+        problems = soak(server, port, info, list(keys), output, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"Samples written to {output}")
+    sys.exit(1 if problems else 0)
+
+
+def wait_for_server(server, port):
+    """Connection to the server once it has loaded the library."""
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with status {server.returncode}")
+        try:
+            return Client(("localhost", port))
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+
+
+def soak(server, port, info, keys, output, args):
+    results = multiprocessing.Queue()
+    start = time.monotonic()
+    deadline = start + args.duration
+    clients = [
+        multiprocessing.Process(
+            target=run_client,
+            args=(k, port, info, keys, args.mix, args, results, deadline),
+            daemon=True,
+        )
+        for k in range(args.clients)
+    ]
+    for client in clients:
+        client.start()
+
+    monitor = Monitor(server.pid, port, info["library"], output, args.heap_interval)
+    total = Aggregate()
+    agg = Aggregate()
+    last = start
+    while any(c.is_alive() for c in clients) or not results.empty():
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with status {server.returncode}")
+        try:
+            result = results.get(timeout=0.5)
+            agg.add(result)
+            total.add(result)
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        if now - last >= args.interval:
+            print_sample(monitor.sample(now - start, now - last, agg, total))
+            agg = Aggregate()
+            last = now
+
+    now = time.monotonic()
+    print_sample(monitor.sample(now - start, now - last, agg, total))
+    monitor.close()
+    for client in clients:
+        client.join()
+
+    return summary(monitor, total, now - start, len(keys), args)
+
+
+if __name__ == "__main__":
+    main()
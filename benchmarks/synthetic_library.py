@@ -0,0 +1,301 @@
+"""Generation of synthetic pubs libraries used by the benchmarks.
+
+The papers follow distributions close to the ones of real libraries: a few
+prolific authors appear in many papers, most papers have one to four
+authors (and some large collaborations dozens), recent years are more
+frequent, a handful of tags are used much more than the rest, and most
+papers have a document. The generation is deterministic for a given seed.
+
+The library is written in the format of pubs (``bib``, ``meta``, ``doc``
+and ``notes`` directories), together with its pubs configuration file and a
+wofi-pubs configuration file pointing to it::
+
+    <root>/config            wofi-pubs configuration
+    <root>/configs/synthetic.conf
+    <root>/library/          pubs directory
+    <root>/state/            state_dir of the server
+
+Usage::
+
+    python benchmarks/synthetic_library.py /tmp/library -n 10000 [--seed 0]
+
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+from itertools import accumulate
+from pathlib import Path
+
+from sample_pdf import make_pdf
+
+SYLLABLES = (
+    "ka ri mo lan ste ber ger son ni ta vo lu ch en sch mi da ko wa ra na "
+    + "pe li ha to se bo du ze fi mar tin ro sa el ve an to go"
+).split()
+TAGS = (
+    "to-read thesis review important method experiment simulation theory "
+    + "dataset survey benchmark teaching project-a project-b project-c "
+    + "timber concrete steel fatigue fracture dynamics optimization bayesian "
+    + "machine-learning numerics fem meshing contact plasticity damage "
+    + "homogenization multiscale uncertainty sensors monitoring code "
+    + "archived printed annotated"
+).split()
+ENTRY_TYPES = (
+    ("article", 65),
+    ("inproceedings", 20),
+    ("book", 5),
+    ("techreport", 5),
+    ("misc", 5),
+)
+N_AUTHORS = (
+    (1, 15),
+    (2, 25),
+    (3, 22),
+    (4, 14),
+    (5, 9),
+    (6, 6),
+    (7, 4),
+    (8, 2),
+    (9, 2),
+    (10, 1),
+)
+N_TAGS = ((0, 35), (1, 35), (2, 18), (3, 8), (4, 4))
+# Fraction of the papers with a document, and of large collaborations
+DOC_RATIO = 0.7
+COLLABORATION_RATIO = 0.02
+
+
+def _zipf_weights(n, s=1.1):
+    return list(accumulate(1 / (k + 1) ** s for k in range(n)))
+
+
+def _word(rng, n_min=2, n_max=4):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(n_min, n_max)))
+
+
+class PaperFactory:
+    """Random bibliographic data of papers.
+
+    Parameters
+    ----------
+    n : int
+        Number of papers of the library, used to size the pools of authors
+        and words.
+    seed : int
+
+    """
+
+    def __init__(self, n, seed=0):
+        self._rng = random.Random(seed)
+        rng = self._rng
+        # Ordered without duplicates, so that the library only depends on the seed
+        self._surnames = list(
+            dict.fromkeys(_word(rng).capitalize() for _ in range(max(200, n // 5)))
+        )
+        self._surnames_w = _zipf_weights(len(self._surnames))
+        self._vocabulary = list(dict.fromkeys(_word(rng, 1, 3) for _ in range(3000)))
+        self._vocabulary_w = _zipf_weights(len(self._vocabulary), 1.0)
+        self._tags_w = _zipf_weights(len(TAGS))
+        self._journals = [
+            "Journal of " + " ".join(_word(rng).capitalize() for _ in range(2))
+            for _ in range(60)
+        ]
+        self._keys: set[str] = set()
+
+    def _choose(self, pairs):
+        values, weights = zip(*pairs)
+        return self._rng.choices(values, weights)[0]
+
+    def _author(self):
+        rng = self._rng
+        surname = rng.choices(self._surnames, cum_weights=self._surnames_w)[0]
+        initials = " ".join(f"{rng.choice('ABCDEFGHIJKLMNOPRSTW')}." for _ in "ab")
+        return f"{surname}, {initials[: rng.choice((2, 5))]}"
+
+    def _citekey(self, author, year, title):
+        base = author.split(",")[0].lower() + str(year) + title.split()[0].lower()
+        key = base
+        suffix = 0
+        while key in self._keys:
+            key = base + chr(ord("a") + suffix % 26) * (1 + suffix // 26)
+            suffix += 1
+        self._keys.add(key)
+        return key
+
+    def paper(self):
+        """Random paper.
+
+        Returns
+        -------
+        citekey : str
+        bibdata : dict
+            Fields of the BibTeX entry, with the authors as a list.
+        tags : list[str]
+        has_doc : bool
+
+        """
+        rng = self._rng
+        if rng.random() < COLLABORATION_RATIO:
+            n_authors = rng.randint(20, 60)
+        else:
+            n_authors = self._choose(N_AUTHORS)
+        authors = [self._author() for _ in range(n_authors)]
+        year = 1960 + int(rng.betavariate(5, 1.5) * 65)
+        words = rng.choices(
+            self._vocabulary, cum_weights=self._vocabulary_w, k=rng.randint(4, 16)
+        )
+        title = " ".join(words).capitalize()
+        entry_type = self._choose(ENTRY_TYPES)
+
+        bibdata = {"ENTRYTYPE": entry_type, "author": authors, "title": title}
+        bibdata["year"] = str(year)
+        if entry_type == "article":
+            bibdata["journal"] = rng.choice(self._journals)
+            bibdata["volume"] = str(rng.randint(1, 120))
+            first = rng.randint(1, 900)
+            bibdata["pages"] = f"{first}--{first + rng.randint(4, 30)}"
+        elif entry_type == "inproceedings":
+            bibdata["booktitle"] = "Proceedings of the " + rng.choice(self._journals)
+        elif entry_type == "book":
+            bibdata["publisher"] = _word(rng).capitalize() + " Press"
+        elif entry_type == "techreport":
+            bibdata["institution"] = "University of " + _word(rng).capitalize()
+        if entry_type != "misc":
+            bibdata["doi"] = f"10.5555/{rng.randint(10**6, 10**7)}"
+
+        citekey = self._citekey(authors[0], year, title)
+        n_tags = self._choose(N_TAGS)
+        tags = sorted(set(rng.choices(TAGS, cum_weights=self._tags_w, k=n_tags)))
+
+        return citekey, bibdata, tags, rng.random() < DOC_RATIO
+
+
+def format_bibtex(citekey, bibdata):
+    """BibTeX entry of a paper, as stored by pubs."""
+    lines = [f"@{bibdata['ENTRYTYPE']}{{{citekey},"]
+    for field, value in sorted(bibdata.items()):
+        if field == "ENTRYTYPE":
+            continue
+        if isinstance(value, list):
+            value = " and ".join(value)
+        lines.append(f"  {field} = {{{value}}},")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def write_paper(pubsdir, citekey, bibdata, tags, doc_template=None, added=None):
+    """Write the bib and meta files of a paper (and its document).
+
+    The documents are hard links to `doc_template`, so that large libraries
+    do not take much disk space.
+
+    """
+    pubsdir = Path(pubsdir)
+    (pubsdir / "bib" / f"{citekey}.bib").write_text(format_bibtex(citekey, bibdata))
+    docfile = None
+    if doc_template is not None:
+        doc = pubsdir / "doc" / f"{citekey}.pdf"
+        if not doc.exists():
+            os.link(doc_template, doc)
+        docfile = f"docsdir://{citekey}.pdf"
+    meta = {
+        "added": added or "2024-01-01 12:00:00",
+        "docfile": docfile,
+        "notes": [],
+        "tags": tags,
+    }
+    # JSON is valid YAML
+    (pubsdir / "meta" / f"{citekey}.yaml").write_text(json.dumps(meta) + "\n")
+
+
+def make_library(root, n, seed=0, regenerate=False):
+    """Generate a synthetic library, or reuse it if it already exists.
+
+    Parameters
+    ----------
+    root : str
+        Output directory.
+    n : int
+        Number of papers.
+    seed : int
+    regenerate : bool
+        Write the library even if it exists.
+
+    Returns
+    -------
+    dict :
+        Paths of the wofi-pubs configuration (``config``), of the pubs
+        configuration (``library``), of the pubs directory (``pubsdir``) and
+        of the state directory (``state_dir``), and the number of papers per
+        tag (``tags``).
+
+    """
+    root = Path(root).absolute()
+    pubsdir = root / "library"
+    info = {
+        "config": str(root / "config"),
+        "library": str(root / "configs" / "synthetic.conf"),
+        "pubsdir": str(pubsdir),
+        "state_dir": str(root / "state"),
+    }
+    summary_file = root / "summary.json"
+    if summary_file.exists() and not regenerate:
+        summary = json.loads(summary_file.read_text())
+        if summary["n"] == n and summary["seed"] == seed:
+            return {**info, "tags": summary["tags"]}
+
+    if pubsdir.exists():
+        shutil.rmtree(pubsdir)
+    for sub in ("bib", "meta", "doc", "notes"):
+        (pubsdir / sub).mkdir(parents=True, exist_ok=True)
+    (root / "configs").mkdir(exist_ok=True)
+    (root / "state").mkdir(exist_ok=True)
+
+    template = root / "template.pdf"
+    make_pdf(template, pages=2)
+
+    factory = PaperFactory(n, seed)
+    tags = dict()
+    for _ in range(n):
+        citekey, bibdata, paper_tags, has_doc = factory.paper()
+        write_paper(
+            pubsdir, citekey, bibdata, paper_tags, template if has_doc else None
+        )
+        for tag in paper_tags:
+            tags[tag] = tags.get(tag, 0) + 1
+
+    Path(info["library"]).write_text(
+        f"[main]\npubsdir = {pubsdir}\ndocsdir = {pubsdir / 'doc'}\n"
+        + "doc_add = link\n\n[plugins]\nactive = ,\n"
+    )
+    Path(info["config"]).write_text(
+        f"configs_dir={root / 'configs'}\n"
+        + f"default_lib={info['library']}\n"
+        + f"state_dir={info['state_dir']}\n"
+        + "pdfviewer=true\neditor=true\n"
+    )
+    summary_file.write_text(json.dumps({"n": n, "seed": seed, "tags": tags}))
+
+    return {**info, "tags": tags}
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("root", type=str, help="Output directory")
+    pars.add_argument("-n", type=int, default=10000, help="Number of papers")
+    pars.add_argument("--seed", type=int, default=0)
+    pars.add_argument("--regenerate", action="store_true")
+    args = pars.parse_args()
+
+    info = make_library(args.root, args.n, args.seed, args.regenerate)
+    print(f"{args.n} papers in {info['pubsdir']}")
+    print(f"wofi-pubs configuration: {info['config']}")
+    top = sorted(info["tags"].items(), key=lambda kv: kv[1], reverse=True)[:5]
+    print("Most used tags: " + ", ".join(f"{t} ({n})" for t, n in top))
+
+
+if __name__ == "__main__":
+    main()
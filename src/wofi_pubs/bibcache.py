@@ -0,0 +1,103 @@
+import os
+from os.path import expanduser
+
+from pubs.endecoder import EnDecoder
+
+from .state import load_state, save_state
+
+
+class BibTexCache:
+    """Encoded BibTeX of the papers of the libraries.
+
+    Encoding a paper with `EnDecoder` is much slower than reading the
+    result from memory, so the BibTeX text of each paper is kept, together
+    with the modification time of the bib file it was encoded from. A paper is
+    only encoded again when its bib file changed.
+
+    Parameters
+    ----------
+    record_file : str
+        JSON file where the cache is persisted between restarts of the
+        server. Nothing is persisted if None.
+    ignore_fields : list[str]
+        Fields left out of the BibTeX entries.
+
+    """
+
+    def __init__(self, record_file=None, ignore_fields=("file",)):
+        self._record_file = record_file
+        self._ignore_fields = list(ignore_fields)
+        self._entries: dict[str, dict[str, tuple[float, str]]] = dict()
+        if record_file is not None:
+            self._entries = load_state(record_file)
+        self._changed = False
+        self._encoder = EnDecoder()
+        # Lookups answered from the cache, and papers encoded
+        self.hits = 0
+        self.misses = 0
+
+    def save(self):
+        """Persist the cache, if it changed since it was last saved."""
+        if self._record_file is not None and self._changed:
+            save_state(self._record_file, self._entries)
+            self._changed = False
+
+    @staticmethod
+    def _bibfile(repo, citekey):
+        pubsdir = expanduser(repo.conf["main"]["pubsdir"])
+        return os.path.join(pubsdir, "bib", citekey + ".bib")
+
+    def entry(self, repo, citekey: str):
+        """Get the BibTeX text of a paper.
+
+        Parameters
+        ----------
+        repo : :obj:`Repository`
+        citekey : str
+            Citekey of the paper.
+
+        Returns
+        -------
+        str
+
+        """
+        entries = self._entries.setdefault(repo.conf["main"]["pubsdir"], {})
+        try:
+            mtime = os.stat(self._bibfile(repo, citekey)).st_mtime
+        except OSError:
+            mtime = None
+
+        cached = entries.get(citekey)
+        if cached is not None and mtime is not None and cached[0] == mtime:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        bib = repo.databroker.pull_bibentry(citekey)
+        text = self._encoder.encode_bibdata(bib, ignore_fields=self._ignore_fields)
+        if mtime is not None:
+            entries[citekey] = (mtime, text)
+            self._changed = True
+
+        return text
+
+    def document(self, repo, citekeys: list[str]):
+        """Build a BibTeX document with the given papers.
+
+        Parameters
+        ----------
+        repo : :obj:`Repository`
+        citekeys : list[str]
+            Citekeys of the papers.
+
+        Returns
+        -------
+        str
+
+        """
+        return "\n".join(self.entry(repo, key).strip() + "\n" for key in citekeys)
+
+    def discard(self, repo, citekey: str):
+        """Forget the cached text of a paper."""
+        if self._entries.get(repo.conf["main"]["pubsdir"], {}).pop(citekey, None):
+            self._changed = True
@@ -0,0 +1,89 @@
+import os
+import re
+
+# \citation{a,b} is written by BibTeX styles, \abx@aux@cite{...}{a} by biblatex
+_CITATION_RE = re.compile(
+    r"\\(?:citation|abx@aux@cite(?:\{[^}]*\})?)\{([^}]*)\}", re.MULTILINE
+)
+_INPUT_RE = re.compile(r"\\@input\{([^}]*)\}")
+
+
+def read_citations(aux_path: str):
+    """Read the citekeys cited in a LaTeX project.
+
+    The auxiliary files of the chapters included with ``\\include`` are
+    followed, and skipped if they do not exist yet.
+
+    Parameters
+    ----------
+    aux_path : str
+        Path to the main ``.aux`` file.
+
+    Returns
+    -------
+    list[str] :
+        Citekeys in order of first citation, without duplicates.
+
+    Raises
+    ------
+    OSError
+        If the main ``.aux`` file cannot be read.
+
+    """
+    keys = dict()
+    pending = [aux_path]
+    seen = set()
+    while pending:
+        path = pending.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            with open(path, "r", encoding="UTF-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            if path == aux_path:
+                raise
+            continue
+
+        for m in _CITATION_RE.finditer(text):
+            for key in m.group(1).split(","):
+                key = key.strip()
+                # \nocite{*} cites the whole database
+                if key and key != "*":
+                    keys[key] = None
+        base = os.path.dirname(aux_path)
+        pending += [os.path.join(base, m.group(1)) for m in _INPUT_RE.finditer(text)]
+
+    return list(keys)
+
+
+def resolve_citations(citekeys: list[str], key_sets: dict[str, set[str]]):
+    """Find the library of each citekey.
+
+    Parameters
+    ----------
+    citekeys : list[str]
+        Cited keys.
+    key_sets : dict[str, set[str]]
+        Citekeys of each library, in order of preference.
+
+    Returns
+    -------
+    resolved : dict[str, list[str]]
+        Cited keys found in each library.
+    unresolved : list[str]
+        Cited keys not found in any library.
+
+    """
+    resolved = {library: [] for library in key_sets}
+    unresolved = []
+    for key in citekeys:
+        for library, keys in key_sets.items():
+            if key in keys:
+                resolved[library].append(key)
+                break
+        else:
+            unresolved.append(key)
+
+    return resolved, unresolved
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Write the bib file of a LaTeX project from the wofi-pubs libraries.
+
+The citations are read from the ``.aux`` file, and the cited references are
+taken from the libraries loaded by the running server. With ``--watch`` the
+bib file is updated every time the ``.aux`` file changes, e.g. next to
+``latexmk -pvc``. The bib file is only rewritten when its content changes.
+
+Examples::
+
+    wofi-pubs-cite build/thesis.aux -o thesis.bib
+    wofi-pubs-cite build/thesis.aux -o thesis.bib --watch
+
+"""
+
+import argparse
+import os
+import time
+
+from wofi_pubs.ctl import request
+
+ADDRESS = ("localhost", 6000)
+
+
+def export(aux, output, library):
+    # A connection per export, the server serves one client at a time
+    report = request(
+        ADDRESS,
+        {"cmd": "export-citations", "aux": aux, "output": output, "library": library},
+    )
+    if "error" in report:
+        print(f"Error: {report['error']}")
+        return
+
+    status = "updated" if report["changed"] else "unchanged"
+    print(f"{report['output']}: {report['written']} references ({status})")
+    if report["unresolved"]:
+        print("Unresolved: " + ", ".join(report["unresolved"]))
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("aux", type=str, help="Path to the .aux file")
+    pars.add_argument("-o", "--output", type=str, default=None, help="Bib file")
+    pars.add_argument(
+        "-l", "--library", type=str, default=None, help="Only use this library"
+    )
+    pars.add_argument("--watch", action="store_true", help="Follow the changes")
+    pars.add_argument(
+        "--interval", type=float, default=0.5, help="Seconds between checks"
+    )
+    args = pars.parse_args()
+
+    aux = os.path.abspath(args.aux)
+    output = os.path.abspath(args.output or os.path.splitext(aux)[0] + ".bib")
+    library = os.path.abspath(args.library) if args.library else None
+
+    try:
+        export(aux, output, library)
+        if not args.watch:
+            return
+
+        mtime = os.stat(aux).st_mtime
+        while True:
+            time.sleep(args.interval)
+            try:
+                new_mtime = os.stat(aux).st_mtime
+            except FileNotFoundError:
+                # latexmk removes the file while cleaning up
+                continue
+            if new_mtime != mtime:
+                mtime = new_mtime
+                try:
+                    export(aux, output, library)
+                except (OSError, EOFError) as e:
+                    # The server may be restarting, try again at the next change
+                    print(f"Error: {e}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
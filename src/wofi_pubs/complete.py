@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Complete citekeys from a running wofi-pubs server, for editors.
+
+The bridge reads one request per line on its standard input and writes one
+JSON line with the results on its standard output. Each request uses a
+connection of its own to the listener of the server dedicated to the
+completion, so that the editor and the menus never wait for each other. A request is either a JSON object or plain text,
+which is used as the query::
+
+    {"query": "doe 2020", "library": "/path/to/lib.conf", "limit": 10}
+    doe 2020
+
+Each result is an object with the ``citekey``, a short ``label`` and the
+``library`` of the paper. The editor can report the citekey finally inserted
+with ``{"used": "citekey"}``, which improves the ranking of later results.
+
+"""
+
+import json
+import sys
+
+from wofi_pubs.ctl import request as server_request
+
+ADDRESS = ("localhost", 6001)
+
+
+def handle(request: dict):
+    """Send a request of the editor to the server.
+
+    Returns
+    -------
+    list[dict] :
+        The completions, or None for a ``used`` report.
+
+    """
+    if "used" in request:
+        server_request(
+            ADDRESS, {"cmd": "complete-used", "citekey": request["used"]}, reply=False
+        )
+        return None
+
+    matches = server_request(
+        ADDRESS,
+        {
+            "cmd": "complete",
+            "query": request.get("query", ""),
+            "library": request.get("library"),
+            "limit": request.get("limit", 20),
+        },
+    )
+    return [
+        {"citekey": key, "label": label, "library": library}
+        for key, label, library in matches
+    ]
+
+
+def main():
+    try:
+        for line in sys.stdin:
+            line = line.strip()
+            if line.startswith("{"):
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    print(json.dumps({"error": str(e)}), flush=True)
+                    continue
+            else:
+                request = {"query": line}
+
+            try:
+                results = handle(request)
+            except (OSError, EOFError) as e:
+                # The server is not running, or stopped. The editor does not
+                # wait for a reply to the used citekeys.
+                results = None if "used" in request else {"error": str(e)}
+            if results is not None:
+                print(json.dumps(results), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
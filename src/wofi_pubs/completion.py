@@ -0,0 +1,250 @@
+import re
+import time
+from bisect import bisect_left
+
+from .state import load_state, save_state
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _last_name(name: str):
+    name = name.strip("{} ")
+    if "," in name:
+        return name.split(",")[0].strip("{} ")
+    return name.split()[-1].strip("{}") if name else ""
+
+
+def paper_label(bibdata: dict, width: int = 60):
+    """Short description of a paper, shown next to the citekey.
+
+    Parameters
+    ----------
+    bibdata : dict
+        Bibliographic data of the paper.
+    width : int
+        Maximum length of the title.
+
+    Returns
+    -------
+    str :
+        Text like ``Doe et al. (2020) Title of the paper``.
+
+    """
+    authors = bibdata.get("author") or bibdata.get("editor") or []
+    if authors:
+        author = _last_name(authors[0]) + (" et al." if len(authors) > 1 else "")
+    else:
+        author = bibdata.get("key") or bibdata.get("organization") or "N.N."
+
+    title = re.sub(r"[{}]", "", bibdata.get("title", ""))
+    if len(title) > width:
+        title = title[: width - 1].rstrip() + "…"
+
+    return f"{author} ({bibdata.get('year', 'n.d.')}) {title}"
+
+
+def paper_tokens(citekey: str, bibdata: dict):
+    """Words under which a paper can be found.
+
+    Returns
+    -------
+    set[str] :
+        Lowercase citekey, year, last names of the authors and words of the
+        title.
+
+    """
+    tokens = {citekey.lower(), str(bibdata.get("year", ""))} - {""}
+    for name in bibdata.get("author", []) + bibdata.get("editor", []):
+        tokens.update(w.lower() for w in _WORD_RE.findall(_last_name(name)))
+    title = re.sub(r"[{}]", "", bibdata.get("title", ""))
+    tokens.update(w.lower() for w in _WORD_RE.findall(title) if len(w) > 1)
+
+    return tokens
+
+
+class Frecency:
+    """Score of the papers combining frequency and recency of use.
+
+    Every use adds one to the score of a paper, and the score decays
+    exponentially with time.
+
+    Parameters
+    ----------
+    record_file : str
+        JSON file where the scores are persisted.
+    half_life : float
+        Time in seconds after which a use counts half.
+
+    """
+
+    def __init__(self, record_file, half_life=14 * 24 * 3600.0):
+        self._record_file = record_file
+        self._half_life = half_life
+        self._scores: dict[str, list[float]] = load_state(record_file)
+
+    def _decayed(self, score, last, now):
+        return score * 0.5 ** ((now - last) / self._half_life)
+
+    def score(self, citekey: str, now: float | None = None):
+        rec = self._scores.get(citekey)
+        if rec is None:
+            return 0.0
+        return self._decayed(*rec, time.time() if now is None else now)
+
+    def keys(self):
+        """Citekeys of the papers that were used."""
+        return self._scores.keys()
+
+    def used(self, citekey: str):
+        """Record a use of a paper."""
+        now = time.time()
+        self._scores[citekey] = [self.score(citekey, now) + 1.0, now]
+        save_state(self._record_file, self._scores)
+
+
+class CompletionIndex:
+    """Prefix index over the papers of the libraries.
+
+    For each library, the tokens of the papers (see :func:`paper_tokens`) are
+    kept in a sorted array, where the tokens starting with a prefix are found
+    by bisection. The papers with a frecency score come first, the rest in
+    alphabetical order of the matched token, so a query only scans the index
+    until enough results were found.
+
+    Parameters
+    ----------
+    frecency : :obj:`Frecency`
+        Scores used to rank the results.
+
+    """
+
+    def __init__(self, frecency):
+        self._frecency = frecency
+        self._tokens: dict[str, list[str]] = dict()
+        self._keys: dict[str, list[str]] = dict()
+        # Label and tokens of each paper
+        self._papers: dict[str, dict[str, tuple[str, frozenset]]] = dict()
+
+    def build(self, library: str, papers):
+        """Index all the papers of a library.
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+        papers : iterable[:obj:`Paper`]
+
+        """
+        info = dict()
+        tokens = []
+        keys = []
+        for paper in papers:
+            paper_toks = frozenset(paper_tokens(paper.citekey, paper.bibdata))
+            info[paper.citekey] = (paper_label(paper.bibdata), paper_toks)
+            tokens += paper_toks
+            keys += [paper.citekey] * len(paper_toks)
+        order = sorted(range(len(tokens)), key=tokens.__getitem__)
+
+        self._tokens[library] = [tokens[k] for k in order]
+        self._keys[library] = [keys[k] for k in order]
+        self._papers[library] = info
+
+    def add(self, library: str, paper):
+        """Index a new or modified paper."""
+        self.remove(library, paper.citekey)
+        tokens = self._tokens.setdefault(library, [])
+        keys = self._keys.setdefault(library, [])
+        paper_toks = frozenset(paper_tokens(paper.citekey, paper.bibdata))
+        for token in paper_toks:
+            pos = bisect_left(tokens, token)
+            tokens.insert(pos, token)
+            keys.insert(pos, paper.citekey)
+        self._papers.setdefault(library, {})[paper.citekey] = (
+            paper_label(paper.bibdata),
+            paper_toks,
+        )
+
+    def remove(self, library: str, citekey: str):
+        """Remove a paper from the index."""
+        info = self._papers.get(library, {}).pop(citekey, None)
+        if info is None:
+            return
+        tokens = self._tokens[library]
+        keys = self._keys[library]
+        for token in info[1]:
+            pos = bisect_left(tokens, token)
+            while keys[pos] != citekey:
+                pos += 1
+            del tokens[pos]
+            del keys[pos]
+
+    @staticmethod
+    def _match(paper_toks, words):
+        return all(any(t.startswith(w) for t in paper_toks) for w in words)
+
+    def _scan(self, library, words, exclude, limit):
+        """Papers matching the words, in order of the tokens of the index."""
+        tokens = self._tokens[library]
+        keys = self._keys[library]
+        papers = self._papers[library]
+        prefix = words[0]
+        found = []
+        seen = set(exclude)
+        k = bisect_left(tokens, prefix)
+        while k < len(tokens) and len(found) < limit:
+            if not tokens[k].startswith(prefix):
+                break
+            key = keys[k]
+            if key not in seen:
+                seen.add(key)
+                if self._match(papers[key][1], words[1:]):
+                    found.append(key)
+            k += 1
+
+        return found
+
+    def complete(self, query: str, libraries: list[str], limit: int = 20):
+        """Find the papers matching a query.
+
+        Every word of the query must be the prefix of the citekey, the year,
+        the last name of an author or a word of the title.
+
+        Parameters
+        ----------
+        query : str
+            Words typed by the user.
+        libraries : list[str]
+            Libraries where to look for the papers.
+        limit : int
+            Maximum number of results.
+
+        Returns
+        -------
+        list[tuple] :
+            Tuples ``(citekey, label, library)``, the most used papers first.
+
+        """
+        # The longest word is the most selective one
+        words = sorted(
+            (w.lower() for w in _WORD_RE.findall(query)), key=len, reverse=True
+        ) or [""]
+        libraries = [lib for lib in libraries if lib in self._papers]
+        now = time.time()
+
+        scored = []
+        for library in libraries:
+            papers = self._papers[library]
+            for key in self._frecency.keys():
+                if key in papers and self._match(papers[key][1], words):
+                    scored.append((self._frecency.score(key, now), key, library))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        results = [(key, lib) for _, key, lib in scored[:limit]]
+
+        for library in libraries:
+            if len(results) >= limit:
+                break
+            exclude = {key for key, lib in results if lib == library}
+            found = self._scan(library, words, exclude, limit - len(results))
+            results += [(key, library) for key in found]
+
+        return [(key, self._papers[lib][key][0], lib) for key, lib in results]
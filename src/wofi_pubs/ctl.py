@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Send a single command to a running wofi-pubs server.
+
+Examples::
+
+    wofi-pubs-ctl mirror-tag-to-device library=$HOME/.config/pubs/main.conf \\
+        tag=to-read addr=192.168.1.101 remove=true
+    wofi-pubs-ctl --reply get-tags library=$HOME/.config/pubs/main.conf
+
+"""
+
+import argparse
+import json
+import time
+from multiprocessing.connection import Client
+from pprint import pprint
+
+ADDRESS = ("localhost", 6000)
+# Seconds to wait for the server to start listening
+CONNECT_TIMEOUT = 5.0
+# Arguments that are names, even if they look like numbers (e.g. tag=2024)
+TEXT_ARGS = {"tag", "library", "citekey", "folder", "addr"}
+
+
+def parse_value(key: str, value: str):
+    """Interpret the value of an argument as JSON, or as a plain string."""
+    if key in TEXT_ARGS:
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def request(address, msg: dict, reply: bool = True):
+    """Send a command to the server on a connection of its own.
+
+    The server serves one client at a time, until it disconnects, so the
+    tools that stay open (editor bridge, ``--watch``) connect for each
+    request instead of holding the connection.
+
+    Parameters
+    ----------
+    address : tuple
+        Address of the server.
+    msg : dict
+        Command and its arguments.
+    reply : bool
+        Wait for the reply of the server.
+
+    Returns
+    -------
+    The reply of the server, or None.
+
+    """
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            conn = Client(address)
+            break
+        except ConnectionRefusedError:
+            # The server is starting up or restarting
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+    try:
+        conn.send(msg)
+        return conn.recv() if reply else None
+    finally:
+        conn.close()
+
+
+def main():
+    pars = argparse.ArgumentParser(
+        description="Send a command to the wofi-pubs server",
+        epilog="Arguments are given as key=value. Values are parsed as JSON "
+        + 'when possible (e.g. true, 3, ["a", "b"]), except for the names '
+        + f"({', '.join(sorted(TEXT_ARGS))}).",
+    )
+    pars.add_argument("cmd", type=str, help="Name of the command")
+    pars.add_argument("args", nargs="*", help="Arguments of the command")
+    pars.add_argument(
+        "--reply", action="store_true", help="Wait for the reply of the server"
+    )
+
+    arguments = pars.parse_args()
+
+    msg = {"cmd": arguments.cmd}
+    for arg in arguments.args:
+        key, sep, value = arg.partition("=")
+        if not sep:
+            pars.error(f"Invalid argument '{arg}', expected key=value")
+        msg[key] = parse_value(key, value)
+
+    result = request(ADDRESS, msg, arguments.reply)
+    if arguments.reply:
+        pprint(result)
+
+
+if __name__ == "__main__":
+    main()
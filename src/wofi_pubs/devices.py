@@ -0,0 +1,134 @@
+import json
+import os
+import socket
+import threading
+
+from .print_to_dpt import get_dptrp1_addr
+
+# Port of the REST API of the DPT-RP1
+DPT_PORT = 8443
+
+
+class DeviceRegistry:
+    """Registry of the known DPT-RP1 devices.
+
+    The devices listed in ``devices.json`` (reloaded whenever the file
+    changes) are merged with the address found through mDNS. The name
+    resolution and the reachability checks run in a background thread, so
+    that querying the registry never waits on the network.
+
+    Parameters
+    ----------
+    devices_file : str
+        JSON file mapping device names to addresses.
+    hostname : str
+        mDNS host name of the device.
+    ttl : float
+        Seconds after which the mDNS address and the reachability of the
+        devices are checked again.
+    timeout : float
+        Timeout in seconds of the name resolution and the reachability checks.
+
+    """
+
+    def __init__(
+        self, devices_file, hostname="digitalpaper.local", ttl=60.0, timeout=2.0
+    ):
+        self._devices_file = devices_file
+        self._hostname = hostname
+        self._ttl = ttl
+        self._timeout = timeout
+        self._configured: dict[str, str] = dict()
+        self._mtime = None
+        self._mdns_addr: str | None = None
+        self._reachable: dict[str, bool] = dict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def start(self):
+        """Start the background resolution of the devices."""
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def refresh(self):
+        """Check the devices again as soon as possible."""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._reload()
+            addr = get_dptrp1_addr(self._hostname, timeout=self._timeout)
+            with self._lock:
+                self._mdns_addr = addr
+            for addr in set(self.devices().values()):
+                reachable = self._probe(addr)
+                with self._lock:
+                    self._reachable[addr] = reachable
+            self._wakeup.wait(self._ttl)
+            self._wakeup.clear()
+
+    def _probe(self, addr):
+        try:
+            with socket.create_connection((addr, DPT_PORT), timeout=self._timeout):
+                return True
+        except OSError:
+            return False
+
+    def _reload(self):
+        """Read the configured devices if the file changed."""
+        try:
+            mtime = os.stat(self._devices_file).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+
+        devices = dict()
+        if mtime is not None:
+            try:
+                with open(self._devices_file, "r") as dev:
+                    devices = json.load(dev)
+            except (OSError, ValueError) as e:
+                print(f"Unable to read {self._devices_file}: {e}")
+
+        with self._lock:
+            self._configured = devices
+            self._mtime = mtime
+
+    def devices(self):
+        """Get the known devices.
+
+        Returns
+        -------
+        dict :
+            Maps the name of each device to its address.
+
+        """
+        self._reload()
+        with self._lock:
+            devices = dict(self._configured)
+            if self._mdns_addr is not None and self._mdns_addr not in devices.values():
+                devices[self._hostname] = self._mdns_addr
+
+        return devices
+
+    def status(self):
+        """Get the known devices and whether they were reachable.
+
+        Returns
+        -------
+        list[tuple] :
+            Tuples ``(name, addr, reachable)``. `reachable` is None if the
+            device was not checked yet.
+
+        """
+        devices = self.devices()
+        with self._lock:
+            return [
+                (name, addr, self._reachable.get(addr))
+                for name, addr in devices.items()
+            ]
+
+    def is_reachable(self, addr):
+        """Whether the device was reachable in the last check."""
+        with self._lock:
+            return self._reachable.get(addr)
@@ -0,0 +1,103 @@
+import subprocess
+import threading
+
+
+class ExifTool:
+    """Long-lived exiftool process.
+
+    Starting exiftool means starting a Perl interpreter, which takes much
+    longer than the actual edition of the metadata. This class keeps a single
+    ``exiftool -stay_open True -@ -`` process running and sends it the
+    commands through a pipe. The process is (re)started when needed, so that
+    a crash of exiftool only costs the command being executed.
+
+    Parameters
+    ----------
+    executable : str
+        Path to the exiftool executable.
+
+    """
+
+    sentinel = "{ready}"
+
+    def __init__(self, executable="exiftool"):
+        self._executable = executable
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            [self._executable, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="UTF-8",
+        )
+
+    def _alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def execute(self, *args: str):
+        """Execute a command in the exiftool process.
+
+        Parameters
+        ----------
+        *args : str
+            Arguments of the command, as they would be given to exiftool in
+            the command line.
+
+        Returns
+        -------
+        str :
+            Output of the command.
+
+        """
+        # Arguments are sent one per line
+        args = [a.replace("\n", " ") for a in args]
+
+        with self._lock:
+            for attempt in range(2):
+                if not self._alive():
+                    self._start()
+                try:
+                    return self._communicate(args)
+                except (BrokenPipeError, EOFError):
+                    self._kill()
+                    if attempt == 1:
+                        raise
+
+    def _communicate(self, args):
+        stdin = self._process.stdin
+        stdin.write("\n".join(args) + "\n-execute\n")
+        stdin.flush()
+
+        output = []
+        stdout = self._process.stdout
+        while True:
+            line = stdout.readline()
+            if line == "":
+                raise EOFError("exiftool terminated unexpectedly")
+            if line.rstrip() == self.sentinel:
+                break
+            output.append(line)
+
+        return "".join(output)
+
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def close(self):
+        """Terminate the exiftool process."""
+        with self._lock:
+            if not self._alive():
+                return
+            try:
+                self._process.stdin.write("-stay_open\nFalse\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=5)
+            except (BrokenPipeError, subprocess.TimeoutExpired):
+                self._kill()
+            self._process = None
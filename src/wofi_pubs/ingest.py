@@ -0,0 +1,257 @@
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from .state import load_state, save_state
+
+DOI_RE = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>]+)", re.IGNORECASE)
+ARXIV_RE = re.compile(
+    r"arXiv:\s*(\d{4}\.\d{4,5}(?:v\d+)?|[a-z\-]+(?:\.[A-Z]{2})?/\d{7}(?:v\d+)?)",
+    re.IGNORECASE,
+)
+
+
+def find_identifiers(text: str):
+    """Find the DOI or arXiv identifier in the text of a document.
+
+    Parameters
+    ----------
+    text : str
+        Text extracted from the document.
+
+    Returns
+    -------
+    doi : str or None
+        First DOI found in the text.
+    arxiv : str or None
+        First arXiv identifier found in the text.
+
+    """
+    m = DOI_RE.search(text)
+    doi = m.group(1).rstrip(".,;)]") if m else None
+
+    m = ARXIV_RE.search(text)
+    arxiv = m.group(1) if m else None
+
+    return doi, arxiv
+
+
+def extract_identifiers(path: str, pages: int = 2):
+    """Extract the identifiers from the first pages of a PDF file.
+
+    This function is executed in a worker process.
+
+    Parameters
+    ----------
+    path : str
+        Path to the PDF file.
+    pages : int
+        Number of pages to read.
+
+    Returns
+    -------
+    doi : str or None
+    arxiv : str or None
+
+    """
+    sp = subprocess.run(
+        ["pdftotext", "-q", "-f", "1", "-l", str(pages), path, "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+    text = sp.stdout.decode("UTF-8", errors="ignore")
+
+    return find_identifiers(text)
+
+
+class InboxWatcher:
+    """Watch a directory and ingest every new PDF file found in it.
+
+    The directory is scanned periodically. The files already in it the first
+    time it is watched are recorded as ``preexisting`` and left alone. A file
+    is only processed once its size did not change between two consecutive
+    scans, so that downloads in progress are not picked up. The text extraction runs in a pool of worker
+    processes, which bounds the number of documents handled concurrently. The
+    documents in which an identifier was found are then added one at a time
+    by a dedicated thread, so that the lookups of the identifiers do not hold
+    the results of the other workers.
+
+    Parameters
+    ----------
+    inbox : str
+        Directory to watch.
+    record_file : str
+        JSON file where the already processed files are recorded.
+    ingest : callable
+        Function called as ``ingest(path, doi, arxiv)`` for each document in
+        which an identifier was found. It returns the citekey of the new entry.
+    workers : int
+        Number of worker processes.
+    interval : float
+        Seconds between two scans of the directory.
+    retries : int
+        Number of attempts to ingest a document, e.g. when the identifier
+        could not be resolved because of the network.
+    retry_delay : float
+        Seconds before the first retry; the delay doubles after each attempt.
+
+    """
+
+    def __init__(
+        self,
+        inbox,
+        record_file,
+        ingest,
+        workers=2,
+        interval=5.0,
+        retries=5,
+        retry_delay=60.0,
+    ):
+        self._inbox = inbox
+        self._record_file = record_file
+        self._ingest = ingest
+        self._workers = workers
+        self._interval = interval
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._record: dict[str, dict] = load_state(record_file)
+        self._record_lock = threading.Lock()
+        self._pending: set[str] = set()
+        self._sizes: dict[str, int] = dict()
+        self._extracted: queue.Queue = queue.Queue()
+        self._pool = None
+
+    def start(self):
+        """Start watching the directory in background threads.
+
+        Raises
+        ------
+        FileNotFoundError
+            If ``pdftotext`` is not installed.
+
+        """
+        # Otherwise every document would be marked as failed
+        if shutil.which("pdftotext") is None:
+            raise FileNotFoundError("pdftotext (poppler) is needed to read the inbox")
+
+        self._seed()
+        self._pool = multiprocessing.get_context("spawn").Pool(processes=self._workers)
+        threading.Thread(target=self._run, daemon=True).start()
+        threading.Thread(target=self._run_ingest, daemon=True).start()
+
+    def _seed(self):
+        """Record the files of a directory watched for the first time."""
+        inbox = os.path.abspath(self._inbox)
+        if any(os.path.dirname(p) == inbox for p in self._record):
+            return
+        with self._record_lock, os.scandir(inbox) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.lower().endswith(".pdf"):
+                    stat = entry.stat()
+                    self._record[entry.path] = {
+                        "mtime": stat.st_mtime,
+                        "size": stat.st_size,
+                        "status": "preexisting",
+                    }
+            save_state(self._record_file, self._record)
+
+    def _run(self):
+        while True:
+            try:
+                self.scan()
+            except OSError as e:
+                print(f"Unable to scan {self._inbox}: {e}")
+            time.sleep(self._interval)
+
+    def scan(self):
+        """Submit the new and completely written PDF files to the workers."""
+        sizes = dict()
+        with os.scandir(os.path.abspath(self._inbox)) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.lower().endswith(".pdf"):
+                    continue
+                path = entry.path
+                stat = entry.stat()
+                sizes[path] = stat.st_size
+
+                if path in self._pending or self._is_processed(path, stat):
+                    continue
+                # Wait until the file stops growing
+                if self._sizes.get(path) != stat.st_size:
+                    continue
+
+                self._pending.add(path)
+                self._pool.apply_async(
+                    extract_identifiers,
+                    (path,),
+                    callback=lambda ids, p=path, s=stat: self._extracted.put(
+                        (p, s, ids)
+                    ),
+                    error_callback=lambda e, p=path, s=stat: self._on_failed(p, s, e),
+                )
+
+        self._sizes = sizes
+
+    def _is_processed(self, path, stat):
+        rec = self._record.get(path)
+        if rec is None or not _same_file(rec, stat):
+            return False
+        if rec["status"] == "failed" and rec.get("attempts", 1) < self._retries:
+            return time.time() < rec.get("retry_at", 0)
+        return True
+
+    def _run_ingest(self):
+        while True:
+            path, stat, ids = self._extracted.get()
+            self._on_extracted(path, stat, ids)
+
+    def _on_extracted(self, path, stat, ids):
+        doi, arxiv = ids
+        if doi is None and arxiv is None:
+            self._mark(path, stat, "no-identifier")
+            return
+
+        try:
+            citekey = self._ingest(path, doi, arxiv)
+        except Exception as e:
+            self._on_failed(path, stat, e)
+            return
+
+        self._mark(path, stat, "added", citekey=citekey, doi=doi, arxiv=arxiv)
+
+    def _on_failed(self, path, stat, error):
+        print(f"Unable to ingest {path}: {error}")
+        # Attempts of the same file, unchanged since its last failure
+        rec = self._record.get(path)
+        attempts = 1
+        if rec is not None and rec["status"] == "failed" and _same_file(rec, stat):
+            attempts += rec.get("attempts", 1)
+        self._mark(
+            path,
+            stat,
+            "failed",
+            error=str(error),
+            attempts=attempts,
+            retry_at=time.time() + self._retry_delay * 2 ** (attempts - 1),
+        )
+
+    def _mark(self, path, stat, status, **info):
+        with self._record_lock:
+            self._record[path] = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "status": status,
+                **info,
+            }
+            save_state(self._record_file, self._record)
+            self._pending.discard(path)
+
+
+def _same_file(rec, stat):
+    return rec["mtime"] == stat.st_mtime and rec["size"] == stat.st_size
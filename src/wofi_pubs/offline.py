@@ -0,0 +1,268 @@
+"""Read-only access to the libraries while the server is not running.
+
+The server writes a snapshot of the menu entries, citekeys and document
+paths of every library to ``state_dir/snapshot.bin``. When a client cannot
+connect to the server, it memory-maps the snapshot, starts the server in the
+background and keeps working in read-only mode: the menu is shown, and the
+selected documents can be opened and exported.
+"""
+
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+from multiprocessing.connection import Client
+
+from .state import write_atomic
+from .tracing import TracedConnection
+
+MAGIC = b"WPSNAP1\n"
+# Separator of the strings of a section
+SEP = "\x1e"
+FIELDS = ("entries", "keys", "docs")
+
+
+def write_snapshot(path, libraries: dict[str, dict]):
+    """Write the snapshot of the libraries.
+
+    Parameters
+    ----------
+    path : str
+        Path to the snapshot file.
+    libraries : dict[str, dict]
+        For each library, the lists ``entries``, ``keys`` and ``docs`` (path
+        of the document of each citekey, empty if none) and the directory of
+        the bib files ``bibdir``.
+
+    """
+    header = dict()
+    body = bytearray()
+    for library, data in libraries.items():
+        header[library] = {"bibdir": data["bibdir"]}
+        for field in FIELDS:
+            section = SEP.join(data[field]).encode("UTF-8")
+            header[library][field] = [len(body), len(section)]
+            body += section
+
+    head = json.dumps(header).encode("UTF-8")
+    write_atomic(path, MAGIC + struct.pack("<I", len(head)) + head + bytes(body))
+
+
+class Snapshot:
+    """Memory-mapped snapshot of the libraries.
+
+    Parameters
+    ----------
+    path : str
+        Path to the snapshot file.
+
+    Raises
+    ------
+    OSError :
+        If the snapshot does not exist.
+    ValueError :
+        If the file is not a valid snapshot.
+
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a wofi-pubs snapshot")
+        (size,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self._header = json.loads(self._mm[start : start + size])
+        self._body = start + size
+
+    def libraries(self):
+        return list(self._header)
+
+    def bibdir(self, library):
+        return self._header[library]["bibdir"]
+
+    def get(self, library, field):
+        """Get a list of strings of a library (see :data:`FIELDS`)."""
+        if library not in self._header:
+            return []
+        offset, size = self._header[library][field]
+        if size == 0:
+            return []
+        start = self._body + offset
+        return self._mm[start : start + size].decode("UTF-8").split(SEP)
+
+
+class OfflineConnection:
+    """Stand-in for the connection to the server, in read-only mode.
+
+    It answers the requests of the clients from the snapshot. Commands that
+    modify the libraries are ignored.
+
+    Parameters
+    ----------
+    snapshot : :obj:`Snapshot`
+    pdfviewer : str
+        Command used to open the documents.
+
+    """
+
+    # Replies of the commands that cannot be run, for the clients waiting
+    # for one
+    EMPTY_REPLIES = {
+        "get-tags": [],
+        "get-devices": [],
+        "add-tag": "Done",
+        "complete": [],
+    }
+
+    # Commands run from the snapshot
+    AVAILABLE = (
+        "get-publication-list",
+        "get-publication-info",
+        "open-document",
+        "export-reference",
+        "export-references",
+        "update-list-order",
+    )
+
+    def __init__(self, snapshot, pdfviewer="zathura"):
+        self._snapshot = snapshot
+        self._pdfviewer = pdfviewer
+        self._replies = []
+
+    def send(self, msg: dict):
+        cmd = msg["cmd"]
+        match cmd:
+            case "batch":
+                self._replies.append(self._run_batch(msg["ops"], msg.get("library")))
+            case "get-publication-list":
+                library = msg["library"]
+                self._replies.append(
+                    (
+                        self._snapshot.get(library, "entries"),
+                        self._snapshot.get(library, "keys"),
+                    )
+                )
+            case "get-publication-info":
+                self._replies.append(
+                    " <tt><b>Read-only mode</b></tt>\n"
+                    + "The server is starting, only open and export are available\0"
+                )
+            case "open-document":
+                self._open_doc(msg["library"], msg["citekey"])
+            case "export-reference":
+                self._export_bib(msg["library"], [msg["citekey"]])
+            case "export-references":
+                self._export_bib(msg["library"], msg["citekeys"])
+            case "update-list-order":
+                pass
+            case _:
+                print(f"'{cmd}' is not available while the server is starting")
+                if cmd in self.EMPTY_REPLIES:
+                    self._replies.append(self.EMPTY_REPLIES[cmd])
+
+    def _run_batch(self, ops, library):
+        results = []
+        for op in ops:
+            if library is not None:
+                op = {"library": library, **op}
+            n_replies = len(self._replies)
+            self.send(op)
+            result = {"cmd": op["cmd"], "ok": op["cmd"] in self.AVAILABLE}
+            if len(self._replies) > n_replies:
+                result["reply"] = self._replies.pop()
+            results.append(result)
+
+        return results
+
+    def recv(self):
+        return self._replies.pop(0)
+
+    def close(self):
+        pass
+
+    def _open_doc(self, library, citekey):
+        keys = self._snapshot.get(library, "keys")
+        docpath = self._snapshot.get(library, "docs")[keys.index(citekey)]
+        if docpath:
+            subprocess.Popen(self._pdfviewer.split() + [docpath])
+
+    def _export_bib(self, library, citekeys):
+        bibdir = self._snapshot.bibdir(library)
+        bibdata_raw = ""
+        for citekey in citekeys:
+            with open(os.path.join(bibdir, citekey + ".bib"), "r") as f:
+                bibdata_raw += f.read().strip() + "\n\n"
+
+        subprocess.run(["wl-copy"], input=bibdata_raw, text=True, check=False)
+
+
+def start_server(config):
+    """Start the server in the background."""
+    subprocess.Popen(
+        [sys.executable, "-m", "wofi_pubs.wofi_pubs_server", config],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def connect(address, config, state_dir, pdfviewer, timeout=60.0, tracer=None):
+    """Connect to the server, or fall back to the read-only mode.
+
+    If the server is not running, it is started in the background. Without a
+    snapshot, e.g. the first time the server is used, the client waits until
+    the server accepts connections.
+
+    Parameters
+    ----------
+    address : tuple
+        Address of the server.
+    config : str
+        Configuration file, passed to the server.
+    state_dir : str
+        Directory where the server keeps its snapshot.
+    pdfviewer : str
+        Command used to open the documents in read-only mode.
+    timeout : float
+        Seconds to wait for the server when there is no snapshot.
+    tracer : :obj:`Tracer`
+        If given, the requests are traced.
+
+    Returns
+    -------
+    :obj:`Connection` or :obj:`OfflineConnection`
+
+    """
+    conn = _connect(address, config, state_dir, pdfviewer, timeout)
+    if tracer is None:
+        return conn
+
+    tracer.event(None, "connected", offline=isinstance(conn, OfflineConnection))
+    return TracedConnection(conn, tracer)
+
+
+def _connect(address, config, state_dir, pdfviewer, timeout):
+    try:
+        return Client(address)
+    except ConnectionRefusedError:
+        start_server(config)
+
+    try:
+        snapshot = Snapshot(os.path.join(state_dir, "snapshot.bin"))
+        return OfflineConnection(snapshot, pdfviewer)
+    except (OSError, ValueError):
+        pass
+
+    deadline = time.monotonic() + timeout
+    while True:
+        time.sleep(0.2)
+        try:
+            return Client(address)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
@@ -0,0 +1,516 @@
+"""Edit the document information of PDF files by means of incremental updates.
+
+Instead of rewriting the whole file, a new document information dictionary is
+appended to the file, together with a cross-reference section pointing to it
+and a new trailer. The original content of the file is never modified, so that
+writing the metadata of a large scanned book only costs a few hundred bytes.
+
+Only the document information dictionary is written, keeping its other
+entries (producer, dates, keywords...). Encrypted files are not supported.
+"""
+
+import os
+import re
+import time
+import zlib
+
+WHITESPACE = b" \t\r\n\f\x00"
+DELIMITERS = b"()<>[]{}/%"
+
+_OBJ_RE = re.compile(rb"(\d+)\s+(\d+)\s+obj\s*")
+_REF_RE = re.compile(rb"^(\d+)\s+(\d+)\s+R$")
+
+
+class PdfInfoError(Exception):
+    """Raised when the file cannot be updated."""
+
+
+def write_info(path, title: str, author: str):
+    """Write title and author into the document information of a PDF file.
+
+    The other entries of the current document information are kept. If it
+    cannot be read (e.g. it is in an object stream), the file is not updated.
+
+    Parameters
+    ----------
+    path : str
+        Path to the PDF file.
+    title : str
+    author : str
+
+    Returns
+    -------
+    int :
+        Number of bytes appended to the file.
+
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        prev = _find_startxref(f, size)
+        try:
+            trailer, is_stream = _read_trailer(f, prev)
+        except IndexError:
+            raise PdfInfoError("Truncated trailer") from None
+        info = _read_info_dict(f, prev, trailer)
+        if info is None:
+            info = dict()
+
+    if b"/Encrypt" in trailer:
+        raise PdfInfoError("Encrypted files are not supported")
+    try:
+        num = int(trailer[b"/Size"])
+        root = trailer[b"/Root"]
+    except (KeyError, ValueError):
+        raise PdfInfoError("Invalid trailer") from None
+
+    info[b"/Title"] = encode_text(title)
+    info[b"/Author"] = encode_text(author)
+    info[b"/ModDate"] = encode_text(time.strftime("D:%Y%m%d%H%M%S"))
+    info = b"<<" + b"".join(b" %s %s" % kv for kv in info.items()) + b" >>"
+
+    out = bytearray(b"\n")
+    info_off = size + len(out)
+    out += b"%d 0 obj\n" % num + info + b"\nendobj\n"
+
+    extra = b" /Root " + root + b" /Info %d 0 R /Prev %d" % (num, prev)
+    if b"/ID" in trailer:
+        extra += b" /ID " + trailer[b"/ID"]
+
+    xref_off = size + len(out)
+    if is_stream:
+        # The file uses cross-reference streams, so the update uses one too
+        data = b"\x01" + info_off.to_bytes(4, "big") + b"\x00\x00"
+        data += b"\x01" + xref_off.to_bytes(4, "big") + b"\x00\x00"
+        out += (
+            b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] /Index [%d 2]"
+            % (num + 1, num + 2, num)
+            + extra
+            + b" /Length %d >>\nstream\n" % len(data)
+            + data
+            + b"\nendstream\nendobj\n"
+        )
+    else:
+        out += b"xref\n0 1\n0000000000 65535 f \n"
+        out += b"%d 1\n%010d 00000 n \n" % (num, info_off)
+        out += b"trailer\n<< /Size %d" % (num + 1) + extra + b" >>\n"
+    out += b"startxref\n%d\n%%%%EOF\n" % xref_off
+
+    with open(path, "ab") as f:
+        f.write(out)
+
+    return len(out)
+
+
+def read_info(path):
+    """Read title and author from the document information of a PDF file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the PDF file.
+
+    Returns
+    -------
+    tuple or None :
+        ``(title, author)``, or None if the information could not be read.
+
+    """
+    try:
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = _find_startxref(f, size)
+            trailer, _ = _read_trailer(f, offset)
+            info = _read_info_dict(f, offset, trailer)
+    except (OSError, PdfInfoError):
+        return None
+    if info is None:
+        return None
+
+    return (
+        decode_text(info.get(b"/Title", b"()")),
+        decode_text(info.get(b"/Author", b"()")),
+    )
+
+
+def _read_info_dict(f, offset, trailer):
+    """Read the entries of the document information dictionary.
+
+    Returns
+    -------
+    dict or None :
+        Raw entries, or None if the file has no document information.
+
+    Raises
+    ------
+    PdfInfoError :
+        If the document information cannot be read (e.g. it is in an object
+        stream).
+
+    """
+    value = trailer.get(b"/Info")
+    if value is None:
+        return None
+    try:
+        if value.startswith(b"<<"):
+            info, _ = parse_dict(value, 0)
+            return info
+        m = _REF_RE.match(value)
+        if m is None:
+            raise PdfInfoError("Invalid document information")
+        obj_off = _find_object(f, offset, int(m.group(1)))
+        if obj_off is None:
+            raise PdfInfoError("Document information not found")
+        f.seek(obj_off)
+        data = f.read(65536)
+        m = _OBJ_RE.match(data)
+        if m is None:
+            raise PdfInfoError("Document information not found")
+        info, _ = parse_dict(data, m.end())
+    except (IndexError, ValueError):
+        raise PdfInfoError("Invalid document information") from None
+
+    return info
+
+
+def _find_startxref(f, size):
+    f.seek(max(0, size - 4096))
+    tail = f.read()
+    idx = tail.rfind(b"startxref")
+    if idx == -1:
+        raise PdfInfoError("startxref not found")
+    m = re.match(rb"startxref\s+(\d+)", tail[idx:])
+    if m is None:
+        raise PdfInfoError("Invalid startxref")
+
+    return int(m.group(1))
+
+
+def _read_trailer(f, offset):
+    """Read the trailer of the cross-reference section starting at `offset`.
+
+    Returns
+    -------
+    trailer : dict
+    is_stream : bool
+        Whether the section is a cross-reference stream.
+
+    """
+    f.seek(offset)
+    head = f.read(64)
+    if head.startswith(b"xref"):
+        f.seek(offset)
+        data = f.read(1 << 20)
+        idx = data.find(b"trailer")
+        while idx == -1:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                raise PdfInfoError("trailer not found")
+            data += chunk
+            idx = data.find(b"trailer")
+        trailer, _ = parse_dict(data, idx + len(b"trailer"))
+        return trailer, False
+
+    m = _OBJ_RE.match(head)
+    if m is None:
+        raise PdfInfoError(f"No cross-reference section at offset {offset}")
+    f.seek(offset)
+    data = f.read(65536)
+    trailer, _ = parse_dict(data, m.end())
+    if trailer.get(b"/Type") != b"/XRef":
+        raise PdfInfoError(f"No cross-reference section at offset {offset}")
+
+    return trailer, True
+
+
+def _find_object(f, offset, num):
+    """Find the offset of an object following the cross-reference sections."""
+    seen = set()
+    while offset not in seen:
+        seen.add(offset)
+        trailer, is_stream = _read_trailer(f, offset)
+        if is_stream:
+            found = _find_in_xref_stream(f, offset, trailer, num)
+        else:
+            found = _find_in_xref_table(f, offset, num)
+        if found is not None:
+            return found
+        if b"/Prev" not in trailer:
+            return None
+        offset = int(trailer[b"/Prev"])
+
+    return None
+
+
+def _find_in_xref_table(f, offset, num):
+    f.seek(offset + len(b"xref"))
+    f.readline()
+    while True:
+        line = f.readline().strip()
+        if not line or line.startswith(b"trailer"):
+            return None
+        start, count = (int(x) for x in line.split()[:2])
+        if start <= num < start + count:
+            f.seek((num - start) * 20, os.SEEK_CUR)
+            entry = f.read(20)
+            if entry[17:18] != b"n":
+                return None
+            return int(entry[:10])
+        f.seek(count * 20, os.SEEK_CUR)
+
+
+def _find_in_xref_stream(f, offset, trailer, num):
+    widths = [int(w) for w in _array_items(trailer[b"/W"])]
+    size = int(trailer[b"/Size"])
+    index = [int(i) for i in _array_items(trailer.get(b"/Index", b"[0 %d]" % size))]
+
+    f.seek(offset)
+    head = f.read(65536)
+    _, end = parse_dict(head, _OBJ_RE.match(head).end())
+    start = head.find(b"stream", end)
+    pos = offset + start + len(b"stream")
+    f.seek(pos)
+    if f.read(1) == b"\r":
+        f.read(1)
+    data = _decode_stream(f.read(int(trailer[b"/Length"])), trailer)
+
+    row = sum(widths)
+    pos = 0
+    for first, count in zip(index[::2], index[1::2]):
+        if first <= num < first + count:
+            pos += (num - first) * row
+            entry = data[pos : pos + row]
+            fields = []
+            k = 0
+            for w in widths:
+                fields.append(int.from_bytes(entry[k : k + w], "big") if w else 1)
+                k += w
+            if fields[0] == 2:
+                raise PdfInfoError(f"Object {num} is in an object stream")
+            return fields[1] if fields[0] == 1 else None
+        pos += count * row
+
+    return None
+
+
+def _decode_stream(data, stream):
+    """Decode the data of a stream with no filter or Flate compression.
+
+    Parameters
+    ----------
+    data : bytes
+        Raw data of the stream.
+    stream : dict
+        Dictionary of the stream.
+
+    """
+    filters = _array_items(stream.get(b"/Filter", b"[]"))
+    if not filters:
+        return data
+    if filters != [b"/FlateDecode"]:
+        raise PdfInfoError(f"Unsupported filter {b' '.join(filters).decode()}")
+    try:
+        data = zlib.decompress(data)
+    except zlib.error as e:
+        raise PdfInfoError(f"Invalid stream: {e}") from None
+
+    params = stream.get(b"/DecodeParms", b"<<>>").strip()
+    if params.startswith(b"["):
+        params = params[1:-1]
+    params, _ = parse_dict(params, 0)
+    predictor = int(params.get(b"/Predictor", b"1"))
+    if predictor == 1:
+        return data
+    if predictor < 10:
+        raise PdfInfoError("TIFF predictor is not supported")
+
+    # PNG predictors: every row starts with the kind of its predictor
+    bpp = max(
+        1,
+        int(params.get(b"/Colors", b"1"))
+        * int(params.get(b"/BitsPerComponent", b"8"))
+        // 8,
+    )
+    columns = bpp * int(params.get(b"/Columns", b"1"))
+    out = bytearray()
+    prev = bytes(columns)
+    for k in range(0, len(data), columns + 1):
+        kind = data[k]
+        row = bytearray(data[k + 1 : k + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            up = prev[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                up_left = prev[i - bpp] if i >= bpp else 0
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                if pa <= pb and pa <= pc:
+                    row[i] = (row[i] + left) & 0xFF
+                elif pb <= pc:
+                    row[i] = (row[i] + up) & 0xFF
+                else:
+                    row[i] = (row[i] + up_left) & 0xFF
+            elif kind != 0:
+                raise PdfInfoError(f"Invalid PNG predictor {kind}")
+        out += row
+        prev = row
+
+    return bytes(out)
+
+
+def _array_items(value):
+    value = value.strip()
+    if not value.startswith(b"["):
+        return [value]
+    return value[1:-1].split()
+
+
+def _skip_ws(data, pos):
+    while data[pos] in WHITESPACE or data[pos] == ord("%"):
+        if data[pos] == ord("%"):
+            while data[pos] not in b"\r\n":
+                pos += 1
+        pos += 1
+    return pos
+
+
+def _skip_string(data, pos):
+    depth = 0
+    while True:
+        c = data[pos]
+        if c == ord("\\"):
+            pos += 2
+            continue
+        if c == ord("("):
+            depth += 1
+        elif c == ord(")"):
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        pos += 1
+
+
+def _skip_value(data, pos):
+    """Return the end position of the object starting at `pos`."""
+    c = data[pos : pos + 1]
+    if c == b"(":
+        return _skip_string(data, pos)
+    if data[pos : pos + 2] == b"<<":
+        _, end = parse_dict(data, pos)
+        return end
+    if c == b"<":
+        return data.index(b">", pos) + 1
+    if c == b"[":
+        pos += 1
+        while True:
+            pos = _skip_ws(data, pos)
+            if data[pos : pos + 1] == b"]":
+                return pos + 1
+            pos = _skip_value(data, pos)
+    if c == b"/":
+        pos += 1
+    while pos < len(data) and data[pos] not in WHITESPACE + DELIMITERS:
+        pos += 1
+    return pos
+
+
+def parse_dict(data: bytes, pos: int):
+    """Parse the entries of a dictionary.
+
+    Values are not interpreted, but returned as their raw bytes. Indirect
+    references are returned as a single value like ``b"12 0 R"``.
+
+    Parameters
+    ----------
+    data : bytes
+    pos : int
+        Position of the dictionary in `data`.
+
+    Returns
+    -------
+    entries : dict
+    end : int
+        Position after the end of the dictionary.
+
+    """
+    pos = _skip_ws(data, pos)
+    if data[pos : pos + 2] != b"<<":
+        raise PdfInfoError("Dictionary expected")
+    pos += 2
+    entries = dict()
+    while True:
+        pos = _skip_ws(data, pos)
+        if data[pos : pos + 2] == b">>":
+            return entries, pos + 2
+        end = _skip_value(data, pos)
+        key = data[pos:end]
+        pos = _skip_ws(data, end)
+        end = _skip_value(data, pos)
+        # Indirect references: "num gen R"
+        m = re.match(rb"\s+(\d+)\s+R(?![^\s/<>\[\]()])", data[end : end + 32])
+        if m is not None and data[pos:end].isdigit():
+            end += m.end()
+        entries[key] = data[pos:end]
+        pos = end
+
+
+def encode_text(text: str):
+    """Encode a text string as a PDF string object."""
+    if text.isascii() and text.isprintable():
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        return b"(" + escaped.encode("ascii") + b")"
+
+    return b"<FEFF" + text.encode("utf-16-be").hex().upper().encode("ascii") + b">"
+
+
+def decode_text(value: bytes):
+    """Decode a PDF string object into a text string."""
+    value = value.strip()
+    if value.startswith(b"<"):
+        raw = bytes.fromhex(value[1:-1].decode("ascii"))
+    else:
+        raw = _unescape(value[1:-1])
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", errors="replace")
+
+    return raw.decode("latin-1")
+
+
+def _unescape(raw: bytes):
+    escapes = {
+        ord("n"): b"\n",
+        ord("r"): b"\r",
+        ord("t"): b"\t",
+        ord("b"): b"\b",
+        ord("f"): b"\f",
+    }
+    out = bytearray()
+    k = 0
+    while k < len(raw):
+        c = raw[k]
+        if c != ord("\\"):
+            out.append(c)
+            k += 1
+            continue
+        k += 1
+        c = raw[k]
+        if c in escapes:
+            out += escapes[c]
+            k += 1
+        elif c in b"01234567":
+            m = re.match(rb"[0-7]{1,3}", raw[k:])
+            out.append(int(m.group(0), 8) & 0xFF)
+            k += m.end()
+        elif c in b"\r\n":
+            # Line continuation
+            k += 2 if raw[k : k + 2] == b"\r\n" else 1
+        else:
+            out.append(c)
+            k += 1
+
+    return bytes(out)
@@ -1,21 +1,33 @@
+import hashlib
+import mmap
+import os
 import re
 import subprocess
 import sys
+import threading
 import time
 import unicodedata
+import uuid
 from itertools import cycle
 from multiprocessing.pool import ThreadPool
 from os.path import expanduser
 from pathlib import Path, PurePath
+from urllib.parse import quote_plus
 
 import gi
+import requests
 
 gi.require_version("Notify", "0.7")
 from dptrp1.dptrp1 import DigitalPaper
 from gi.repository import Notify
 
+from .state import load_state, save_state, write_atomic
+
 HOME = Path.home()
 
+# Folder where the DPT-RP1 stores the notes
+NOTE_FOLDER = PurePath("Document/Note")
+
 # Default paths for the deviceid and privatekey files
 DPT_ID = HOME / ".config/dpt/deviceid.dat"
 DPT_KEY = HOME / ".config/dpt/privatekey.dat"
@@ -55,15 +67,21 @@ class Document(object):
     ----------
     key : TODO
     repo : TODO
+    lib_name : str
+        Name of the library.
+    folder : str
+        Remote folder where the document is stored. By default it is defined
+        by the library and the type of document.
 
     """
 
-    def __init__(self, key, repo, lib_name):
+    def __init__(self, key, repo, lib_name, folder=None):
         self._key = key
         self._repo = repo
-        self._dpt_dir: str  # Remote directory
+        self._dpt_dir: str | None = folder  # Remote directory
         self._bib = repo.databroker.pull_bibentry(self._key)
         self._lib_name = lib_name
+        self._docpath = repo.pull_docpath(self._key)
 
     def to_dptrp1(self, dpt):
         """Send the document to the DPT-RP1
@@ -76,13 +94,8 @@ class Document(object):
 
 
         """
-        repo = self._repo
-        key = self._key
-
-        docpath = repo.pull_docpath(key)
-        if docpath is not None:
-            local_path = expanduser(repo.pull_docpath(key))
-        else:
+        local_path = self.local_path()
+        if local_path is None:
             print("No document!")
             return 1
 
@@ -97,7 +110,25 @@ class Document(object):
 
         return remote_path
 
-    def get_annotations(self, dpt):
+    def local_path(self):
+        """Path to the document in the local file system.
+
+        Returns
+        -------
+        str or None :
+            None if the reference has no document.
+
+        """
+        if self._docpath is None:
+            return None
+
+        return expanduser(self._docpath)
+
+    def remote_path(self):
+        """Path of the document in the DPT-RP1."""
+        return self._get_target_folder() / self._gen_file_name()
+
+    def get_annotations(self, dpt, inventory, addr, mode="copy"):
         """Get pdf file with the annotations.
 
         If such a file has been previously downloaded, see whether there
@@ -105,13 +136,30 @@ class Document(object):
 
         Parameters
         ----------
-        dpt : TODO
+        dpt : `obj`:DigitalPaper
+        inventory : :obj:`DptInventory`
+            Inventory of the documents in the device.
+        addr : str
+            Address of the device.
+        mode : str
+            ``replace`` overwrites the document of the library, ``copy``
+            stores the annotated document next to it.
 
+        Returns
+        -------
+        Path or None :
+            Path to the downloaded file, or None if there were no changes.
 
         """
-        pass
+        if not self._is_annotated(inventory, addr):
+            return None
+
+        target = self.annotated_path(mode)
+        _download(dpt, inventory, addr, self.remote_path(), target)
+
+        return target
 
-    def get_notes(self, dpt):
+    def get_notes(self, dpt, inventory, addr):
         """Get notes associated with the document.
 
         If such a file has been previously downloaded, see whether there
@@ -120,27 +168,98 @@ class Document(object):
         Parameters
         ----------
         dpt : DPTRP1 object
+        inventory : :obj:`DptInventory`
+            Inventory of the documents in the device.
+        addr : str
+            Address of the device.
+
+        Returns
+        -------
+        Path or None :
+            Path to the downloaded notes, or None if there were no changes.
+
+        """
+        remote = self._exist_note(inventory, addr)
+        if remote is None:
+            return None
+
+        entry = inventory.lookup(addr, remote)
+        if entry["revision"] == entry["synced_revision"]:
+            return None
+
+        local = Path(self.local_path())
+        target = local.with_name(f"{local.stem}_notes.pdf")
+        _download(dpt, inventory, addr, remote, target)
+
+        return target
+
+    def _is_annotated(self, inventory, addr):
+        """Whether the document was changed in the device since the last sync.
+
+        Documents that were never synchronized are considered changed if
+        their size differs from the local file.
+
+        Parameters
+        ----------
+        inventory : :obj:`DptInventory`
+            Inventory of the documents in the device.
+        addr : str
+            Address of the device.
+
+        Returns
+        -------
+        bool
 
         """
-        pass
+        entry = inventory.lookup(addr, self.remote_path())
+        if entry is None:
+            return False
+        if entry["synced_revision"] is None:
+            local_path = self.local_path()
+            if local_path is None or not os.path.exists(local_path):
+                return True
+            return entry["size"] != os.path.getsize(local_path)
+
+        return entry["revision"] != entry["synced_revision"]
+
+    def _exist_note(self, inventory, addr):
+        """Look for a note with the same name as the document in the device.
 
-    def _is_annotated(self):
-        """TODO: Docstring for _is_annotated.
         Returns
         -------
-        TODO
+        PurePath or None :
+            Remote path of the note.
 
         """
-        pass
+        remote = NOTE_FOLDER / self._gen_file_name()
+        if inventory.lookup(addr, remote) is None:
+            return None
+
+        return remote
+
+    def annotated_path(self, mode="copy"):
+        """Local path where the annotated document is stored.
+
+        Parameters
+        ----------
+        mode : str
+            ``replace`` returns the path of the document of the library,
+            ``copy`` returns a new versioned path next to it.
 
-    def _exist_note(self):
-        """TODO: Docstring for _exist_note.
         Returns
         -------
-        TODO
+        Path
 
         """
-        pass
+        local = Path(self.local_path())
+        if mode == "replace":
+            return local
+
+        n = 1
+        while (target := local.with_name(f"{local.stem}_annotated_v{n}.pdf")).exists():
+            n += 1
+
+        return target
 
     def _get_target_folder(self):
         """Get the forlder where to save the document
@@ -155,7 +274,9 @@ class Document(object):
         d_type = self._bib[key]["ENTRYTYPE"]
 
         # Define name of the target folder
-        if self._lib_name in [None, "main_library"]:
+        if self._dpt_dir is not None:
+            t_folder = self._dpt_dir
+        elif self._lib_name in [None, "main_library"]:
             t_folder = "Document/" + OUT_DEF[d_type]["out_folder"]
         else:
             t_folder = "Document/" + self._lib_name.capitalize()
@@ -205,6 +326,846 @@ def connect_to_dpt(addr, dev_id=DPT_ID, dev_key=DPT_KEY):
     return dpt
 
 
+class DptSessionPool:
+    """Pool of authenticated sessions with DPT-RP1 devices.
+
+    The authentication with the device is a challenge/response handshake,
+    which is done only once per device. The session is checked again before
+    being reused if it was idle for more than `check_interval` seconds, and
+    a new one is created if the check fails. Sessions idle for more than
+    `idle_timeout` seconds are discarded.
+
+    Parameters
+    ----------
+    check_interval : float
+        Idle time after which the session is checked before being reused.
+    idle_timeout : float
+        Idle time after which the session is discarded.
+    dev_id : str
+        Path to the file with the client ID.
+    dev_key : str
+        Path to the file with the private key.
+
+    """
+
+    def __init__(
+        self, check_interval=30.0, idle_timeout=600.0, dev_id=DPT_ID, dev_key=DPT_KEY
+    ):
+        self._check_interval = check_interval
+        self._idle_timeout = idle_timeout
+        self._dev_id = dev_id
+        self._dev_key = dev_key
+        self._sessions: dict[str, tuple[DigitalPaper, float]] = dict()
+        self._lock = threading.Lock()
+
+    def get(self, addr: str):
+        """Get an authenticated session with the device.
+
+        Parameters
+        ----------
+        addr : str
+            Address of the device.
+
+        Returns
+        -------
+        :obj:`DigitalPaper`
+
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            dpt, last_used = self._sessions.get(addr, (None, now))
+            if dpt is not None and now - last_used > self._check_interval:
+                if not self._is_alive(dpt):
+                    dpt = None
+            if dpt is None:
+                dpt = connect_to_dpt(addr, self._dev_id, self._dev_key)
+            self._sessions[addr] = (dpt, now)
+
+        return dpt
+
+    def invalidate(self, addr: str):
+        """Discard the session with the device, e.g. after an error."""
+        with self._lock:
+            self._sessions.pop(addr, None)
+
+    def _prune(self, now):
+        for addr, (_, last_used) in list(self._sessions.items()):
+            if now - last_used > self._idle_timeout:
+                del self._sessions[addr]
+
+    @staticmethod
+    def _is_alive(dpt):
+        try:
+            dpt.get_storage()
+        except Exception:
+            return False
+        return True
+
+
+class _MultipartReader:
+    """File-like `multipart/form-data` body containing a single file.
+
+    The file is read in chunks while the request is being sent, and the
+    number of bytes read is reported to `progress`.
+
+    """
+
+    def __init__(self, fh, filename, size, progress=None):
+        self.boundary = uuid.uuid4().hex
+        self._head = (
+            f"--{self.boundary}\r\n"
+            + f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            + "Content-Type: application/pdf\r\n\r\n"
+        ).encode("UTF-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("UTF-8")
+        self._len = len(self._head) + size + len(self._tail)
+        self._fh = fh
+        self._progress = progress
+
+    def __len__(self):
+        return self._len
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._len
+        out = bytearray()
+        while len(out) < size:
+            if self._head:
+                n = size - len(out)
+                out += self._head[:n]
+                self._head = self._head[n:]
+            elif self._fh is not None:
+                chunk = self._fh.read(size - len(out))
+                if not chunk:
+                    self._fh = None
+                    continue
+                out += chunk
+                if self._progress is not None:
+                    self._progress(len(chunk))
+            elif self._tail:
+                n = size - len(out)
+                out += self._tail[:n]
+                self._tail = self._tail[n:]
+            else:
+                break
+
+        return bytes(out)
+
+
+class _BufferReader:
+    """Read-only file-like object over a buffer shared by several readers.
+
+    Each reader keeps its own position, so that the same memory map can be
+    uploaded to several devices at the same time without copying it.
+
+    """
+
+    def __init__(self, buf):
+        self._buf = buf
+        self._pos = 0
+
+    def read(self, size=-1):
+        end = len(self._buf) if size is None or size < 0 else self._pos + size
+        chunk = self._buf[self._pos : end]
+        self._pos += len(chunk)
+        return chunk
+
+
+def map_file(path):
+    """Map a file in memory, read-only.
+
+    Returns
+    -------
+    mmap or bytes :
+        Content of the file (empty files cannot be mapped).
+
+    """
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def upload_document(
+    dpt, local_path, remote_path, progress=None, data=None, replace=False
+):
+    """Upload a file to the DPT-RP1, reporting the progress.
+
+    `DigitalPaper.upload` builds the whole request in memory before sending
+    it. Here the same requests are made, but the file is streamed in chunks.
+    If the session of the device is not accessible the upload is delegated to
+    `DigitalPaper.upload`.
+
+    When replacing a document, the new content is written to the existing
+    document, so that the device keeps the old content if the upload fails.
+    Otherwise the new document is deleted if its content cannot be sent.
+
+    Parameters
+    ----------
+    dpt : :obj:`DigitalPaper`
+    local_path : str
+        Path to the local file.
+    remote_path : PurePath
+        Path of the document in the device.
+    progress : callable
+        Called with the number of bytes sent since the last call.
+    data : mmap or bytes
+        Content of the file, if it is already in memory. `local_path` is then
+        not read.
+    replace : bool
+        Replace the content of the document at `remote_path`.
+
+    """
+    remote_path = PurePath(remote_path)
+    session = getattr(dpt, "session", None)
+
+    if session is None or progress is None:
+        if replace:
+            doc_id = dpt._get_object_id(str(remote_path))
+
+            def send(fh):
+                files = {"file": (quote_plus(remote_path.name), fh, "rb")}
+                dpt._put_endpoint(f"/documents/{doc_id}/file", files=files)
+
+        else:
+
+            def send(fh):
+                dpt.upload(fh, str(remote_path))
+
+        if data is not None:
+            send(_BufferReader(data))
+        else:
+            with open(local_path, "rb") as fh:
+                send(fh)
+        if progress is not None:
+            progress(os.path.getsize(local_path) if data is None else len(data))
+        return
+
+    if replace:
+        doc_id = dpt._get_object_id(str(remote_path))
+    else:
+        directory_id = dpt._get_object_id(str(remote_path.parent))
+        info = {
+            "file_name": remote_path.name,
+            "parent_folder_id": directory_id,
+            "document_source": "",
+        }
+        r = dpt._post_endpoint("/documents2", data=info)
+        doc_id = r.json()["document_id"]
+
+    def put(fh, size):
+        body = _MultipartReader(fh, quote_plus(remote_path.name), size, progress)
+        # As in DigitalPaper: Session.put would take the CA bundle from the
+        # environment (REQUESTS_CA_BUNDLE) over `session.verify`, and the
+        # self-signed certificate of the device would be rejected
+        request = requests.Request(
+            "PUT",
+            f"{dpt.base_url}/documents/{doc_id}/file",
+            data=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={body.boundary}"},
+        )
+        return session.send(session.prepare_request(request))
+
+    try:
+        if data is not None:
+            r = put(_BufferReader(data), len(data))
+        else:
+            with open(local_path, "rb") as fh:
+                r = put(fh, os.fstat(fh.fileno()).st_size)
+        r.raise_for_status()
+    except Exception:
+        if not replace:
+            try:
+                dpt._delete_endpoint(f"/documents/{doc_id}")
+            except OSError:
+                pass
+        raise
+
+
+class UploadProgress:
+    """Single notification showing the progress of several uploads.
+
+    Parameters
+    ----------
+    n_files : int
+        Number of files to upload.
+    n_bytes : int
+        Total size of the files.
+    min_interval : float
+        Minimum time in seconds between two updates of the notification.
+    n_devices : int
+        Number of devices the files are sent to.
+
+    """
+
+    def __init__(self, n_files, n_bytes, min_interval=0.5, n_devices=1):
+        self._n_devices = n_devices
+        self._n_files = n_files
+        self._n_bytes = n_bytes
+        self._files = 0
+        self._bytes = 0
+        self._min_interval = min_interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+        self.notification = Notify.Notification.new("Wofi-pubs", self._text())
+        # This hint allows us to update the notification later
+        self.notification.set_hint("string:x-canonical-private-synchronous:Wofi-pubs")
+        self.notification.show()
+
+    def _text(self):
+        mb = 2**20
+        target = "device" if self._n_devices == 1 else f"{self._n_devices} devices"
+        return (
+            f"Sending {self._files}/{self._n_files} files to {target}\n"
+            + f"<b>{self._bytes / mb:.1f}/{self._n_bytes / mb:.1f} MB</b>"
+        )
+
+    def add_bytes(self, n):
+        with self._lock:
+            self._bytes += n
+            self._show()
+
+    def file_done(self):
+        with self._lock:
+            self._files += 1
+            self._show(force=True)
+
+    def _show(self, force=False):
+        now = time.monotonic()
+        if force or now - self._last > self._min_interval:
+            self._last = now
+            self.notification.update("Wofi-pubs", self._text())
+            self.notification.show()
+
+
+def file_sha256(path):
+    """Compute the SHA-256 hash of a file."""
+    with open(path, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+class DptInventory:
+    """Cached inventory of the documents stored in the devices.
+
+    For each device the size and revision of the remote documents are kept,
+    together with the hash of the local file that was uploaded. The listing of
+    a folder is requested from the device only when it is older than `ttl`
+    seconds, so that repeated sends of the same documents do not transfer
+    anything. The hashes of the local files are cached by modification time
+    and size.
+
+    Parameters
+    ----------
+    record_file : str
+        JSON file where the inventory is persisted.
+    ttl : float
+        Time in seconds after which the listing of a folder is refreshed.
+
+    """
+
+    def __init__(self, record_file, ttl=300.0):
+        self._record_file = record_file
+        self._ttl = ttl
+        record = load_state(record_file)
+        self._docs: dict[str, dict] = record.get("devices", {})
+        self._local: dict[str, dict] = record.get("local", {})
+        self._listed: dict[tuple[str, str], float] = dict()
+        self._lock = threading.Lock()
+        # Hashes of local files taken from the cache, and computed
+        self.hits = 0
+        self.misses = 0
+
+    def save(self):
+        with self._lock:
+            save_state(self._record_file, {"devices": self._docs, "local": self._local})
+
+    def refresh(self, addr, dpt, folder, force=False):
+        """Update the inventory of a folder from the listing of the device.
+
+        Parameters
+        ----------
+        addr : str
+            Address of the device.
+        dpt : :obj:`DigitalPaper`
+        folder : PurePath
+            Remote folder.
+        force : bool
+            Refresh even if the listing is recent.
+
+        """
+        folder = str(folder)
+        now = time.monotonic()
+        if not force and now - self._listed.get((addr, folder), -self._ttl) < self._ttl:
+            return
+
+        entries = dpt.list_objects_in_folder(folder)
+
+        with self._lock:
+            docs = self._docs.setdefault(addr, {})
+            listed = dict()
+            for entry in entries:
+                if entry.get("entry_type") != "document":
+                    continue
+                path = entry["entry_path"]
+                old = docs.get(path, {})
+                new = {
+                    "entry_id": entry.get("entry_id"),
+                    "size": int(entry.get("file_size", -1)),
+                    "revision": entry.get("file_revision"),
+                    "modified": entry.get("modified_date"),
+                    "sha256": None,
+                    "uploaded_sha256": old.get("uploaded_sha256"),
+                    "synced_revision": old.get("synced_revision"),
+                }
+                # Keep the hash if the document was not changed in the device
+                if old.get("size") == new["size"] and old.get("revision") in (
+                    None,
+                    new["revision"],
+                ):
+                    new["sha256"] = old.get("sha256")
+                    # First listing after an upload
+                    if old.get("revision") is None and old.get("sha256"):
+                        new["synced_revision"] = new["revision"]
+                listed[path] = new
+
+            prefix = folder.rstrip("/") + "/"
+            for path in list(docs):
+                if path.startswith(prefix) and "/" not in path[len(prefix) :]:
+                    del docs[path]
+            docs.update(listed)
+            self._listed[(addr, folder)] = now
+
+    def lookup(self, addr, remote_path):
+        """Get the cached information of a remote document, if any."""
+        with self._lock:
+            return self._docs.get(addr, {}).get(str(remote_path))
+
+    def documents(self, addr, folder=None):
+        """Get the cached information of all the documents in a device.
+
+        Parameters
+        ----------
+        addr : str
+            Address of the device.
+        folder : PurePath
+            Only return documents directly inside this folder.
+
+        Returns
+        -------
+        dict :
+            Maps remote paths to the information of each document.
+
+        """
+        with self._lock:
+            docs = dict(self._docs.get(addr, {}))
+        if folder is None:
+            return docs
+
+        return {p: d for p, d in docs.items() if str(PurePath(p).parent) == str(folder)}
+
+    def local_hash(self, path, data=None):
+        """Hash of a local file, cached by modification time and size.
+
+        If given, `data` is the content of the file already in memory.
+
+        """
+        stat = os.stat(path)
+        with self._lock:
+            rec = self._local.get(path)
+        if (
+            rec is not None
+            and rec["mtime"] == stat.st_mtime
+            and rec["size"] == stat.st_size
+        ):
+            self.hits += 1
+            return rec["sha256"]
+
+        self.misses += 1
+        if data is not None:
+            sha = hashlib.sha256(data).hexdigest()
+        else:
+            sha = file_sha256(path)
+        with self._lock:
+            self._local[path] = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "sha256": sha,
+            }
+
+        return sha
+
+    def is_unchanged(self, addr, remote_path, local_path):
+        """Whether the remote document is up to date with the local file.
+
+        This is the case if both are identical, or if the local file did not
+        change since it was uploaded (the remote document may have been
+        annotated in the meantime, and must not be replaced).
+
+        """
+        entry = self.lookup(addr, remote_path)
+        if entry is None:
+            return False
+        if entry.get("uploaded_sha256") is not None:
+            if entry["uploaded_sha256"] == self.local_hash(local_path):
+                return True
+        if entry["size"] != os.path.getsize(local_path):
+            return False
+        # Files uploaded by other means are compared by size only
+        if entry["sha256"] is None:
+            return True
+
+        return entry["sha256"] == self.local_hash(local_path)
+
+    def is_annotated(self, addr, remote_path):
+        """Whether the remote document changed since it was last synchronized.
+
+        The documents uploaded by other means, never synchronized, are
+        considered as annotated.
+
+        """
+        entry = self.lookup(addr, remote_path)
+        if entry is None or entry.get("revision") is None:
+            return False
+
+        return entry["revision"] != entry.get("synced_revision")
+
+    def uploaded(self, addr, remote_path, local_path):
+        """Record the upload of a local file to the device."""
+        sha = self.local_hash(local_path)
+        with self._lock:
+            self._docs.setdefault(addr, {})[str(remote_path)] = {
+                "entry_id": None,
+                "size": os.path.getsize(local_path),
+                "revision": None,
+                "modified": None,
+                "sha256": sha,
+                "uploaded_sha256": sha,
+                "synced_revision": None,
+            }
+
+    def synced(self, addr, remote_path, sha=None):
+        """Record the current revision of a document as synchronized.
+
+        Parameters
+        ----------
+        addr : str
+            Address of the device.
+        remote_path : PurePath
+            Path of the document in the device.
+        sha : str
+            Hash of the downloaded content, if it was downloaded.
+
+        """
+        with self._lock:
+            entry = self._docs.get(addr, {}).get(str(remote_path))
+            if entry is None:
+                return
+            entry["synced_revision"] = entry["revision"]
+            if sha is not None:
+                entry["sha256"] = sha
+
+    def removed(self, addr, remote_path):
+        """Record the deletion of a document from the device."""
+        with self._lock:
+            self._docs.get(addr, {}).pop(str(remote_path), None)
+
+
+class DptUploadQueue:
+    """Upload documents to DPT-RP1 devices in the background.
+
+    Each request can contain many documents. The target folders are created
+    once per request, and at most `parallel` files are uploaded to the same
+    device at the same time, even across concurrent requests. If an inventory
+    is given, documents already present in the device are not uploaded again,
+    and changed documents are replaced, unless they were annotated in the
+    device since the last synchronization.
+
+    Parameters
+    ----------
+    sessions : :obj:`DptSessionPool`
+        Authenticated sessions with the devices.
+    parallel : int
+        Maximum number of concurrent uploads per device.
+    inventory : :obj:`DptInventory`
+        Cached inventory of the documents in the devices.
+
+    """
+
+    def __init__(self, sessions, parallel=2, inventory=None):
+        self._sessions = sessions
+        self._parallel = parallel
+        self._inventory = inventory
+        self._slots: dict[str, threading.BoundedSemaphore] = dict()
+        self._lock = threading.Lock()
+
+    def _slot(self, addr):
+        with self._lock:
+            if addr not in self._slots:
+                self._slots[addr] = threading.BoundedSemaphore(self._parallel)
+            return self._slots[addr]
+
+    def submit(self, docs, addr, on_done=None):
+        """Upload the documents in a background thread.
+
+        The documents are resolved to local and remote paths immediately, so
+        that the repository is not accessed from the background thread.
+
+        Parameters
+        ----------
+        docs : list[:obj:`Document`]
+            Documents to upload.
+        addr : str
+            Address of the device.
+        on_done : callable
+            Called with the list of results once all the uploads finished.
+            Each result is a tuple ``(citekey, remote_path, status, error)``,
+            where status is one of ``sent``, ``replaced``, ``unchanged``,
+            ``conflict`` (the document was annotated in the device and must be
+            synchronized first) or ``failed``.
+
+        """
+        jobs, results = self._jobs(docs)
+
+        threading.Thread(
+            target=self._run, args=(jobs, addr, results, on_done), daemon=True
+        ).start()
+
+    def submit_all(self, docs, addrs, on_done=None):
+        """Upload the same documents to several devices in parallel.
+
+        Each local file is mapped in memory once and the mapping is shared by
+        the uploads to all the devices.
+
+        Parameters
+        ----------
+        docs : list[:obj:`Document`]
+            Documents to upload.
+        addrs : list[str]
+            Addresses of the devices.
+        on_done : callable
+            Called once all the uploads finished with a dict mapping each
+            address to its list of results (see :meth:`submit`).
+
+        """
+        jobs, results = self._jobs(docs)
+
+        threading.Thread(
+            target=self._run_all, args=(jobs, addrs, results, on_done), daemon=True
+        ).start()
+
+    @staticmethod
+    def _jobs(docs):
+        jobs = []
+        results = []
+        for doc in docs:
+            local_path = doc.local_path()
+            if local_path is None:
+                results.append((doc._key, None, "failed", "No document"))
+                continue
+            jobs.append((doc._key, local_path, doc.remote_path()))
+
+        return jobs, results
+
+    def _run(self, jobs, addr, results, on_done):
+        sizes = dict()
+        for key, local_path, remote_path in jobs:
+            try:
+                sizes[key] = os.path.getsize(local_path)
+            except OSError as e:
+                # The document is missing on disk
+                results.append((key, remote_path, "failed", str(e)))
+        jobs = [job for job in jobs if job[0] in sizes]
+        progress = UploadProgress(len(jobs), sum(sizes.values()))
+
+        results += self._upload(jobs, addr, progress)
+
+        progress.notification.close()
+        if on_done is not None:
+            on_done(results)
+
+    def _run_all(self, jobs, addrs, results, on_done):
+        buffers = dict()
+        failed = list(results)
+        for key, local_path, remote_path in jobs:
+            try:
+                buffers[key] = map_file(local_path)
+                if self._inventory is not None:
+                    self._inventory.local_hash(local_path, buffers[key])
+            except OSError as e:
+                failed.append((key, remote_path, "failed", str(e)))
+        jobs = [job for job in jobs if job[0] in buffers]
+
+        n_bytes = sum(len(buf) for buf in buffers.values())
+        progress = UploadProgress(
+            len(jobs) * len(addrs), n_bytes * len(addrs), n_devices=len(addrs)
+        )
+
+        def upload(addr):
+            return failed + self._upload(jobs, addr, progress, buffers)
+
+        try:
+            with ThreadPool(processes=max(1, len(addrs))) as pool:
+                per_device = dict(zip(addrs, pool.map(upload, addrs)))
+        finally:
+            for buf in buffers.values():
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
+
+        progress.notification.close()
+        if on_done is not None:
+            on_done(per_device)
+
+    def _upload(self, jobs, addr, progress, buffers=None):
+        """Upload the jobs to a device.
+
+        Returns
+        -------
+        list[tuple] :
+            Result of each job.
+
+        """
+        buffers = buffers or dict()
+        slot = self._slot(addr)
+
+        inventory = self._inventory
+
+        def upload(job):
+            key, local_path, remote_path = job
+            status = "sent"
+            try:
+                if key in buffers:
+                    size = len(buffers[key])
+                else:
+                    size = os.path.getsize(local_path)
+                if inventory is not None and inventory.lookup(addr, remote_path):
+                    if inventory.is_unchanged(addr, remote_path, local_path):
+                        progress.add_bytes(size)
+                        return key, remote_path, "unchanged", None
+                    if inventory.is_annotated(addr, remote_path):
+                        # Replacing it would lose the annotations
+                        progress.add_bytes(size)
+                        error = "Annotated in the device, synchronize it first"
+                        return key, remote_path, "conflict", error
+                    status = "replaced"
+                with slot:
+                    upload_document(
+                        dpt,
+                        local_path,
+                        remote_path,
+                        progress.add_bytes,
+                        data=buffers.get(key),
+                        replace=status == "replaced",
+                    )
+                if inventory is not None:
+                    inventory.uploaded(addr, remote_path, local_path)
+                return key, remote_path, status, None
+            except Exception as e:
+                return key, remote_path, "failed", str(e)
+            finally:
+                progress.file_done()
+
+        try:
+            dpt = self._sessions.get(addr)
+            for folder in sorted({remote.parent for _, _, remote in jobs}):
+                dpt.new_folder(folder)
+                if inventory is not None:
+                    inventory.refresh(addr, dpt, folder)
+        except Exception as e:
+            self._sessions.invalidate(addr)
+            for _ in jobs:
+                progress.file_done()
+            return [(key, remote, "failed", str(e)) for key, _, remote in jobs]
+
+        with ThreadPool(processes=self._parallel) as pool:
+            uploaded = pool.map(upload, jobs)
+        if any(status == "failed" for _, _, status, _ in uploaded):
+            self._sessions.invalidate(addr)
+        if inventory is not None:
+            inventory.save()
+
+        return uploaded
+
+
+def mirror_to_device(
+    dpt, addr, docs, folder, inventory, queue, remove=False, on_done=None
+):
+    """Mirror a set of documents to a folder of the device.
+
+    The names of the documents are compared with the documents in the
+    folder. Only the missing documents are uploaded and, optionally, the
+    documents not in the set are removed. Running it again without changes
+    does not transfer anything.
+
+    Parameters
+    ----------
+    dpt : :obj:`DigitalPaper`
+    addr : str
+        Address of the device.
+    docs : list[:obj:`Document`]
+        Documents to mirror. Their remote folder must be `folder`.
+    folder : PurePath
+        Remote folder.
+    inventory : :obj:`DptInventory`
+        Inventory of the documents in the device.
+    queue : :obj:`DptUploadQueue`
+        Queue used to upload the missing documents.
+    remove : bool
+        Remove the documents of the folder that are not in `docs`.
+    on_done : callable
+        Called with a dictionary with the lists of ``uploaded``, ``removed``
+        and ``failed`` remote paths, and the number of ``unchanged`` ones.
+
+    """
+    folder = PurePath(folder)
+    dpt.new_folder(folder)
+    inventory.refresh(addr, dpt, folder, force=True)
+
+    wanted = {str(doc.remote_path()): doc for doc in docs if doc.local_path()}
+    present = set(inventory.documents(addr, folder))
+
+    missing = [doc for path, doc in wanted.items() if path not in present]
+    summary = {
+        "uploaded": [],
+        "removed": [],
+        "failed": [],
+        "unchanged": len(wanted) - len(missing),
+    }
+
+    if remove:
+        for path in sorted(present - set(wanted)):
+            try:
+                dpt.delete_document(path)
+                inventory.removed(addr, path)
+                summary["removed"].append(path)
+            except Exception as e:
+                print(f"Unable to remove {path}: {e}")
+                summary["failed"].append(path)
+        inventory.save()
+
+    def uploaded(results):
+        for _, remote_path, status, err in results:
+            if err is None:
+                summary["uploaded"].append(str(remote_path))
+            else:
+                summary["failed"].append(str(remote_path))
+        if on_done is not None:
+            on_done(summary)
+
+    if missing:
+        queue.submit(missing, addr, on_done=uploaded)
+    else:
+        uploaded([])
+
+
+def library_name(repo):
+    """Name of the library, used as folder name in the DPT-RP1."""
+    lib_path = repo.conf["main"]["pubsdir"]
+    m = re.search("(?<=/)[^/]+$", lib_path)
+
+    return m.group(0)
+
+
 def slugify(value):
     """
     Normalizes string, converts to lowercase and converts spaces to hyphens.
@@ -214,20 +1175,20 @@ def slugify(value):
     return re.sub(r"[-\s]+", "-", value)
 
 
-def to_dpt(repo, citekey, addr):
+def to_dpt(repo, citekey, addr, sessions=None):
     # Get the DPT IP address
     try:
-        dpt_obj = connect_to_dpt(addr)
+        if sessions is not None:
+            dpt_obj = sessions.get(addr)
+        else:
+            dpt_obj = connect_to_dpt(addr)
     except OSError:
         print(
             "Unable to reach device, verify it is connected to the same network segment."
         )
         sys.exit(1)
 
-    # FIXME
-    lib_path = repo.conf["main"]["pubsdir"]
-    m = re.search("(?<=/)[^/]+$", lib_path)
-    lib_name = m.group(0)
+    lib_name = library_name(repo)
 
     # Create document
     doc = Document(key=citekey, repo=repo, lib_name=lib_name)
@@ -258,7 +1219,12 @@ def to_dpt(repo, citekey, addr):
     notification.close()
 
     # remote_path = doc.to_dptrp1(dpt_obj)
-    remote_path = async_result.get()
+    try:
+        remote_path = async_result.get()
+    except Exception:
+        if sessions is not None:
+            sessions.invalidate(addr)
+        raise
 
     return remote_path
 
@@ -272,14 +1238,19 @@ def show_sent_file(notification: str, action_name, data):
     action_name : str
         Action on the notification
     data :
-        Data passed to the notification.
+        Data passed to the notification: address of the device, path of the
+        document in the device and, optionally, a :obj:`DptSessionPool`.
 
     """
     addr = data[0]
     remote_path = data[1]
+    sessions = data[2] if len(data) > 2 else None
 
     try:
-        dpt_obj = connect_to_dpt(addr)
+        if sessions is not None:
+            dpt_obj = sessions.get(addr)
+        else:
+            dpt_obj = connect_to_dpt(addr)
     except OSError:
         print(
             "Unable to reach device, verify it is connected to the same network segment."
@@ -290,23 +1261,107 @@ def show_sent_file(notification: str, action_name, data):
     dpt_obj.display_document(info["entry_id"], 1)
 
 
-def sync_annotated_docs(args):
-    # Get the DPT IP address
-    addr = args.addr
+def _download(dpt, inventory, addr, remote_path, target):
+    """Download a document from the device and mark it as synchronized."""
+    data = dpt.download(str(remote_path))
+    write_atomic(target, data)
+    inventory.synced(addr, remote_path, hashlib.sha256(data).hexdigest())
 
-    try:
-        dpt_obj = connect_to_dpt(addr)
-    except OSError:
-        print(
-            "Unable to reach device, verify it is connected to the same network segment."
-        )
-        sys.exit(1)
 
+def sync_annotated_docs(
+    dpt, addr, docs, inventory, mode="copy", dry_run=False, parallel=2
+):
+    """Download the documents that were annotated in the device.
 
-def get_dptrp1_addr():
-    sp = subprocess.run(
-        ["avahi-resolve", "-4", "-n", "digitalpaper.local"], stdout=subprocess.PIPE
-    )
+    The documents in the device are listed, and their revisions compared with
+    the ones recorded at the last synchronization. Only the changed documents
+    (and notes) are downloaded, at most `parallel` at the same time.
+
+    Parameters
+    ----------
+    dpt : :obj:`DigitalPaper`
+    addr : str
+        Address of the device.
+    docs : list[:obj:`Document`]
+        Documents of the library.
+    inventory : :obj:`DptInventory`
+        Inventory of the documents in the device.
+    mode : str
+        ``replace`` overwrites the documents of the library, ``copy`` stores a
+        versioned copy next to them.
+    dry_run : bool
+        Only report the documents that would be downloaded.
+    parallel : int
+        Maximum number of concurrent downloads.
+
+    Returns
+    -------
+    list[tuple] :
+        Tuples ``(citekey, remote_path, local_path)`` for each changed
+        document. When not in dry-run, `local_path` is None if the download
+        failed.
+
+    """
+    docs = [doc for doc in docs if doc.local_path() is not None]
+    folders = {doc.remote_path().parent for doc in docs} | {NOTE_FOLDER}
+    for folder in sorted(folders):
+        try:
+            inventory.refresh(addr, dpt, folder, force=True)
+        except Exception as e:
+            print(f"Unable to list {folder}: {e}")
+
+    pending = []
+    for doc in docs:
+        if doc._is_annotated(inventory, addr):
+            pending.append(doc)
+        elif not dry_run and inventory.lookup(addr, doc.remote_path()):
+            # Use the current revision as reference for the next sync
+            inventory.synced(addr, doc.remote_path())
+
+    if dry_run:
+        return [(d._key, d.remote_path(), d.annotated_path(mode)) for d in pending]
+
+    def fetch(doc):
+        try:
+            return (
+                doc._key,
+                doc.remote_path(),
+                doc.get_annotations(dpt, inventory, addr, mode),
+            )
+        except Exception as e:
+            print(f"Unable to download {doc.remote_path()}: {e}")
+            return doc._key, doc.remote_path(), None
+
+    def fetch_notes(doc):
+        try:
+            return doc.get_notes(dpt, inventory, addr)
+        except Exception as e:
+            print(f"Unable to download the notes of {doc.remote_path()}: {e}")
+            return None
+
+    with ThreadPool(processes=parallel) as pool:
+        report = pool.map(fetch, pending)
+        notes = pool.map(fetch_notes, docs)
+
+    report += [
+        (doc._key, NOTE_FOLDER / doc._gen_file_name(), path)
+        for doc, path in zip(docs, notes)
+        if path is not None
+    ]
+    inventory.save()
+
+    return report
+
+
+def get_dptrp1_addr(hostname="digitalpaper.local", timeout=None):
+    try:
+        sp = subprocess.run(
+            ["avahi-resolve", "-4", "-n", hostname],
+            stdout=subprocess.PIPE,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
     stdout = sp.stdout.decode("UTF-8")
     m = re.search("\\t[0-9\.]+\\n", stdout)
     try:
@@ -0,0 +1,195 @@
+import cProfile
+import gc
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from types import FunctionType, ModuleType
+
+# Not followed when measuring the size of an object: they are shared by the
+# whole program
+_SHARED_TYPES = (type, ModuleType, FunctionType)
+
+
+class CommandProfiler:
+    """Deterministic profile (cProfile) of the thread running the commands.
+
+    It must be started and stopped from the same thread.
+
+    """
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self, prefix: str, top: int = 40):
+        """Write the statistics.
+
+        Returns
+        -------
+        list[str] :
+            The ``.prof`` file, readable with `pstats` or snakeviz, and a
+            ``.txt`` file with the functions of largest cumulative time.
+
+        """
+        self._profile.dump_stats(prefix + ".prof")
+        out = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(top)
+        with open(prefix + ".txt", "w") as f:
+            f.write(out.getvalue())
+
+        return [prefix + ".prof", prefix + ".txt"]
+
+
+class SamplingProfiler:
+    """Statistical profile of all the threads of the server.
+
+    A background thread records the call stack of every other thread at a
+    fixed interval, so that the worker threads (uploads, metadata updates,
+    inbox) are profiled as well, with a small overhead.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between two samples.
+
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self._interval = interval
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                        + f":{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, prefix: str, top: int = 40):
+        """Write the samples.
+
+        Returns
+        -------
+        list[str] :
+            The ``.folded`` file (one stack per line, as expected by
+            flamegraph tools) and a ``.txt`` file with the functions found
+            most often, at the top of the stack (self) or anywhere in it
+            (total).
+
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self._stacks.items():
+            own[stack[-1]] += count
+            for func in set(stack[1:]):
+                total[func] += count
+
+        with open(prefix + ".folded", "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(";".join(stack) + f" {count}\n")
+
+        n = max(self.samples, 1)
+        with open(prefix + ".txt", "w") as f:
+            f.write(f"{self.samples} samples every {self._interval * 1e3:g} ms\n")
+            for title, counter in (("Self", own), ("Total", total)):
+                f.write(f"\n{title} (% of the samples, summed over the threads)\n")
+                for func, count in counter.most_common(top):
+                    f.write(f"{100 * count / n:8.1f}  {func}\n")
+
+        return [prefix + ".folded", prefix + ".txt"]
+
+
+def deep_size(obj):
+    """Number and total size of the objects reachable from an object.
+
+    Classes, modules and functions are not followed.
+
+    Returns
+    -------
+    count : int
+    size : int
+        In bytes, as given by `sys.getsizeof`.
+
+    """
+    seen = set()
+    count = 0
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SHARED_TYPES):
+            continue
+        seen.add(id(o))
+        count += 1
+        size += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+
+    return count, size
+
+
+def heap_summary(components: dict, top: int = 15):
+    """Memory used by the components of the server.
+
+    Parameters
+    ----------
+    components : dict
+        Maps a name to the object to measure. The objects shared between
+        components are counted in each of them.
+    top : int
+        Number of types reported among all the objects tracked by the
+        garbage collector.
+
+    Returns
+    -------
+    dict :
+        Objects and bytes of each component, the most frequent types of
+        objects and the resident memory of the process.
+
+    """
+    start = time.perf_counter()
+    summary = {"components": {}}
+    for name, obj in components.items():
+        count, size = deep_size(obj)
+        summary["components"][name] = {"objects": count, "bytes": size}
+
+    types = Counter(type(o).__name__ for o in gc.get_objects())
+    summary["gc_objects"] = sum(types.values())
+    summary["types"] = dict(types.most_common(top))
+    with open("/proc/self/statm") as f:
+        summary["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    summary["elapsed_s"] = time.perf_counter() - start
+
+    return summary
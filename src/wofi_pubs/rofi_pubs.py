@@ -2,19 +2,19 @@
 
 import argparse
 import configparser
-import json
 import os
 import re
 import shlex
 import subprocess
-from multiprocessing.connection import Client
 from os.path import expandvars
 
-import bibtexparser
-
+from wofi_pubs.offline import connect
 from wofi_pubs.rofi import Rofi
+from wofi_pubs.state import default_state_dir
+from wofi_pubs.tracing import open_tracer
 
-from .dialogs import choose_file, choose_two_files, get_user_input
+# The GTK dialogs and bibtexparser are slow to import and only needed to add
+# references, so they are imported there to keep the start-up of the menu fast
 
 DEFAULT_CONFIG = expandvars("${XDG_CONFIG_HOME}/wofi-pubs/config")
 
@@ -47,7 +47,17 @@ class RofiPubs:
         self._default_lib: str | None = None
         self._parse_config()
         self._libs_entries: dict[str, str] = dict()
-        self._conn = Client(("localhost", 6000))
+        self._tracer = open_tracer(self._trace_file, "rofi")
+        if self._tracer is not None:
+            self._tracer.event(None, "client-start")
+        # Read-only mode from the snapshot while the server is starting
+        self._conn = connect(
+            ("localhost", 6000),
+            config,
+            self._state_dir,
+            self._pdfviewer,
+            tracer=self._tracer,
+        )
         self.keys = self.get_keys()
 
         self._rofi: Rofi = Rofi()
@@ -72,6 +82,8 @@ class RofiPubs:
             "cache_libs": "$HOME/.local/tmp/pubs_wofi_libs",
             "terminal_edit": "$TERM -e nvim",
             "editor": "$TERM -e nvim",
+            "state_dir": "",
+            "trace_file": "",
         }
 
         conf_ = config_parser["general"]
@@ -85,6 +97,8 @@ class RofiPubs:
         self._cache_libs = expandvars(conf_.get("cache_libs"))
         self._terminal = conf_.get("TERMINAL_EDIT")
         self._editor = expandvars(conf_.get("editor"))
+        self._state_dir = expandvars(conf_.get("state_dir")) or default_state_dir()
+        self._trace_file = expandvars(conf_.get("trace_file"))
         self._dpt_devices = expandvars("${HOME}/.dpapp/devices.json")
 
     def get_keys(self):
@@ -137,6 +151,8 @@ class RofiPubs:
         options.update(self.keys)
 
         while not (key == self.quit_key or key == self.esc_key):
+            if self._tracer is not None:
+                self._tracer.event(self._conn.last_id, "picker-spawn")
             indices, key = self._rofi.select(
                 "Filter: ",
                 # [header_filter(d) for d in menu_entries],
@@ -144,6 +160,8 @@ class RofiPubs:
                 select=indices,
                 **options,
             )
+            if self._tracer is not None:
+                self._tracer.event(self._conn.last_id, "picker-exit")
             citekey = keys[indices[0]]
             if indices == [-1]:
                 indices = []
@@ -166,17 +184,15 @@ class RofiPubs:
                 self.menu_add(library)
                 key = -1
             if key == self.open_key:
+                ops = []
                 for k in indices:
-                    key_i = keys[k]
-                    self._conn.send(
-                        {"cmd": "open-document", "library": library, "citekey": key_i}
-                    )
-                    self._conn.send(
-                        {"cmd": "update-list-order", "library": library, "index": k}
-                    )
+                    ops.append({"cmd": "open-document", "citekey": keys[k]})
+                    ops.append({"cmd": "update-list-order", "index": k})
+                self._conn.send({"cmd": "batch", "library": library, "ops": ops})
+                self._conn.recv()
                 key = -1
             elif key == self.send_dpt_key:
-                self._send_to_dptrp1(library, citekey)
+                self._send_to_dptrp1(library, [keys[k] for k in indices])
                 key = -1
             elif key == self.send_mail_key:
                 self._conn.send(
@@ -185,7 +201,11 @@ class RofiPubs:
                 key = -1
             elif key == self.export_key:
                 self._conn.send(
-                    {"cmd": "export-reference", "library": library, "citekey": citekey}
+                    {
+                        "cmd": "export-references",
+                        "library": library,
+                        "citekeys": [keys[k] for k in indices],
+                    }
                 )
             elif key == self.update_meta_key:
                 self._conn.send(
@@ -290,6 +310,8 @@ class RofiPubs:
 
 
         """
+        from .dialogs import get_user_input
+
         doi, doc = get_user_input("DOI:", description="Import reference by DOI")
 
         args = PubsArgs()
@@ -306,6 +328,8 @@ class RofiPubs:
             Path to the configuration file of the library.
 
         """
+        from .dialogs import get_user_input
+
         arxiv, doc = get_user_input("ArXiv:", description="Import reference by Arxiv")
 
         args = PubsArgs()
@@ -323,6 +347,8 @@ class RofiPubs:
             Path to the configuration file of the library.
 
         """
+        from .dialogs import get_user_input
+
         isbn, doc = get_user_input("ISBN:", description="Import reference by ISBN")
 
         args = PubsArgs()
@@ -339,6 +365,10 @@ class RofiPubs:
             Path to the configuration file of the library.
 
         """
+        import bibtexparser
+
+        from .dialogs import choose_two_files
+
         bibfile, doc = choose_two_files(
             text="Bibfile:",
             description="Import reference from Bibfile",
@@ -371,6 +401,8 @@ class RofiPubs:
         p = subprocess.Popen(cmd_args)
         p.wait()
 
+        from .dialogs import choose_file
+
         doc = choose_file("PDF:", "Choose a PDF file", filter="pdf")
 
         args = PubsArgs()
@@ -379,23 +411,26 @@ class RofiPubs:
 
         self._conn.send({"cmd": "add-reference", "library": library, "args": args})
 
-    def _send_to_dptrp1(self, library, citekey):
-        """Send document to Sony DPT-RP1
+    def _send_to_dptrp1(self, library, citekeys):
+        """Send documents to Sony DPT-RP1
 
         Parameters
         ----------
         library : str
             Path to the configuration file of the library.
-        citekey : str
-            Citekey for the publication.
+        citekeys : list[str]
+            Citekeys of the selected publications.
 
         """
-        # Read ip addresses from config file
-        devices_addr = self._dpt_devices
-        with open(devices_addr, "r") as dev:
-            devices = json.load(dev)
+        # Get the known devices from the server
+        self._conn.send({"cmd": "get-devices"})
+        devices = self._conn.recv()
 
-        menu_ = [(k, val) for k, val in devices.items()]
+        menu_ = [
+            (name, addr + (" <i>(offline)</i>" if reachable is False else ""))
+            for name, addr, reachable in devices
+        ]
+        menu_.append(("All devices", "reachable devices"))
 
         menu_str = [f"{ico}\t\t <b>{opt}</b>" for ico, opt in menu_]
 
@@ -415,14 +450,22 @@ class RofiPubs:
             )
             if len(indices) == 0:
                 key = -1
+            elif indices[0] == len(devices):
+                self._conn.send(
+                    {
+                        "cmd": "send-to-all-devices",
+                        "library": library,
+                        "citekeys": citekeys,
+                    }
+                )
             else:
-                addr = menu_[indices[0]][1]
+                addr = devices[indices[0]][1]
                 self._conn.send(
                     {
                         "cmd": "send-to-device",
                         "addr": addr,
                         "library": library,
-                        "citekey": citekey,
+                        "citekeys": citekeys,
                     }
                 )
             break
@@ -461,8 +504,6 @@ def name_library(config_file):
 
     """
     m = re.match(r"^.*/([a-zA-Z\._-]+)\.conf$", config_file)
-    print(config_file)
-    print(m)
 
     return m.group(1)
 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Rofi script mode for wofi-pubs.
+
+Instead of starting a new ``rofi -dmenu`` after every action, a single rofi
+process stays open and calls this script, which asks the running server for
+the current rows. Opening, editing or exporting a reference refreshes the
+view without closing rofi::
+
+    rofi -show pubs -modi "pubs:rofi-pubs-script"
+    rofi -show pubs -modi "pubs:rofi-pubs-script --library ~/.config/pubs/work.conf"
+
+Enter opens the document; the custom keybindings of rofi trigger the other
+actions (``kb-custom-1`` edit, ``kb-custom-2`` export, ``kb-custom-3`` update
+the PDF metadata, ``kb-custom-4`` send to all the devices). By default they are
+bound to Alt+1 to Alt+4, and can be changed with e.g. ``-kb-custom-1
+Control-e -kb-move-end ""``.
+
+"""
+
+import argparse
+import configparser
+import os
+import re
+import sys
+from multiprocessing.connection import Client
+from os.path import expanduser, expandvars
+
+ADDRESS = ("localhost", 6000)
+DEFAULT_CONFIG = expandvars("${XDG_CONFIG_HOME}/wofi-pubs/config")
+
+# Value of ROFI_RETV for each action
+RETV_INIT = 0
+RETV_SELECT = 1
+ACTIONS = {
+    RETV_SELECT: ("open-document", "Opened"),
+    10: ("edit-reference", "Edited"),
+    11: ("export-reference", "Exported"),
+    12: ("update-pdf-metadata", "Updated metadata of"),
+    13: ("send-to-all-devices", "Sending"),
+}
+HELP = "<b>Enter</b> open  <b>Alt+1</b> edit  <b>Alt+2</b> export  " + (
+    "<b>Alt+3</b> metadata  <b>Alt+4</b> send to devices"
+)
+
+
+def default_library(config: str):
+    """Read the default library from the configuration file."""
+    try:
+        with open(config, "r") as f:
+            file_content = "[general]\n" + f.read()
+    except OSError:
+        file_content = "[general]\n"
+
+    config_parser = configparser.RawConfigParser()
+    config_parser.read_string(file_content)
+    config_parser["DEFAULT"] = {"default_lib": "$HOME/.config/pubs/main_lib.conf"}
+
+    return expandvars(config_parser["general"].get("default_lib"))
+
+
+def option(name: str, value: str):
+    """Line setting an option of the rofi mode."""
+    return f"\0{name}\x1f{value}\n"
+
+
+def row(entry: str, citekey: str):
+    """Row of the menu: the entry of the server on a single line."""
+    text = re.sub(r"\s+", " ", entry.rstrip("\0")).strip()
+    return f"{text}\0info\x1f{citekey}\n"
+
+
+def main():
+    pars = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    pars.add_argument("-c", "--config", type=str, default=DEFAULT_CONFIG)
+    pars.add_argument("-l", "--library", type=str, default=None)
+    pars.add_argument("selection", nargs="*", help="Passed by rofi")
+    args = pars.parse_args()
+
+    retv = int(os.environ.get("ROFI_RETV", RETV_INIT))
+    # The library is kept by rofi between the calls
+    library = os.environ.get("ROFI_DATA") or args.library
+    library = expanduser(library) if library else default_library(args.config)
+    citekey = os.environ.get("ROFI_INFO")
+
+    out = [
+        option("prompt", "Filter"),
+        option("markup-rows", "true"),
+        option("keep-selection", "true"),
+        option("data", library),
+    ]
+
+    try:
+        conn = Client(ADDRESS)
+    except OSError:
+        out.append(option("message", "The wofi-pubs server is not running"))
+        sys.stdout.write("".join(out))
+        return
+
+    message = HELP
+    try:
+        if retv in ACTIONS and citekey:
+            cmd, done = ACTIONS[retv]
+            msg = {"cmd": cmd, "library": library, "citekey": citekey}
+            if cmd == "send-to-all-devices":
+                msg["citekeys"] = [citekey]
+            conn.send(msg)
+            message = f"{done} <b>{citekey}</b>    {HELP}"
+
+        conn.send({"cmd": "get-publication-list", "library": library, "tag": None})
+        entries, keys = conn.recv()
+
+        if retv == RETV_SELECT and citekey in keys:
+            # Same order as the other clients: last opened first
+            conn.send(
+                {
+                    "cmd": "update-list-order",
+                    "library": library,
+                    "index": keys.index(citekey),
+                }
+            )
+    finally:
+        conn.close()
+
+    out.append(option("message", message))
+    out += [row(entry, key) for entry, key in zip(entries, keys)]
+    sys.stdout.write("".join(out))
+
+
+if __name__ == "__main__":
+    main()
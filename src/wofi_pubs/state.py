@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def default_state_dir():
+    """Directory of the state of wofi-pubs, following the XDG base directories.
+
+    Returns
+    -------
+    str :
+        ``$XDG_STATE_HOME/wofi-pubs``, or ``$HOME/.local/state/wofi-pubs`` if
+        the variable is not set.
+
+    """
+    state_home = os.environ.get("XDG_STATE_HOME") or os.path.expanduser(
+        "~/.local/state"
+    )
+    return os.path.join(state_home, "wofi-pubs")
+
+
+def load_state(path, default=None):
+    """Load a persisted JSON record.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file.
+    default :
+        Value returned when the file does not exist or cannot be parsed.
+
+    Returns
+    -------
+    The content of the file.
+
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {} if default is None else default
+
+
+def save_state(path, data):
+    """Write a JSON record atomically.
+
+    The data is written to a temporary file in the same directory, which is
+    then moved over the old record, so that a crash never leaves a truncated
+    file behind.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file.
+    data :
+        JSON serializable object.
+
+    """
+    write_atomic(path, json.dumps(data, indent=1))
+
+
+def write_atomic(path, text: str | bytes):
+    """Replace the content of `path` with `text` atomically.
+
+    Parameters
+    ----------
+    path : str
+        Path to the output file.
+    text : str or bytes
+        New content of the file.
+
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb" if isinstance(text, bytes) else "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,164 @@
+import threading
+from bisect import bisect_left
+
+# Upper bounds of the buckets of the histograms, in milliseconds
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """Histogram of latencies with fixed buckets.
+
+    Recording a value only increments a counter, so that the histograms can
+    be kept for every command without growing with the uptime of the server.
+
+    """
+
+    def __init__(self):
+        # The last bucket counts the values above the largest bound
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def n(self):
+        return sum(self.counts)
+
+    def record(self, seconds: float):
+        ms = seconds * 1e3
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float):
+        """Upper bound of the bucket containing the `q` percentile (in ms)."""
+        n = self.n
+        if n == 0:
+            return 0.0
+        rank = q / 100 * n
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        n = self.n
+        return {
+            "n": n,
+            "mean_ms": self.total / n if n else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max,
+            "buckets_ms": list(BUCKETS_MS),
+            "counts": list(self.counts),
+        }
+
+
+class _Counters:
+    def __init__(self):
+        self.queue = LatencyHistogram()
+        self.handler = LatencyHistogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+
+    def record(self, queue, handler, bytes_in, bytes_out, error):
+        self.queue.record(queue)
+        self.handler.record(handler)
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.errors += error
+
+    def as_dict(self):
+        return {
+            "n": self.handler.n,
+            "errors": self.errors,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "queue": self.queue.as_dict(),
+            "handler": self.handler.as_dict(),
+        }
+
+
+class CommandStats:
+    """Latency and traffic of the commands handled by the server.
+
+    For every command, and for every command on each library, the time spent
+    waiting for the server (queue), the time spent running the command
+    (handler) and the bytes received and sent are kept.
+
+    """
+
+    def __init__(self):
+        self._commands: dict[str, _Counters] = dict()
+        self._libraries: dict[str, dict[str, _Counters]] = dict()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        cmd: str,
+        library: str | None,
+        queue: float,
+        handler: float,
+        bytes_in: int,
+        bytes_out: int,
+        error: bool = False,
+    ):
+        """Record a handled command.
+
+        Parameters
+        ----------
+        cmd : str
+            Name of the command.
+        library : str
+            Library of the command, if any.
+        queue : float
+            Seconds between the reception of the command and its start.
+        handler : float
+            Seconds spent running the command.
+        bytes_in : int
+            Size of the message.
+        bytes_out : int
+            Size of the replies.
+        error : bool
+            Whether the command failed.
+
+        """
+        with self._lock:
+            counters = [self._commands.setdefault(cmd, _Counters())]
+            if library:
+                lib = self._libraries.setdefault(library, {})
+                counters.append(lib.setdefault(cmd, _Counters()))
+            for c in counters:
+                c.record(queue, handler, bytes_in, bytes_out, error)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "commands": {k: c.as_dict() for k, c in self._commands.items()},
+                "libraries": {
+                    lib: {k: c.as_dict() for k, c in cmds.items()}
+                    for lib, cmds in self._libraries.items()
+                },
+            }
+
+    def summary(self):
+        """One line per command, for the log of the server."""
+        with self._lock:
+            lines = []
+            for cmd, c in sorted(self._commands.items()):
+                h = c.handler
+                lines.append(
+                    f"{cmd}: n={h.n} p50={h.percentile(50):.2f}ms "
+                    + f"p99={h.percentile(99):.2f}ms max={h.max:.2f}ms "
+                    + f"queue_p99={c.queue.percentile(99):.2f}ms "
+                    + f"in={c.bytes_in}B out={c.bytes_out}B errors={c.errors}"
+                )
+            return lines
+
+
+def hit_rate(hits: int, misses: int):
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "rate": hits / total if total else None}
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Trace of the requests between the clients and the server.
+
+When ``trace_file`` is set in the configuration, the clients and the server
+append events to it as JSON lines. The clients add a request ID to every
+message, which the server copies to its own events, so that the timeline of
+each request can be rebuilt across the processes::
+
+    client-start, connected                 client
+    client-send                             client
+    server-recv, handler-start, handler-end server   (reply sent)
+    handler-done                            server
+    client-recv                             client
+    picker-spawn, picker-exit               client
+
+The timestamps come from the monotonic clock, which is shared by all the
+processes on Linux. Without ``trace_file`` no tracer is created, and the
+connection is not wrapped, so tracing costs nothing.
+
+Running this module prints the critical path of every menu open found in a
+trace::
+
+    wofi-pubs-trace ~/.local/state/wofi-pubs/trace.jsonl
+
+"""
+
+import json
+import os
+import time
+
+
+class Tracer:
+    """Writer of trace events.
+
+    Every event is written with a single ``write`` on a file opened in append
+    mode, so that the lines of several processes are not mixed.
+
+    Parameters
+    ----------
+    path : str
+        JSON-lines file.
+    process : str
+        Name of the process writing the events (``server``, ``wofi``,
+        ``rofi``).
+
+    """
+
+    def __init__(self, path, process):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._process = process
+        self.session = f"{process}-{os.getpid()}-{int(time.time())}"
+        self._count = 0
+
+    def new_id(self):
+        """Unique ID for a new request."""
+        self._count += 1
+        return f"{self.session}-{self._count}"
+
+    def event(self, rid, phase, t=None, **fields):
+        """Write an event.
+
+        Parameters
+        ----------
+        rid : str
+            ID of the request, None for the events of the session.
+        phase : str
+            Name of the event.
+        t : float
+            Time of the event (`time.monotonic`), now by default.
+        **fields :
+            Additional information (command, library, sizes...).
+
+        """
+        record = {
+            "t": time.monotonic() if t is None else t,
+            "id": rid,
+            "phase": phase,
+            "process": self._process,
+            "session": self.session,
+        }
+        record.update(fields)
+        os.write(self._fd, (json.dumps(record) + "\n").encode("UTF-8"))
+
+
+def open_tracer(path, process):
+    """Tracer writing to `path`, or None if tracing is disabled."""
+    return Tracer(path, process) if path else None
+
+
+class TracedConnection:
+    """Connection to the server adding a request ID to every message.
+
+    The clients wait for the reply right after sending the request, so a
+    reply belongs to the last request sent.
+
+    Parameters
+    ----------
+    conn : :obj:`Connection`
+    tracer : :obj:`Tracer`
+
+    """
+
+    def __init__(self, conn, tracer):
+        self._conn = conn
+        self._tracer = tracer
+        self.last_id = None
+
+    def send(self, msg: dict):
+        rid = self._tracer.new_id()
+        self.last_id = rid
+        self._tracer.event(
+            rid, "client-send", cmd=msg.get("cmd"), library=msg.get("library")
+        )
+        self._conn.send(dict(msg, trace=rid))
+
+    def recv(self):
+        obj = self._conn.recv()
+        self._tracer.event(self.last_id, "client-recv")
+        return obj
+
+    def close(self):
+        self._conn.close()
+
+
+# Segments of the critical path of a menu open, between two events
+CRITICAL_PATH = (
+    ("startup", "client-start", "connected"),
+    ("request", "connected", "client-send"),
+    ("transfer", "client-send", "server-recv"),
+    ("queue", "server-recv", "handler-start"),
+    ("handler", "handler-start", "handler-end"),
+    ("reply", "handler-end", "client-recv"),
+    ("render", "client-recv", "picker-spawn"),
+    ("picker", "picker-spawn", "picker-exit"),
+)
+
+
+def read_trace(path):
+    """Read the events of a trace file, skipping the invalid lines."""
+    events = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+
+    return events
+
+
+def menu_opens(events):
+    """Critical path of the menu opens found in the trace.
+
+    A menu open is the first ``get-publication-list`` request of a client
+    session, together with the start of the session and the picker shown
+    after it.
+
+    Returns
+    -------
+    list[dict] :
+        For each menu open, the session, the command and the duration in
+        milliseconds of each segment of :data:`CRITICAL_PATH` found.
+
+    """
+    requests = dict()
+    sessions = dict()
+    for ev in events:
+        if ev["id"] is None:
+            sessions.setdefault(ev["session"], {})[ev["phase"]] = ev["t"]
+        else:
+            # The first event of each phase, e.g. the first picker shown
+            requests.setdefault(ev["id"], {}).setdefault(ev["phase"], ev)
+            if ev["phase"] == "client-send":
+                sessions.setdefault(ev["session"], {}).setdefault("requests", [])
+                sessions[ev["session"]]["requests"].append(ev)
+
+    opens = []
+    for session, info in sessions.items():
+        sends = [
+            r for r in info.get("requests", []) if r["cmd"] == "get-publication-list"
+        ]
+        if not sends:
+            continue
+        rid = sends[0]["id"]
+        times = {phase: ev["t"] for phase, ev in requests[rid].items()}
+        times.update((k, v) for k, v in info.items() if k != "requests")
+        segments = dict()
+        for name, start, end in CRITICAL_PATH:
+            if start in times and end in times:
+                segments[name] = (times[end] - times[start]) * 1e3
+        opens.append(
+            {"session": session, "library": sends[0].get("library"), **segments}
+        )
+
+    return opens
+
+
+def main():
+    import argparse
+    import statistics
+
+    pars = argparse.ArgumentParser(description="Critical path of the menu opens")
+    pars.add_argument("trace", type=str, help="Trace file (JSON lines)")
+    pars.add_argument("--last", type=int, default=10, help="Menu opens listed")
+    args = pars.parse_args()
+
+    opens = menu_opens(read_trace(args.trace))
+    if not opens:
+        print("No menu open found in the trace")
+        return
+
+    names = [name for name, *_ in CRITICAL_PATH]
+    print(f"{'session':<32}" + "".join(f"{n:>10}" for n in names))
+    for op in opens[-args.last :]:
+        cells = "".join(f"{op[n]:10.1f}" if n in op else f"{'-':>10}" for n in names)
+        print(f"{op['session']:<32}{cells}")
+
+    print(f"\nMedian of {len(opens)} menu opens (ms):")
+    for name in names:
+        values = [op[name] for op in opens if name in op]
+        if values:
+            print(f"  {name:<10} {statistics.median(values):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
+import hashlib
+import json
+import os
 import subprocess
+from multiprocessing.pool import ThreadPool
 from os.path import expanduser
 
+from .pdf_info import PdfInfoError, read_info, write_info
+from .state import load_state, save_state
 
-def update_pdf_metadata(repo, citekey):
+
+def update_pdf_metadata(repo, citekey, exiftool=None, backend="exiftool"):
     """Update the metadata of pdf file.
 
     Parameters
     ----------
     repo : TODO
     citekey : TODO
+    exiftool : :obj:`ExifTool`
+        Running exiftool process. If not given, a new process is started.
+    backend : str
+        Either ``exiftool`` or ``native``.
 
     Returns
     -------
@@ -16,8 +27,28 @@ def update_pdf_metadata(repo, citekey):
 
     """
     bib = repo.databroker.pull_bibentry(citekey)[citekey]
+    title, author = pdf_metadata_fields(bib)
+
+    local_path = expanduser(repo.pull_docpath(citekey))
+    write_pdf_metadata(local_path, title, author, exiftool, backend)
+
+    return 1
 
-    # Get the needed information
+
+def pdf_metadata_fields(bib):
+    """Get the title and author to be written to the PDF file.
+
+    Parameters
+    ----------
+    bib : dict
+        Bibliographic data of the paper.
+
+    Returns
+    -------
+    title : str
+    author : str
+
+    """
     if bib["ENTRYTYPE"] == "misc":
         author = bib["organization"]
         title = bib["title"]
@@ -25,15 +56,203 @@ def update_pdf_metadata(repo, citekey):
         author = short_authors(bib)
         title = bib["title"]
 
-    local_path = expanduser(repo.pull_docpath(citekey))
+    return title, author
+
+
+def write_pdf_metadata(local_path, title, author, exiftool=None, backend="exiftool"):
+    """Write title and author into the PDF file.
 
-    exiftool_cmd = [
-        'exiftool', f'-Title={title}', f'-Author={author}', '-Creator=',
+    With the ``native`` backend, the metadata is appended to the file as an
+    incremental update. Files that cannot be updated this way (e.g.
+    encrypted files) are handled by exiftool.
+
+    Parameters
+    ----------
+    local_path : str
+        Path to the PDF file.
+    title : str
+    author : str
+    exiftool : :obj:`ExifTool`
+        Running exiftool process. If not given, a new process is started.
+    backend : str
+        Either ``exiftool`` or ``native``.
+
+    Returns
+    -------
+    bool :
+        True if the metadata was written.
+
+    """
+    if backend == "native":
+        try:
+            write_info(local_path, title, author)
+            return True
+        except PdfInfoError as e:
+            print(f"Falling back to exiftool for {local_path}: {e}")
+
+    exiftool_args = [
+        f'-Title={title}', f'-Author={author}', '-Creator=',
         '-overwrite_original', local_path
     ]
-    p2 = subprocess.run(exiftool_cmd, check=False)
+    if exiftool is not None:
+        out = exiftool.execute(*exiftool_args)
+        # Unchanged: the file already had these values
+        return "1 image files updated" in out or "1 image files unchanged" in out
 
-    return 1
+    p2 = subprocess.run(['exiftool', *exiftool_args], check=False)
+
+    return p2.returncode == 0
+
+
+def read_pdf_metadata(paths, exiftool=None, backend="exiftool"):
+    """Read the embedded title and author of several PDF files at once.
+
+    Parameters
+    ----------
+    paths : list[str]
+        Paths to the PDF files.
+    exiftool : :obj:`ExifTool`
+        Running exiftool process. If not given, a new process is started,
+        reading the paths from its standard input.
+    backend : str
+        Either ``exiftool`` or ``native``. The native backend does not use
+        exiftool at all, files it cannot read are left out of the result.
+
+    Returns
+    -------
+    dict :
+        Maps each path to a tuple ``(title, author)``.
+
+    """
+    if backend == "native":
+        info = {p: read_info(p) for p in paths}
+        return {p: i for p, i in info.items() if i is not None}
+
+    if len(paths) == 0:
+        return {}
+
+    exiftool_args = ["-json", "-Title", "-Author", *paths]
+    if exiftool is not None:
+        out = exiftool.execute(*exiftool_args)
+    else:
+        # The arguments are read from stdin, so that the number of files is
+        # not limited by the maximum length of the command line
+        sp = subprocess.run(
+            ["exiftool", "-@", "-"],
+            input="\n".join(exiftool_args).encode("UTF-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        out = sp.stdout
+    try:
+        tags = json.loads(out)
+    except ValueError:
+        return {}
+
+    return {
+        t["SourceFile"]: (str(t.get("Title", "")), str(t.get("Author", "")))
+        for t in tags
+    }
+
+
+def _fields_hash(title, author):
+    return hashlib.sha1(f"{title}\0{author}".encode("UTF-8")).hexdigest()
+
+
+def update_pdf_metadata_bulk(
+    docs, record_file, processes=4, progress=None, exiftool=None, backend="exiftool"
+):
+    """Update the metadata of many PDF files.
+
+    Files whose metadata already correspond to the bibliographic data are
+    skipped. A record with the modification time, size and a hash of the
+    written fields is kept for every file, so that unchanged files are
+    detected without reading them. The remaining files are read all at once
+    with a single exiftool call.
+
+    Parameters
+    ----------
+    docs : list[tuple]
+        Tuples ``(path, title, author)`` for each document.
+    record_file : str
+        JSON file with the record of the already updated files.
+    processes : int
+        Number of files updated concurrently. A running exiftool process
+        serves one file at a time, so that files are only updated
+        concurrently with the ``native`` backend or without ``exiftool``.
+    progress : callable
+        Called as ``progress(done, total)`` after each rewritten file.
+    exiftool : :obj:`ExifTool`
+        Running exiftool process. If not given, a new process is started for
+        each file.
+    backend : str
+        Either ``exiftool`` or ``native``.
+
+    Returns
+    -------
+    dict :
+        Lists of the ``rewritten``, ``skipped`` and ``failed`` files.
+
+    """
+    record = load_state(record_file)
+    summary = {"rewritten": [], "skipped": [], "failed": []}
+
+    def stat_key(path):
+        stat = os.stat(path)
+        return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+    def remember(path, h):
+        record[path] = {**stat_key(path), "meta": h}
+
+    unknown = []
+    for path, title, author in docs:
+        h = _fields_hash(title, author)
+        try:
+            key = stat_key(path)
+        except OSError:
+            summary["failed"].append(path)
+            continue
+        if record.get(path) == {**key, "meta": h}:
+            summary["skipped"].append(path)
+        else:
+            unknown.append((path, title, author, h))
+
+    # Files changed since the last run are checked before being rewritten
+    embedded = read_pdf_metadata([d[0] for d in unknown], exiftool, backend)
+    todo = []
+    for path, title, author, h in unknown:
+        if embedded.get(path) == (title, author):
+            remember(path, h)
+            summary["skipped"].append(path)
+        else:
+            todo.append((path, title, author, h))
+
+    def rewrite(doc):
+        path, title, author, h = doc
+        return doc, write_pdf_metadata(path, title, author, exiftool, backend)
+
+    def collect(results):
+        for k, (doc, ok) in enumerate(results):
+            path, _, _, h = doc
+            if ok:
+                remember(path, h)
+                summary["rewritten"].append(path)
+            else:
+                summary["failed"].append(path)
+            if progress is not None:
+                progress(k + 1, len(todo))
+
+    if backend == "native" or exiftool is None:
+        with ThreadPool(processes=processes) as pool:
+            collect(pool.imap_unordered(rewrite, todo))
+    else:
+        # Threads would only queue on the lock of the exiftool process
+        collect(map(rewrite, todo))
+
+    save_state(record_file, record)
+
+    return summary
 
 
 def short_authors(bibdata):
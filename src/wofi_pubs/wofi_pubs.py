@@ -2,21 +2,22 @@
 
 import argparse
 import configparser
-import json
 import os
 import re
 import shlex
 import subprocess
 import sys
 from itertools import chain
-from multiprocessing.connection import Client
 from os.path import expandvars
 
-import bibtexparser
-
 from wofi import Wofi
 
-from .dialogs import choose_file, choose_two_files, get_user_input
+from .offline import connect
+from .state import default_state_dir
+from .tracing import open_tracer
+
+# The GTK dialogs and bibtexparser are slow to import and only needed to add
+# references, so they are imported there to keep the start-up of the menu fast
 
 # from .email import send_doc_per_mail
 
@@ -38,7 +39,17 @@ class WofiPubs:
         self._parse_config()
         self._libs_entries = dict()
         self.notification = None
-        self._conn = Client(("localhost", 6000))
+        self._tracer = open_tracer(self._trace_file, "wofi")
+        if self._tracer is not None:
+            self._tracer.event(None, "client-start")
+        # Read-only mode from the snapshot while the server is starting
+        self._conn = connect(
+            ("localhost", 6000),
+            config,
+            self._state_dir,
+            self._pdfviewer,
+            tracer=self._tracer,
+        )
 
         wofi_options = [
             "--allow-markup",
@@ -86,6 +97,8 @@ class WofiPubs:
             "cache_libs": "$HOME/.local/tmp/pubs_wofi_libs",
             "terminal_edit": "$TERM -e nvim",
             "editor": "$TERM -e nvim",
+            "state_dir": "",
+            "trace_file": "",
         }
 
         conf_ = config_parser["general"]
@@ -99,6 +112,8 @@ class WofiPubs:
         self._cache_libs = expandvars(conf_.get("cache_libs"))
         self._terminal = conf_.get("TERMINAL_EDIT")
         self._editor = expandvars(conf_.get("editor"))
+        self._state_dir = expandvars(conf_.get("state_dir")) or default_state_dir()
+        self._trace_file = expandvars(conf_.get("trace_file"))
         self._dpt_devices = expandvars("${HOME}/.dpapp/devices.json")
 
     def menu_main(self, library="default", tag=None):
@@ -129,6 +144,8 @@ class WofiPubs:
             ("", "Add publication", ""),
             ("", "Search tags", f"{tag_post}"),
             ("", "Sync. repo(s)", ""),
+            ("", "Update PDF metadata", f"{tag_post}"),
+            ("", "Sync. annotations", ""),
         ]
 
         if tag:
@@ -145,7 +162,11 @@ class WofiPubs:
         wofi = self._wofi
         wofi.width = 1000
         wofi.height = 700
+        if self._tracer is not None:
+            self._tracer.event(self._conn.last_id, "picker-spawn")
         selected = wofi.select("Literature", wofi_disp, keep_newlines=True)
+        if self._tracer is not None:
+            self._tracer.event(self._conn.last_id, "picker-exit")
 
         # Check wchich publication was selected
         if selected[0] >= len(menu_):
@@ -161,6 +182,12 @@ class WofiPubs:
                 self.menu_tags(library)
             elif option == "Sync. repo(s)":
                 pass
+            elif option == "Update PDF metadata":
+                self._conn.send(
+                    {"cmd": "update-pdf-metadata-bulk", "library": library, "tag": tag}
+                )
+            elif option == "Sync. annotations":
+                self._sync_annotations(library)
             elif option == "Show all":
                 self.menu_main(library)
 
@@ -336,6 +363,8 @@ class WofiPubs:
 
 
         """
+        from .dialogs import get_user_input
+
         doi, doc = get_user_input("DOI:", description="Import reference by DOI")
 
         args = PubsArgs()
@@ -352,6 +381,8 @@ class WofiPubs:
             Path to the configuration file of the library.
 
         """
+        from .dialogs import get_user_input
+
         arxiv, doc = get_user_input("ArXiv:", description="Import reference by Arxiv")
 
         args = PubsArgs()
@@ -369,6 +400,8 @@ class WofiPubs:
             Path to the configuration file of the library.
 
         """
+        from .dialogs import get_user_input
+
         isbn, doc = get_user_input("ISBN:", description="Import reference by ISBN")
 
         args = PubsArgs()
@@ -385,6 +418,10 @@ class WofiPubs:
             Path to the configuration file of the library.
 
         """
+        import bibtexparser
+
+        from .dialogs import choose_two_files
+
         bibfile, doc = choose_two_files(
             text="Bibfile:",
             description="Import reference from Bibfile",
@@ -417,6 +454,8 @@ class WofiPubs:
         p = subprocess.Popen(cmd_args)
         p.wait()
 
+        from .dialogs import choose_file
+
         doc = choose_file("PDF:", "Choose a PDF file", filter="pdf")
 
         args = PubsArgs()
@@ -479,23 +518,31 @@ class WofiPubs:
 
         return 1
 
-    def _send_to_dptrp1(self, library, citekey):
-        """Send document to Sony DPT-RP1
+    def _select_device(self, all_devices=False):
+        """Present menu to choose a Sony DPT-RP1.
 
         Parameters
         ----------
-        library : str
-            Path to the configuration file of the library.
-        citekey : str
-            Citekey for the publication.
+        all_devices : bool
+            Add an entry to select all the reachable devices.
+
+        Returns
+        -------
+        str or None :
+            Address of the selected device, or None if all the devices were
+            selected.
 
         """
-        # Read ip addresses from config file
-        devices_addr = self._dpt_devices
-        with open(devices_addr, "r") as dev:
-            devices = json.load(dev)
+        # Get the known devices from the server
+        self._conn.send({"cmd": "get-devices"})
+        devices = self._conn.recv()
 
-        menu_ = [(k, val) for k, val in devices.items()]
+        menu_ = [
+            (name, addr + (" <i>(offline)</i>" if reachable is False else ""))
+            for name, addr, reachable in devices
+        ]
+        if all_devices:
+            menu_.append(("All devices", "reachable devices"))
 
         menu_str = "".join(f"{ico}\t\t <b>{opt}</b>\0" for ico, opt in menu_)
         menu_str += "\0"
@@ -507,17 +554,44 @@ class WofiPubs:
 
         selected_addr = wofi.select("...", wofi_disp, keep_newlines=True)
 
-        addr = menu_[selected_addr[0]][1]
+        if selected_addr[0] == len(devices):
+            return None
+        return devices[selected_addr[0]][1]
+
+    def _sync_annotations(self, library):
+        """Download the documents annotated in a Sony DPT-RP1.
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+
+        """
+        addr = self._select_device()
 
         self._conn.send(
-            {
-                "cmd": "send-to-device",
-                "addr": addr,
-                "library": library,
-                "citekey": citekey,
-            }
+            {"cmd": "sync-annotated-docs", "addr": addr, "library": library}
         )
 
+    def _send_to_dptrp1(self, library, citekey):
+        """Send document to Sony DPT-RP1
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+        citekey : str
+            Citekey for the publication.
+
+        """
+        addr = self._select_device(all_devices=True)
+
+        if addr is None:
+            msg = {"cmd": "send-to-all-devices"}
+        else:
+            msg = {"cmd": "send-to-device", "addr": addr}
+        self._conn.send(msg | {"library": library, "citekeys": [citekey]})
+
         self.menu_reference(library, citekey, tag=None)
 
 
@@ -551,8 +625,6 @@ def name_library(config_file):
 
     """
     m = re.match(r"^.*/([a-zA-Z\._-]+)\.conf$", config_file)
-    print(config_file)
-    print(m)
 
     return m.group(1)
 
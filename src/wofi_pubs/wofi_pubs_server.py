@@ -2,10 +2,13 @@ import argparse
 import configparser
 import json
 import os
+import pickle
 import subprocess
 import threading
+import time
 from multiprocessing.connection import Listener
-from os.path import expandvars
+from multiprocessing.reduction import ForkingPickler
+from os.path import expanduser, expandvars
 
 import bibtexparser
 import gi
@@ -20,14 +23,43 @@ from pubs.endecoder import EnDecoder
 from pubs.repo import Paper, Repository
 from pubs.uis import init_ui
 
+from .bibcache import BibTexCache
+from .citations import read_citations, resolve_citations
+from .completion import CompletionIndex, Frecency
+from .devices import DeviceRegistry
 from .email import send_doc_per_mail
-from .print_to_dpt import show_sent_file, to_dpt
-from .update_metadata import update_pdf_metadata
+from .exiftool import ExifTool
+from .ingest import InboxWatcher
+from .offline import write_snapshot
+from .print_to_dpt import (
+    Document,
+    DptInventory,
+    DptSessionPool,
+    DptUploadQueue,
+    library_name,
+    mirror_to_device,
+    show_sent_file,
+    sync_annotated_docs,
+)
+from .profiling import CommandProfiler, SamplingProfiler, heap_summary
+from .state import default_state_dir, write_atomic
+from .stats import CommandStats, hit_rate
+from .tracing import open_tracer
+from .update_metadata import (
+    pdf_metadata_fields,
+    update_pdf_metadata,
+    update_pdf_metadata_bulk,
+)
 
 gi.require_version("Notify", "0.7")
 from gi.repository import GLib, Notify
 
 DEFAULT_CONFIG = expandvars("${XDG_CONFIG_HOME}/wofi-pubs/config")
+ADDRESS = ("localhost", 6000)
+# The completion of citekeys is served on a listener of its own, so that the
+# editors do not wait for the menus that keep their connection open
+COMPLETE_ADDRESS = ("localhost", 6001)
+COMPLETE_COMMANDS = {"complete", "complete-used"}
 
 
 class PubsArgs:
@@ -46,6 +78,28 @@ class PubsArgs:
         self.doc_copy = "copy"
 
 
+class _Replies(list):
+    """Collects the replies of a command run inside a batch."""
+
+    def send(self, obj):
+        self.append(obj)
+
+
+class _CountingConnection:
+    """Connection to a client that counts the bytes sent."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.bytes_out = 0
+        self.sent_at = None
+
+    def send(self, obj):
+        buf = ForkingPickler.dumps(obj)
+        self.sent_at = time.monotonic()
+        self._conn.send_bytes(buf)
+        self.bytes_out += len(buf)
+
+
 class PubsServer:
     """Docstring for WofiPubs.
 
@@ -63,14 +117,62 @@ class PubsServer:
         self.notification = None
         self.entries: dict[str, list[str]] = dict()
         self.keys: dict[str, list[str]] = dict()
+        # Path to the document of each paper, for the clients in read-only mode
+        self._docs: dict[str, dict[str, str]] = dict()
+        # Tags of each paper, so that exports by tag do not load the library
+        self._tags: dict[str, dict[str, set[str]]] = dict()
         self.repos: dict[str, Repository] = dict()
         # Initialize notifications
         Notify.init("Wofi-pubs")
         self.notification = None
         self.last_key_idx: dict[str, int] = {}
+        # Pubs is not thread-safe, background jobs must hold this lock
+        self._lock = threading.RLock()
+        # State of the batch being run, None outside of a batch
+        self._batch: dict | None = None
+        self._started = time.monotonic()
+        self._stats = CommandStats()
+        self._tracer = open_tracer(self._trace_file, "server")
+        # Profiler started with profile-start, and its start time
+        self._profiler = None
+        self._profile_started = None
+        if self._stats_interval > 0:
+            threading.Thread(target=self._dump_stats, daemon=True).start()
+        # Shared by all the operations on the metadata of the PDF files
+        self._exiftool = ExifTool()
+        self._bibtex = BibTexCache(self._state_dir + "/bibtex_cache.json")
+        self._frecency = Frecency(self._state_dir + "/frecency.json")
+        self._completion = CompletionIndex(self._frecency)
+        self._dpt_registry = DeviceRegistry(self._dpt_devices)
+        self._dpt_registry.start()
+        self._dpt_sessions = DptSessionPool()
+        self._dpt_inventory = DptInventory(self._state_dir + "/dpt_inventory.json")
+        self._dpt_uploads = DptUploadQueue(
+            self._dpt_sessions,
+            parallel=self._dpt_parallel_uploads,
+            inventory=self._dpt_inventory,
+        )
 
         self._load_publications()
 
+        self._inbox = None
+        if self._inbox_dir:
+            self._inbox = InboxWatcher(
+                self._inbox_dir,
+                self._state_dir + "/inbox.json",
+                self._ingest_document,
+                workers=self._inbox_workers,
+                interval=self._inbox_interval,
+            )
+            try:
+                self._inbox.start()
+            except FileNotFoundError as e:
+                print(f"Inbox disabled: {e}")
+                self.notification = Notify.Notification.new(
+                    "Wofi-pubs", f"Inbox disabled: {e}"
+                )
+                self.notification.show()
+
     def _parse_config(self):
         """Parse the configuration file."""
         config_file = self._config
@@ -92,6 +194,16 @@ class PubsServer:
             "terminal_edit": "$TERM -e nvim",
             "editor": "$TERM -e nvim",
             "picker": "wofi",
+            "state_dir": "",
+            "inbox_dir": "",
+            "inbox_library": "",
+            "inbox_workers": "2",
+            "inbox_interval": "5",
+            "pdf_metadata_backend": "exiftool",
+            "dpt_parallel_uploads": "2",
+            "dpt_sync_mode": "copy",
+            "stats_interval": "0",
+            "trace_file": "",
         }
 
         conf_ = config_parser["general"]
@@ -107,6 +219,18 @@ class PubsServer:
         self._editor = expandvars(conf_.get("editor"))
         self._dpt_devices = expandvars("${HOME}/.dpapp/devices.json")
         self._picker = conf_.get("picker")
+        self._state_dir = expandvars(conf_.get("state_dir")) or default_state_dir()
+        self._inbox_dir = expandvars(conf_.get("inbox_dir"))
+        self._inbox_library = expandvars(conf_.get("inbox_library"))
+        self._inbox_workers = conf_.getint("inbox_workers")
+        self._inbox_interval = conf_.getfloat("inbox_interval")
+        self._metadata_backend = conf_.get("pdf_metadata_backend")
+        self._dpt_parallel_uploads = conf_.getint("dpt_parallel_uploads")
+        self._dpt_sync_mode = conf_.get("dpt_sync_mode")
+        self._stats_interval = conf_.getfloat("stats_interval")
+        self._trace_file = expandvars(conf_.get("trace_file"))
+        if not self._inbox_library:
+            self._inbox_library = self._default_lib
 
     def load_conf(self, library: str):
         """Load configuration file in pubs.
@@ -155,112 +279,456 @@ class PubsServer:
             conf = self.load_conf(config_path)
 
             repo = Repository(conf)
-            entries = self._gen_menu_entries(repo, tag)
+            papers = list(repo.all_papers())
+            entries = self._gen_menu_entries(repo, tag, papers)
             menu_entries, keys = zip(*entries)
+            self._completion.build(config_path, papers)
 
             self.entries[config_path] = [p for p in menu_entries]
             self.keys[config_path] = [k for k in keys]
+            self._docs[config_path] = {
+                p.citekey: self._docpath(repo, p) for p in papers if p.docpath
+            }
+            self._tags[config_path] = {p.citekey: set(p.tags) for p in papers}
             self.repos[config_path] = repo
             # Set last entry item
             self.last_key_idx[config_path] = 0
 
-    def start_listening(self):
+        self._save_snapshot()
+
+    @staticmethod
+    def _docpath(repo: Repository, paper: Paper):
+        return content.system_path(repo.databroker.real_docpath(paper.docpath))
+
+    def _save_snapshot(self):
+        """Save the menu of the libraries for the clients in read-only mode.
+
+        The clients use it to show the menu while the server is starting.
+
+        """
+        libraries = dict()
+        for library, repo in self.repos.items():
+            docs = self._docs[library]
+            libraries[library] = {
+                "entries": self.entries[library],
+                "keys": self.keys[library],
+                "docs": [docs.get(k, "") for k in self.keys[library]],
+                "bibdir": os.path.join(expanduser(repo.conf["main"]["pubsdir"]), "bib"),
+            }
+        write_snapshot(self._state_dir + "/snapshot.bin", libraries)
+
+    def start_listening(self, address=ADDRESS, complete_address=COMPLETE_ADDRESS):
         """Start the listening loop of the server.
 
         It listens for requests from the client and executes the needed functions.
 
+        Parameters
+        ----------
+        address : tuple
+            Address where the server listens.
+        complete_address : tuple
+            Address where the completion of citekeys is served, in a thread of
+            its own. None to only serve it at `address`.
+
+        """
+        if complete_address is not None:
+            threading.Thread(
+                target=self._listen,
+                args=(complete_address, COMPLETE_COMMANDS),
+                daemon=True,
+            ).start()
+        self._listen(address)
+
+    def _listen(self, address, commands=None):
+        """Serve the clients connecting to `address`, one at a time.
+
+        Parameters
+        ----------
+        address : tuple
+            Address where the server listens.
+        commands : set[str]
+            Commands served at this address. By default, every command.
+
         """
+        # The listener is kept between clients, so that the clients waiting
+        # for their turn stay queued instead of being reset
+        listener = Listener(address)
         while True:
-            listener = Listener(("localhost", 6000))
-            running = True
-            # conn = listener.accept()
-            print(f"connection accepted from {listener.last_accepted}")
+            conn = listener.accept()
+            if commands is None:
+                print(f"connection accepted from {listener.last_accepted}")
             try:
-                while running:
-                    conn = listener.accept()
-                    print(f"connection accepted from {listener.last_accepted}")
-                    while True:
-                        # while conn.poll():
-                        msg = conn.recv()
-                        print(msg)
-
-                        match msg["cmd"]:
-                            case "get-publication-list":
-                                library = msg["library"]
-                                tag = msg["tag"]
-                                if tag:
-                                    repo = self.repos[library]
-                                    entries = self._gen_menu_entries(repo, tag)
-                                    menu_entries, keys = zip(*entries)
-                                    conn.send((menu_entries, keys))
-                                else:
-                                    conn.send(
-                                        (self.entries[library], self.keys[library])
-                                    )
-                                # Update the ui to point to the right library
-                                self.load_conf(library)
-                            case "get-publication-info":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                info = self._get_reference_info(library, citekey)
-                                conn.send(info)
-                            case "add-reference":
-                                library = msg["library"]
-                                args = msg["args"]
-                                self._add_reference(library, args)
-                            case "open-document":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                self._open_doc(library, citekey)
-                            case "edit-reference":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                self._edit_bib(library, citekey)
-                            case "export-reference":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                self._export_bib(library, citekey)
-                            case "get-tags":
-                                library = msg["library"]
-                                tags = list(self.repos[library].get_tags())
-                                conn.send(tags)
-                            case "add-tag":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                tag = msg["tag"]
-                                self._add_tag(tag, library, citekey)
-                                conn.send("Done")
-                            case "send-to-device":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                addr = msg["addr"]
-                                self._send_to_dptrp1(library, citekey, addr)
-                            case "send-per-email":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                send_doc_per_mail(self.repos[library], citekey)
-                            case "update-pdf-metadata":
-                                library = msg["library"]
-                                citekey = msg["citekey"]
-                                self._update_pdf_metadata(library, citekey)
-                            case "update-list-order":
-                                library = msg["library"]
-                                index = msg["index"]
-                                print(f"Library: {library}; index: {index}")
-                                self.update_entries_order(index, library)
-                            case "restart-server":
-                                raise SystemExit
-                            case _:
-                                running = False
-                                break
-
+                while True:
+                    data = conn.recv_bytes()
+                    received = time.monotonic()
+                    msg = pickle.loads(data)
+
+                    counting = _CountingConnection(conn)
+                    if commands is None or msg["cmd"] in commands:
+                        with self._lock:
+                            started = time.monotonic()
+                            handled = self._dispatch(counting, msg)
+                    else:
+                        started = time.monotonic()
+                        handled = False
+                    ended = time.monotonic()
+                    self._stats.record(
+                        msg["cmd"],
+                        msg.get("library"),
+                        started - received,
+                        ended - started,
+                        len(data),
+                        counting.bytes_out,
+                        error=not handled,
+                    )
+                    # Only the clients that trace add an ID to the messages
+                    if self._tracer is not None and "trace" in msg:
+                        self._trace_request(
+                            msg, received, started, ended, len(data), counting
+                        )
+                    if not handled:
+                        break
             except ConnectionResetError:
-                listener.close()
-                continue
+                pass
             except EOFError:
-                print("Wofi-pubs client closed")
-                listener.close()
-                continue
+                if commands is None:
+                    print("Wofi-pubs client closed")
+            conn.close()
+
+    def _dispatch(self, conn, msg: dict):
+        """Execute the command requested by the client.
+
+        Parameters
+        ----------
+        conn : :obj:`Connection`
+            Connection to the client.
+        msg : dict
+            Message sent by the client.
+
+        Returns
+        -------
+        bool :
+            False if the command is unknown.
+
+        """
+        match msg["cmd"]:
+            case "batch":
+                conn.send(self._run_batch(msg["ops"], msg.get("library")))
+            case "get-publication-list":
+                library = msg["library"]
+                tag = msg["tag"]
+                if tag:
+                    repo = self.repos[library]
+                    entries = self._gen_menu_entries(repo, tag)
+                    menu_entries, keys = zip(*entries)
+                    conn.send((menu_entries, keys))
+                else:
+                    conn.send((self.entries[library], self.keys[library]))
+                # Update the ui to point to the right library
+                self.load_conf(library)
+            case "get-publication-info":
+                library = msg["library"]
+                citekey = msg["citekey"]
+                info = self._get_reference_info(library, citekey)
+                conn.send(info)
+            case "add-reference":
+                library = msg["library"]
+                args = msg["args"]
+                self._add_reference(library, args)
+            case "open-document":
+                library = msg["library"]
+                citekey = msg["citekey"]
+                self._open_doc(library, citekey)
+                self._frecency.used(citekey)
+            case "edit-reference":
+                library = msg["library"]
+                citekey = msg["citekey"]
+                self._edit_bib(library, citekey)
+            case "export-reference":
+                library = msg["library"]
+                citekey = msg["citekey"]
+                self._export_bib(library, [citekey])
+                self._frecency.used(citekey)
+            case "export-references":
+                library = msg["library"]
+                citekeys = msg["citekeys"]
+                self._export_bib(library, citekeys)
+                for citekey in citekeys:
+                    self._frecency.used(citekey)
+            case "export-library":
+                library = msg["library"]
+                output = msg["output"]
+                self._export_bibfile(library, output)
+            case "export-tag":
+                library = msg["library"]
+                tag = msg["tag"]
+                output = msg["output"]
+                self._export_bibfile(library, output, tag)
+            case "export-citations":
+                aux = msg["aux"]
+                output = msg.get("output")
+                library = msg.get("library")
+                conn.send(self._export_citations(aux, output, library))
+            case "complete":
+                query = msg["query"]
+                library = msg.get("library")
+                limit = msg.get("limit", 20)
+                libraries = [library] if library else list(self.repos)
+                conn.send(self._completion.complete(query, libraries, limit))
+            case "complete-used":
+                self._frecency.used(msg["citekey"])
+            case "get-tags":
+                library = msg["library"]
+                tags = list(self.repos[library].get_tags())
+                conn.send(tags)
+            case "add-tag":
+                library = msg["library"]
+                citekey = msg["citekey"]
+                tag = msg["tag"]
+                self._add_tag(tag, library, citekey)
+                conn.send("Done")
+            case "send-to-device":
+                library = msg["library"]
+                citekeys = msg.get("citekeys") or [msg["citekey"]]
+                addr = msg["addr"]
+                self._send_to_dptrp1(library, citekeys, addr)
+            case "send-to-all-devices":
+                library = msg["library"]
+                citekeys = msg.get("citekeys") or [msg["citekey"]]
+                self._send_to_all_devices(library, citekeys)
+            case "get-devices":
+                conn.send(self._dpt_registry.status())
+            case "mirror-tag-to-device":
+                library = msg["library"]
+                tag = str(msg["tag"])
+                addr = msg["addr"]
+                folder = msg.get("folder")
+                remove = msg.get("remove", False)
+                self._mirror_tag_to_device(library, tag, addr, folder, remove)
+            case "sync-annotated-docs":
+                library = msg["library"]
+                addr = msg["addr"]
+                dry_run = msg.get("dry_run", False)
+                report = self._sync_annotated_docs(library, addr, dry_run)
+                if dry_run:
+                    conn.send(report)
+            case "send-per-email":
+                library = msg["library"]
+                citekey = msg["citekey"]
+                send_doc_per_mail(self.repos[library], citekey)
+            case "update-pdf-metadata":
+                library = msg["library"]
+                citekey = msg["citekey"]
+                self._update_pdf_metadata(library, citekey)
+            case "update-pdf-metadata-bulk":
+                library = msg["library"]
+                tag = msg.get("tag")
+                self._update_pdf_metadata_bulk(library, tag)
+            case "update-list-order":
+                library = msg["library"]
+                index = msg["index"]
+                print(f"Library: {library}; index: {index}")
+                self.update_entries_order(index, library)
+            case "stats":
+                conn.send(self._stats_report())
+            case "profile-start":
+                mode = msg.get("mode", "sample")
+                interval = msg.get("interval", 0.005)
+                self._profile_start(mode, interval)
+            case "profile-stop":
+                conn.send(self._profile_stop())
+            case "heap-summary":
+                conn.send(self._heap_summary())
+            case "restart-server":
+                # Keep the order of the entries for the next start
+                self._save_snapshot()
+                self._exiftool.close()
+                raise SystemExit
+            case _:
+                return False
+
+        return True
+
+    def _trace_request(self, msg, received, started, ended, bytes_in, conn):
+        """Write the trace events of a request handled by the server."""
+        rid = msg["trace"]
+        cmd = msg["cmd"]
+        library = msg.get("library")
+        self._tracer.event(
+            rid, "server-recv", t=received, cmd=cmd, library=library, bytes=bytes_in
+        )
+        self._tracer.event(rid, "handler-start", t=started)
+        # The reply is sent before the end of some handlers
+        sent = ended if conn.sent_at is None else conn.sent_at
+        self._tracer.event(rid, "handler-end", t=sent, bytes=conn.bytes_out)
+        self._tracer.event(rid, "handler-done", t=ended)
+
+    def _stats_report(self):
+        """Statistics of the commands, the caches and the libraries.
+
+        Returns
+        -------
+        dict :
+            Latency histograms and traffic of each command (``commands``) and
+            of each command on each library (``libraries``), hit rates of the
+            caches and number of entries of each library.
+
+        """
+        report = {"uptime": time.monotonic() - self._started}
+        report.update(self._stats.as_dict())
+        report["caches"] = {
+            "bibtex": hit_rate(self._bibtex.hits, self._bibtex.misses),
+            "dpt_local_hash": hit_rate(
+                self._dpt_inventory.hits, self._dpt_inventory.misses
+            ),
+        }
+        report["entries"] = {lib: len(keys) for lib, keys in self.keys.items()}
+
+        return report
+
+    def _profile_start(self, mode: str = "sample", interval: float = 0.005):
+        """Start profiling the server.
+
+        Parameters
+        ----------
+        mode : str
+            ``sample`` to sample the stacks of all the threads, or
+            ``cprofile`` to profile deterministically the commands.
+        interval : float
+            Seconds between two samples.
+
+        """
+        if self._profiler is not None:
+            print("A profile is already running")
+            return
+        if mode == "cprofile":
+            self._profiler = CommandProfiler()
+        elif mode == "sample":
+            self._profiler = SamplingProfiler(interval)
+        else:
+            print(f"Unknown profiling mode '{mode}'")
+            return
+        self._profile_started = time.time()
+        self._profiler.start()
+
+    def _profile_stop(self):
+        """Stop the profiler and write its statistics.
+
+        The files are written to the ``profiles`` directory of the state
+        directory.
+
+        Returns
+        -------
+        dict :
+            Files written and duration of the profile, or an error if no
+            profile was running.
+
+        """
+        if self._profiler is None:
+            return {"error": "No profile running"}
+
+        profiler, self._profiler = self._profiler, None
+        profiler.stop()
+        directory = self._state_dir + "/profiles"
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._profile_started))
+        files = profiler.write(f"{directory}/profile-{stamp}")
+
+        return {"files": files, "duration": time.time() - self._profile_started}
+
+    def _heap_summary(self):
+        """Objects and memory used by the lists of entries and the caches."""
+        return heap_summary(
+            {
+                "entries": self.entries,
+                "keys": self.keys,
+                "repos": self.repos,
+                "docs": self._docs,
+                "tags": self._tags,
+                "bibtex_cache": self._bibtex,
+                "completion": self._completion,
+                "frecency": self._frecency,
+                "dpt_inventory": self._dpt_inventory,
+                "dpt_sessions": self._dpt_sessions,
+                "stats": self._stats,
+            }
+        )
+
+    def _dump_stats(self):
+        """Print the statistics of the commands periodically to the journal."""
+        while True:
+            time.sleep(self._stats_interval)
+            for line in self._stats.summary():
+                print(f"stats: {line}", flush=True)
+
+    def _run_batch(self, ops: list[dict], library: str | None = None):
+        """Run several commands with a single request.
+
+        The commands share the configuration of the library, the papers are
+        pulled from the repository only once, and the reorders of the list and
+        the `PostCommandEvent` of pubs are applied once at the end.
+
+        Parameters
+        ----------
+        ops : list[dict]
+            Messages of the commands. The library of the batch is used for the
+            commands that do not give one.
+        library : str
+            Path to the configuration file of the library.
+
+        Returns
+        -------
+        list[dict] :
+            For each command, its name, whether it succeeded (``ok``), and its
+            ``reply`` or ``error`` if any.
+
+        """
+        if library is not None:
+            self.load_conf(library)
+
+        results = []
+        self._batch = {"papers": dict(), "reorder": dict(), "post_command": False}
+        try:
+            for op in ops:
+                if library is not None:
+                    op = {"library": library, **op}
+                result = {"cmd": op.get("cmd"), "ok": False}
+                replies = _Replies()
+                try:
+                    if op.get("cmd") == "batch":
+                        raise ValueError("Batches cannot be nested")
+                    result["ok"] = self._dispatch(replies, op)
+                    if not result["ok"]:
+                        result["error"] = "Unknown command"
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                if replies:
+                    result["reply"] = replies[0] if len(replies) == 1 else replies
+                results.append(result)
+        finally:
+            batch, self._batch = self._batch, None
+            for lib, indices in batch["reorder"].items():
+                self._reorder_entries(lib, indices)
+            if batch["post_command"]:
+                events.PostCommandEvent().send()
+
+        return results
+
+    def _pull_paper(self, library: str, citekey: str):
+        """Pull a paper from the repository, only once per batch."""
+        if self._batch is None:
+            return self.repos[library].pull_paper(citekey)
+        papers = self._batch["papers"]
+        if (library, citekey) not in papers:
+            papers[(library, citekey)] = self.repos[library].pull_paper(citekey)
+        return papers[(library, citekey)]
+
+    def _post_command(self):
+        """Send the `PostCommandEvent` of pubs, only once per batch."""
+        if self._batch is None:
+            events.PostCommandEvent().send()
+        else:
+            self._batch["post_command"] = True
 
     def menu_tags(self, repo: Repository, library: str):
         """Present menu with existing tags in the library.
@@ -328,7 +796,7 @@ class PubsServer:
         elif option == "Back":
             self.menu_main(library)
 
-    def _gen_menu_entries(self, repo: Repository, tag: str):
+    def _gen_menu_entries(self, repo: Repository, tag: str, papers=None):
         """Generate menu entries for the library items.
 
         Parameters
@@ -336,6 +804,10 @@ class PubsServer:
         repo : :obj:`Repository`
             The repository object containing the papers from which the
             entries should be generated.
+        tag : str
+            Only generate entries for the papers with this tag.
+        papers : list[:obj:`Paper`]
+            Papers of the repository, if they were already loaded.
 
         Yields
         ------
@@ -345,7 +817,10 @@ class PubsServer:
             Key corresponding to the paper.
 
         """
-        for paper in repo.all_papers():
+        if papers is None:
+            papers = repo.all_papers()
+
+        for paper in papers:
             if tag:
                 if tag not in paper.tags:
                     continue
@@ -424,7 +899,7 @@ class PubsServer:
             The detailed information of a given paper.
 
         """
-        paper = self.repos[library].pull_paper(citekey)
+        paper = self._pull_paper(library, citekey)
         bibdata = paper.bibdata
 
         if "author" in bibdata:
@@ -493,9 +968,11 @@ class PubsServer:
         add_cmd(repo.conf, args)
 
         if args.docfile is not None:
-            doc = update_pdf_metadata(repo, args.citekey)
+            doc = update_pdf_metadata(
+                repo, args.citekey, self._exiftool, self._metadata_backend
+            )
 
-        events.PostCommandEvent().send()
+        self._post_command()
 
         # Update main menu entries
         paper = repo.pull_paper(args.citekey)
@@ -503,6 +980,49 @@ class PubsServer:
         entry, key = self._gen_paper_entry(paper)
         self.entries[library].append(entry)
         self.keys[library].append(key)
+        if paper.docpath:
+            self._docs[library][key] = self._docpath(repo, paper)
+        self._tags[library][key] = set(paper.tags)
+        self._completion.add(library, paper)
+        self._save_snapshot()
+
+    def _ingest_document(self, docfile: str, doi: str | None, arxiv: str | None):
+        """Add a document found in the inbox directory to the library.
+
+        Parameters
+        ----------
+        docfile : str
+            Path to the PDF file.
+        doi : str
+            DOI found in the document.
+        arxiv : str
+            ArXiv identifier found in the document. Only used if no DOI is
+            given.
+
+        Returns
+        -------
+        str :
+            Citekey of the new reference.
+
+        """
+        library = self._inbox_library
+        args = PubsArgs()
+        if doi is not None:
+            args.doi = doi
+        else:
+            args.arxiv = arxiv
+        args.docfile = docfile
+
+        with self._lock:
+            self.load_conf(library)
+            self._add_reference(library, args)
+
+        self.notification = Notify.Notification.new(
+            "Wofi-pubs", f"{args.citekey} added from {os.path.basename(docfile)}"
+        )
+        self.notification.show()
+
+        return args.citekey
 
     def _add_tag(self, tag: str, library: str, citekey: str):
         """Add tag to reference.
@@ -518,10 +1038,11 @@ class PubsServer:
 
         """
         repo = self.repos[library]
-        paper = repo.pull_paper(citekey)
+        paper = self._pull_paper(library, citekey)
         paper.add_tag(tag)
         repo.push_paper(paper, overwrite=True, event=False)
-        events.PostCommandEvent().send()
+        self._post_command()
+        self._tags[library].setdefault(citekey, set()).add(tag)
 
     def _open_doc(self, library: str, citekey: str):
         """Open pdf file with default pdf reader.
@@ -535,9 +1056,9 @@ class PubsServer:
 
         """
         repo = self.repos[library]
-        paper = repo.pull_paper(citekey)
+        paper = self._pull_paper(library, citekey)
 
-        docpath = content.system_path(repo.databroker.real_docpath(paper.docpath))
+        docpath = self._docpath(repo, paper)
         cmd = self._pdfviewer.split()
         cmd.append(docpath)
         subprocess.Popen(cmd)
@@ -560,59 +1081,384 @@ class PubsServer:
         args = PubsArgs()
         args.citekey = citekey
         edit_cmd(conf, args)
-        events.PostCommandEvent().send()
+        self._post_command()
+        if self._batch is not None:
+            self._batch["papers"].pop((library, citekey), None)
+        paper = self._pull_paper(library, citekey)
+        self._tags[library][citekey] = set(paper.tags)
+        self._completion.add(library, paper)
 
         return 1
 
-    def _export_bib(self, library: str, citekey: str):
-        """Export citation of paper defined by `citekey` in bib format.
+    def _export_bib(self, library: str, citekeys: list[str]):
+        """Export the citations of the papers in bib format.
 
-        The citation will be added to the clipboard by means of `wl-copy`.
+        The citations will be added to the clipboard by means of `wl-copy`.
+        The text is passed through the standard input, so that the size of
+        the export is not limited by the maximum length of the arguments.
 
         Parameters
         ----------
         library : str
             Path to the configuration file of the library.
-        citekey : str
-            Citekey for the paper.
+        citekeys : list[str]
+            Citekeys of the papers.
 
         """
         repo = self.repos[library]
-        paper = repo.pull_paper(citekey)
+        bibdata_raw = self._bibtex.document(repo, citekeys)
 
-        bib = dict()
-        bib[citekey] = paper.bibdata
+        subprocess.run(["wl-copy"], input=bibdata_raw, text=True, check=False)
+        self._bibtex.save()
 
-        exporter = EnDecoder()
-        bibdata_raw = exporter.encode_bibdata(bib, ignore_fields=["file"])
+    def _export_bibfile(self, library: str, output: str, tag: str | None = None):
+        """Export the papers of a library to a bib file.
 
-        cmd = ["wl-copy", f"{bibdata_raw}"]
-        subprocess.Popen(cmd)
+        The output file is replaced atomically, so that a LaTeX build running
+        at the same time never reads a partial file.
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+        output : str
+            Path to the bib file.
+        tag : str
+            Only export the papers with this tag.
+
+        """
+        repo = self.repos[library]
+        if tag:
+            tags = self._tags[library]
+            citekeys = [k for k in self.keys[library] if tag in tags.get(k, ())]
+        else:
+            citekeys = self.keys[library]
+
+        write_atomic(expanduser(output), self._bibtex.document(repo, citekeys))
+        self._bibtex.save()
 
-    def _send_to_dptrp1(self, library: str, citekey: str, addr: str):
-        """Send document to Sony DPT-RP1 or compatible device.
+        self.notification = Notify.Notification.new(
+            "Wofi-pubs", f"{len(citekeys)} references exported to {output}"
+        )
+        self.notification.show()
+
+    def _export_citations(
+        self, aux: str, output: str | None = None, library: str | None = None
+    ):
+        """Write a bib file with the references cited in a LaTeX project.
+
+        The citekeys are looked up in the libraries already loaded by the
+        server, the default library first. The bib file is only written if
+        its content changed, so that LaTeX is not run again needlessly.
+
+        Parameters
+        ----------
+        aux : str
+            Path to the ``.aux`` file of the project.
+        output : str
+            Path to the bib file. By default, next to the ``.aux`` file.
+        library : str
+            Only look up the citekeys in this library.
+
+        Returns
+        -------
+        dict :
+            Report with the path of the bib file (``output``), the number of
+            references written (``written``), the citekeys not found
+            (``unresolved``) and whether the file changed (``changed``), or
+            the ``error`` if the ``.aux`` file cannot be read.
+
+        """
+        if output is None:
+            output = os.path.splitext(aux)[0] + ".bib"
+        if library is not None:
+            libraries = [library]
+        else:
+            libraries = sorted(self.repos, key=lambda lib: lib != self._default_lib)
+
+        try:
+            citekeys = read_citations(aux)
+        except OSError as e:
+            # Do not replace the bib file with an empty one
+            return {"error": str(e)}
+        resolved, unresolved = resolve_citations(
+            citekeys, {lib: set(self.keys[lib]) for lib in libraries}
+        )
+
+        bibdata_raw = "\n".join(
+            self._bibtex.document(self.repos[lib], keys)
+            for lib, keys in resolved.items()
+            if keys
+        )
+        self._bibtex.save()
+
+        try:
+            with open(output, "r") as f:
+                changed = f.read() != bibdata_raw
+        except OSError:
+            changed = True
+        if changed:
+            write_atomic(output, bibdata_raw)
+
+        return {
+            "output": output,
+            "written": len(citekeys) - len(unresolved),
+            "unresolved": unresolved,
+            "changed": changed,
+        }
+
+    def _send_to_dptrp1(self, library: str, citekeys: list[str], addr: str):
+        """Send documents to Sony DPT-RP1 or compatible device.
+
+        The documents are uploaded in the background.
 
         Parameters
         ----------
         library : str
             Path to the configuration file of the library.
-        citekey : str
-            Citekey of the paper.
+        citekeys : list[str]
+            Citekeys of the papers.
         addr: str
             IP-address of device.
 
         """
         repo = self.repos[library]
-        remote_path = to_dpt(repo, citekey, addr)
+        lib_name = library_name(repo)
+        docs = [Document(key=k, repo=repo, lib_name=lib_name) for k in citekeys]
 
-        self.notification = Notify.Notification.new(
-            "Wofi-pubs", f"{citekey} sent to DPT-RP1"
+        self._dpt_uploads.submit(
+            docs, addr, on_done=lambda res: self._notify_sent(addr, res)
         )
-        self.notification.add_action(
-            "clicked", "Display file in device", show_sent_file, (addr, remote_path)
+
+    def _send_to_all_devices(self, library: str, citekeys: list[str]):
+        """Send documents to all the reachable devices at the same time.
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+        citekeys : list[str]
+            Citekeys of the papers.
+
+        """
+        names = dict()
+        for name, addr, reachable in self._dpt_registry.status():
+            if reachable is not False:
+                names.setdefault(addr, name)
+
+        if len(names) == 0:
+            self.notification = Notify.Notification.new(
+                "Wofi-pubs", "No DPT-RP1 device reachable"
+            )
+            self.notification.show()
+            return
+
+        repo = self.repos[library]
+        lib_name = library_name(repo)
+        docs = [Document(key=k, repo=repo, lib_name=lib_name) for k in citekeys]
+
+        self._dpt_uploads.submit_all(
+            docs, list(names), on_done=lambda res: self._notify_sent_all(names, res)
         )
+
+    def _notify_sent_all(self, names: dict[str, str], results: dict[str, list]):
+        """Show a summary of the upload of documents to several devices.
+
+        Parameters
+        ----------
+        names : dict[str, str]
+            Maps the address of each device to its name.
+        results : dict[str, list]
+            Maps the address of each device to the results of its uploads.
+
+        """
+        lines = []
+        for addr, res in results.items():
+            failed = [(k, err) for k, _, _, err in res if err is not None]
+            line = f"<b>{names[addr]}</b>: {len(res) - len(failed)}/{len(res)} sent"
+            if failed:
+                line += " (failed: " + ", ".join(f"{k}: {err}" for k, err in failed)
+                line += ")"
+            lines.append(line)
+
+        if any(err is not None for res in results.values() for *_, err in res):
+            self._dpt_registry.refresh()
+
+        self.notification = Notify.Notification.new("Wofi-pubs", "\n".join(lines))
+        self.notification.show()
+
+    def _notify_sent(self, addr: str, results: list[tuple]):
+        """Show the result of the upload of documents to a device.
+
+        Parameters
+        ----------
+        addr : str
+            IP-address of device.
+        results : list[tuple]
+            Tuples ``(citekey, remote_path, status, error)`` for each
+            document.
+
+        """
+        sent = [(k, path) for k, path, _, err in results if err is None]
+        failed = [(k, err) for k, _, _, err in results if err is not None]
+        unchanged = sum(1 for _, _, status, _ in results if status == "unchanged")
+
+        if len(results) == 1 and len(sent) == 1:
+            text = f"{sent[0][0]} sent to DPT-RP1"
+        else:
+            text = f"{len(sent)} documents sent to DPT-RP1"
+        if unchanged:
+            text += f" ({unchanged} already up to date)"
+        if failed:
+            text += "\nFailed: " + ", ".join(f"{k} ({err})" for k, err in failed)
+            self._dpt_registry.refresh()
+
+        self.notification = Notify.Notification.new("Wofi-pubs", text)
+        if len(sent) == 1:
+            self.notification.add_action(
+                "clicked",
+                "Display file in device",
+                show_sent_file,
+                (addr, sent[0][1], self._dpt_sessions),
+            )
         self.notification.show()
 
+    def _mirror_tag_to_device(
+        self,
+        library: str,
+        tag: str,
+        addr: str,
+        folder: str | None = None,
+        remove: bool = False,
+    ):
+        """Mirror the documents with a given tag to a folder of the device.
+
+        The work is done in the background, and the changes are reported in a
+        notification.
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+        tag : str
+            Tag of the documents.
+        addr: str
+            IP-address of device.
+        folder : str
+            Remote folder. Defaults to ``Document/<Tag>``.
+        remove : bool
+            Remove the documents in the folder that no longer have the tag.
+
+        """
+        if folder is None:
+            folder = "Document/" + tag.capitalize()
+
+        repo = self.repos[library]
+        lib_name = library_name(repo)
+        docs = [
+            Document(key=paper.citekey, repo=repo, lib_name=lib_name, folder=folder)
+            for paper in repo.all_papers()
+            if tag in paper.tags and paper.docpath is not None
+        ]
+
+        def notify(summary):
+            text = (
+                f"Mirror of '{tag}': {len(summary['uploaded'])} uploaded, "
+                + f"{len(summary['removed'])} removed, "
+                + f"{summary['unchanged']} unchanged"
+            )
+            if summary["failed"]:
+                text += f", {len(summary['failed'])} failed"
+            notification = Notify.Notification.new("Wofi-pubs", text)
+            notification.show()
+
+        def run():
+            try:
+                dpt = self._dpt_sessions.get(addr)
+                mirror_to_device(
+                    dpt,
+                    addr,
+                    docs,
+                    folder,
+                    self._dpt_inventory,
+                    self._dpt_uploads,
+                    remove=remove,
+                    on_done=notify,
+                )
+            except Exception as e:
+                self._dpt_sessions.invalidate(addr)
+                notification = Notify.Notification.new(
+                    "Wofi-pubs", f"Mirror of '{tag}' failed: {e}"
+                )
+                notification.show()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _sync_annotated_docs(self, library: str, addr: str, dry_run: bool = False):
+        """Download the documents of the library annotated in the device.
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+        addr: str
+            IP-address of device.
+        dry_run : bool
+            Only report the documents that would be downloaded. The report is
+            returned instead of running in the background.
+
+        Returns
+        -------
+        list[tuple], dict or None :
+            In dry-run, tuples ``(citekey, remote_path, local_path)``, or a
+            dict with the ``error`` if the device cannot be reached.
+
+        """
+        repo = self.repos[library]
+        lib_name = library_name(repo)
+        docs = [
+            Document(key=paper.citekey, repo=repo, lib_name=lib_name)
+            for paper in repo.all_papers()
+            if paper.docpath is not None
+        ]
+
+        def run():
+            dpt = self._dpt_sessions.get(addr)
+            return sync_annotated_docs(
+                dpt,
+                addr,
+                docs,
+                self._dpt_inventory,
+                mode=self._dpt_sync_mode,
+                dry_run=dry_run,
+                parallel=self._dpt_parallel_uploads,
+            )
+
+        if dry_run:
+            try:
+                report = run()
+            except Exception as e:
+                self._dpt_sessions.invalidate(addr)
+                return {"error": str(e)}
+            return [(k, str(remote), str(local)) for k, remote, local in report]
+
+        def run_and_notify():
+            try:
+                report = run()
+            except Exception as e:
+                self._dpt_sessions.invalidate(addr)
+                text = f"Synchronization with DPT-RP1 failed: {e}"
+            else:
+                done = [k for k, _, local in report if local is not None]
+                failed = [k for k, _, local in report if local is None]
+                text = f"{len(done)} annotated documents downloaded"
+                if failed:
+                    text += "\nFailed: " + ", ".join(failed)
+            notification = Notify.Notification.new("Wofi-pubs", text)
+            notification.show()
+
+        threading.Thread(target=run_and_notify, daemon=True).start()
+
     def _update_pdf_metadata(self, library: str, citekey: str):
         """Update the PDF's metadata to include author and title of paper.
 
@@ -625,11 +1471,56 @@ class PubsServer:
 
         """
         repo = self.repos[library]
-        paper = repo.pull_paper(citekey)
+        doc = update_pdf_metadata(repo, citekey, self._exiftool, self._metadata_backend)
+        self._post_command()
+
+    def _update_pdf_metadata_bulk(self, library: str, tag: str | None = None):
+        """Update the metadata of all PDF files of a library in the background.
+
+        Parameters
+        ----------
+        library : str
+            Path to the configuration file of the library.
+        tag : str
+            Update only documents with the given tag.
+
+        """
+        repo = self.repos[library]
+        docs = []
+        for paper in repo.all_papers():
+            if paper.docpath is None or (tag and tag not in paper.tags):
+                continue
+            docpath = content.system_path(repo.databroker.real_docpath(paper.docpath))
+            title, author = pdf_metadata_fields(paper.bibdata)
+            docs.append((docpath, title, author))
 
-        docpath = content.system_path(repo.databroker.real_docpath(paper.docpath))
-        doc = update_pdf_metadata(repo, citekey)
-        events.PostCommandEvent().send()
+        notification = Notify.Notification.new(
+            "Wofi-pubs", f"Updating metadata of {len(docs)} documents"
+        )
+        notification.set_hint("string:x-canonical-private-synchronous:Wofi-pubs")
+        notification.show()
+
+        def progress(done, total):
+            notification.update("Wofi-pubs", f"Updating metadata: {done}/{total}")
+            notification.show()
+
+        def run():
+            summary = update_pdf_metadata_bulk(
+                docs,
+                self._state_dir + "/pdf_metadata.json",
+                progress=progress,
+                exiftool=self._exiftool,
+                backend=self._metadata_backend,
+            )
+            notification.update(
+                "Wofi-pubs",
+                f"PDF metadata: {len(summary['rewritten'])} rewritten, "
+                + f"{len(summary['skipped'])} skipped, "
+                + f"{len(summary['failed'])} failed",
+            )
+            notification.show()
+
+        threading.Thread(target=run, daemon=True).start()
 
     def update_entries_order(self, idx: int, library: str):
         """Reorder the list of entries and key to place the last selected element at the top.
@@ -642,9 +1533,38 @@ class PubsServer:
             The used library.
 
         """
+        if self._batch is not None:
+            # Applied once at the end of the batch. The index is checked now,
+            # so that an invalid one fails its own command only.
+            n = len(self.entries[library])
+            if not -n <= idx < n:
+                raise IndexError(f"No entry {idx} in the list of {n} entries")
+            idx %= n
+            self._batch["reorder"].setdefault(library, []).append(idx)
+            return
+
         self.entries[library].insert(0, self.entries[library].pop(idx))
         self.keys[library].insert(0, self.keys[library].pop(idx))
 
+    def _reorder_entries(self, library: str, indices: list[int]):
+        """Place several selected elements at the top, the last selected first.
+
+        Parameters
+        ----------
+        indices : list[int]
+            The selected items, in the order they were selected.
+        library : str
+            The used library.
+
+        """
+        selected = list(dict.fromkeys(reversed(indices)))
+        chosen = set(selected)
+        for items in (self.entries, self.keys):
+            old = items[library]
+            items[library] = [old[k] for k in selected] + [
+                x for k, x in enumerate(old) if k not in chosen
+            ]
+
 
 def gen_citekey(repo: Repository, args: PubsArgs):
     """Generate the citekey when importing new references.
@@ -0,0 +1,120 @@
+"""In-memory stand-in for `dptrp1.DigitalPaper`.
+
+Implements the subset of the API used by wofi-pubs, so that the upload,
+inventory and synchronization code can be exercised without a device. See
+``benchmarks/fake_dpt_server.py`` for a device served over HTTP.
+"""
+
+import time
+from pathlib import PurePath
+
+
+class FakeDigitalPaper:
+    """Fake device storing the documents in a dictionary.
+
+    Parameters
+    ----------
+    addr : str
+        Address of the device (ignored).
+
+    """
+
+    def __init__(self, addr=None):
+        self.addr = addr
+        self.folders = {"Document"}
+        self.documents: dict[str, dict] = dict()
+        self.calls: list[str] = []
+        self._next_id = 0
+
+    def _new_id(self):
+        self._next_id += 1
+        return f"id-{self._next_id}"
+
+    def authenticate(self, client_id, key):
+        self.calls.append("authenticate")
+
+    def get_storage(self):
+        self.calls.append("get_storage")
+        return {"available": "1000000000", "capacity": "2000000000"}
+
+    def new_folder(self, remote_path):
+        self.calls.append("new_folder")
+        path = PurePath(remote_path)
+        for parent in [path, *path.parents][:-1]:
+            self.folders.add(str(parent))
+
+    def upload(self, fh, remote_path):
+        self.calls.append("upload")
+        self._store(str(remote_path), fh.read())
+
+    def _store(self, remote_path, data):
+        old = self.documents.get(remote_path)
+        self.documents[remote_path] = {
+            "entry_id": old["entry_id"] if old else self._new_id(),
+            "data": data,
+            "revision": (old["revision"] + 1) if old else 1,
+            "modified": time.time(),
+        }
+
+    def annotate(self, remote_path, extra=b"% annotation\n"):
+        """Emulate the annotation of a document in the device."""
+        doc = self.documents[str(remote_path)]
+        self._store(str(remote_path), doc["data"] + extra)
+
+    def download(self, remote_path):
+        self.calls.append("download")
+        return self.documents[str(remote_path)]["data"]
+
+    def _get_object_id(self, remote_path):
+        return self.documents[str(remote_path)]["entry_id"]
+
+    def _put_endpoint(self, endpoint, files):
+        # /documents/{id}/file replaces the content of a document
+        self.calls.append("replace")
+        doc_id = endpoint.split("/")[2]
+        path = next(p for p, d in self.documents.items() if d["entry_id"] == doc_id)
+        self._store(path, files["file"][1].read())
+
+    def delete_document(self, remote_path):
+        self.calls.append("delete_document")
+        del self.documents[str(remote_path)]
+
+    def _entry(self, path, doc):
+        return {
+            "entry_type": "document",
+            "entry_path": path,
+            "entry_name": PurePath(path).name,
+            "entry_id": doc["entry_id"],
+            "file_size": str(len(doc["data"])),
+            "file_revision": f"rev-{doc['revision']}",
+            "modified_date": time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.gmtime(doc["modified"])
+            ),
+        }
+
+    def list_documents(self):
+        self.calls.append("list_documents")
+        return [self._entry(p, d) for p, d in self.documents.items()]
+
+    def list_objects_in_folder(self, remote_path):
+        self.calls.append("list_objects_in_folder")
+        folder = str(PurePath(remote_path))
+        entries = [
+            self._entry(p, d)
+            for p, d in self.documents.items()
+            if str(PurePath(p).parent) == folder
+        ]
+        entries += [
+            {"entry_type": "folder", "entry_path": f, "entry_name": PurePath(f).name}
+            for f in self.folders
+            if str(PurePath(f).parent) == folder
+        ]
+        return entries
+
+    def list_document_info(self, remote_path):
+        self.calls.append("list_document_info")
+        path = remote_path.decode() if isinstance(remote_path, bytes) else remote_path
+        return self._entry(str(path), self.documents[str(path)])
+
+    def display_document(self, document_id, page=1):
+        self.calls.append("display_document")
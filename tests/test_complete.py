@@ -0,0 +1,139 @@
+import json
+import os
+import select
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.connection import Client
+
+import pytest
+
+wofi_pubs_server = pytest.importorskip("wofi_pubs.wofi_pubs_server")
+
+from wofi_pubs import complete  # noqa: E402
+from wofi_pubs.stats import CommandStats  # noqa: E402
+
+
+class CannedServer(wofi_pubs_server.PubsServer):
+    """Listening loop of the server, with canned replies instead of libraries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = CommandStats()
+        self._tracer = None
+
+    def _dispatch(self, conn, msg):
+        match msg["cmd"]:
+            case "complete":
+                conn.send([("doe2020", "Doe 2020", "main.conf")])
+            case "get-publication-list":
+                conn.send((["Doe 2020"], ["doe2020"]))
+            case _:
+                return False
+        return True
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def connect(address, timeout=5.0):
+    """Connect once the listener of the server is running."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return Client(address)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def read_reply(fd, timeout=5.0):
+    """Next JSON line written by the bridge, skipping the log of the server."""
+    buf = b""
+    while True:
+        while b"\n" not in buf:
+            ready, _, _ = select.select([fd], [], [], timeout)
+            assert ready, "No reply from the bridge"
+            buf += os.read(fd, 4096)
+        line, buf = buf.split(b"\n", 1)
+        if line.startswith((b"[", b"{")):
+            return json.loads(line)
+
+
+@pytest.fixture
+def server():
+    address = ("localhost", free_port())
+    complete_address = ("localhost", free_port())
+    threading.Thread(
+        target=CannedServer().start_listening,
+        args=(address, complete_address),
+        daemon=True,
+    ).start()
+    return address, complete_address
+
+
+@contextmanager
+def bridge(address, monkeypatch):
+    """Standard input and output of a running bridge.
+
+    Not a fixture: pytest restores `sys.stdout` between the setup and the
+    test.
+
+    """
+    monkeypatch.setattr(complete, "ADDRESS", address)
+    stdin_r, stdin_w = os.pipe()
+    stdout_r, stdout_w = os.pipe()
+    monkeypatch.setattr(sys, "stdin", os.fdopen(stdin_r, "r"))
+    monkeypatch.setattr(sys, "stdout", os.fdopen(stdout_w, "w"))
+    thread = threading.Thread(target=complete.main, daemon=True)
+    thread.start()
+    yield stdin_w, stdout_r
+
+    os.close(stdin_w)
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_menu_is_served_while_the_bridge_is_open(server, monkeypatch):
+    with bridge(server[1], monkeypatch) as (stdin_w, stdout_r):
+        os.write(stdin_w, b"doe\n")
+        results = read_reply(stdout_r)
+        assert results == [
+            {"citekey": "doe2020", "label": "Doe 2020", "library": "main.conf"}
+        ]
+
+        # The editor is still open: a menu must get its list
+        menu = connect(server[0])
+        menu.send({"cmd": "get-publication-list", "tag": None})
+        assert menu.poll(5), "The menu is locked out of the server"
+        assert menu.recv() == (["Doe 2020"], ["doe2020"])
+        menu.close()
+
+        os.write(stdin_w, b"doe\n")
+        assert read_reply(stdout_r)[0]["citekey"] == "doe2020"
+
+
+def test_completion_is_served_while_a_menu_is_open(server, monkeypatch):
+    with bridge(server[1], monkeypatch) as (stdin_w, stdout_r):
+        # The picker of the menu is open: its connection is kept
+        menu = connect(server[0])
+        menu.send({"cmd": "get-publication-list", "tag": None})
+        assert menu.recv() == (["Doe 2020"], ["doe2020"])
+
+        os.write(stdin_w, b"doe\n")
+        assert read_reply(stdout_r)[0]["citekey"] == "doe2020"
+        menu.close()
+
+
+def test_completion_listener_only_serves_the_completion(server):
+    conn = connect(server[1])
+    conn.send({"cmd": "get-publication-list", "tag": None})
+    assert conn.poll(5)
+    with pytest.raises(EOFError):
+        conn.recv()
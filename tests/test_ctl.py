@@ -0,0 +1,9 @@
+from wofi_pubs.ctl import parse_value
+
+
+def test_names_are_kept_as_strings():
+    assert parse_value("tag", "2024") == "2024"
+    assert parse_value("citekey", "null") == "null"
+    assert parse_value("remove", "true") is True
+    assert parse_value("tags", '["a", "b"]') == ["a", "b"]
+    assert parse_value("folder", "Document/papers") == "Document/papers"
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from wofi_pubs import ingest
+
+
+class InlinePool:
+    """Runs the text extraction in the calling thread."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.submitted = []
+
+    def apply_async(self, func, args, callback, error_callback):
+        self.submitted.append(args[0])
+        callback(self.ids)
+
+
+@pytest.fixture
+def inbox(tmp_path):
+    directory = tmp_path / "inbox"
+    directory.mkdir()
+    return directory
+
+
+def watch(inbox, tmp_path, ingest_doc, ids=("10.1000/xyz", None), **kwargs):
+    watcher = ingest.InboxWatcher(
+        str(inbox), str(tmp_path / "inbox.json"), ingest_doc, **kwargs
+    )
+    watcher._seed()
+    watcher._pool = InlinePool(ids)
+    return watcher
+
+
+def scan(watcher):
+    """Two scans, so that the sizes of the files are stable, then ingest."""
+    watcher.scan()
+    watcher.scan()
+    while not watcher._extracted.empty():
+        watcher._on_extracted(*watcher._extracted.get())
+
+
+def test_existing_files_are_not_imported(inbox, tmp_path):
+    (inbox / "old.pdf").write_bytes(b"%PDF old download")
+    added = []
+    watcher = watch(inbox, tmp_path, lambda *args: added.append(args) or "doe2020")
+
+    scan(watcher)
+    assert added == []
+    (inbox / "new.pdf").write_bytes(b"%PDF new download")
+    scan(watcher)
+    assert [args[0] for args in added] == [str(inbox / "new.pdf")]
+
+    record = json.loads((tmp_path / "inbox.json").read_text())
+    assert record[str(inbox / "old.pdf")]["status"] == "preexisting"
+    assert record[str(inbox / "new.pdf")]["status"] == "added"
+
+
+def test_failed_files_are_retried(inbox, tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ingest.time, "time", lambda: now[0])
+
+    def unreachable(path, doi, arxiv):
+        raise OSError("Network is unreachable")
+
+    watcher = watch(inbox, tmp_path, unreachable, retries=3, retry_delay=60)
+    (inbox / "new.pdf").write_bytes(b"%PDF new download")
+
+    scan(watcher)
+    scan(watcher)
+    assert len(watcher._pool.submitted) == 1
+    for attempts, delay in [(2, 60), (3, 120)]:
+        now[0] += delay
+        scan(watcher)
+        assert len(watcher._pool.submitted) == attempts
+
+    # No more attempts
+    now[0] += 1e6
+    scan(watcher)
+    assert len(watcher._pool.submitted) == 3
+    rec = json.loads((tmp_path / "inbox.json").read_text())[str(inbox / "new.pdf")]
+    assert rec["status"] == "failed" and rec["attempts"] == 3
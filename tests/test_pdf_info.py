@@ -0,0 +1,76 @@
+import sys
+import zlib
+from pathlib import Path
+
+import pytest
+
+from wofi_pubs import pdf_info
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "benchmarks"))
+from sample_pdf import XREF_STYLES, make_pdf  # noqa: E402
+
+
+def last_info(path):
+    """Raw document information written by the last update."""
+    data = path.read_bytes()
+    date = data.rindex(b"/ModDate")
+    return data[data.rindex(b"<<", 0, date) : data.index(b">>", date)]
+
+
+@pytest.mark.parametrize("xref", XREF_STYLES)
+def test_write_info_is_read_back(tmp_path, xref):
+    path = tmp_path / "doc.pdf"
+    make_pdf(path, xref=xref)
+
+    pdf_info.write_info(str(path), "New (title) Ünï", "Doe, J.")
+    assert pdf_info.read_info(str(path)) == ("New (title) Ünï", "Doe, J.")
+    pdf_info.write_info(str(path), "Newer title", "Roe, J.")
+    assert pdf_info.read_info(str(path)) == ("Newer title", "Roe, J.")
+
+
+@pytest.mark.parametrize("xref", XREF_STYLES)
+def test_write_info_keeps_other_entries(tmp_path, xref):
+    path = tmp_path / "doc.pdf"
+    make_pdf(path, xref=xref)
+
+    pdf_info.write_info(str(path), "New title", "Doe, J.")
+    info = last_info(path)
+    assert b"/Producer (sample_pdf)" in info
+    assert b"/Title (New title)" in info
+    assert b"Old" not in info and b"Updated" not in info
+
+
+def test_info_in_object_stream_is_not_replaced(tmp_path):
+    path = tmp_path / "doc.pdf"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [] /Count 0 >>",
+    ]
+    info = b"<< /Producer (LaTeX) /Title (Old) >>"
+    objstm = zlib.compress(b"4 0 " + info)
+    objects.append(
+        b"<< /Type /ObjStm /N 1 /First 4 /Filter /FlateDecode /Length %d >>\n"
+        % len(objstm)
+        + b"stream\n"
+        + objstm
+        + b"\nendstream"
+    )
+    data = bytearray(b"%PDF-1.5\n")
+    rows = [b"\x00\x00\x00\x00\xff\xff"]
+    for num, obj in enumerate(objects, 1):
+        rows.append(b"\x01" + len(data).to_bytes(4, "big") + b"\x00")
+        data += b"%d 0 obj\n" % num + obj + b"\nendobj\n"
+    rows.append(b"\x02" + (3).to_bytes(4, "big") + b"\x00")
+    rows.append(b"\x01" + len(data).to_bytes(4, "big") + b"\x00")
+    xref = b"".join(rows)
+    data += (
+        b"5 0 obj\n<< /Type /XRef /Size 6 /W [1 4 1] /Root 1 0 R /Info 4 0 R"
+        + b" /Length %d >>\nstream\n" % len(xref)
+        + xref
+        + b"\nendstream\nendobj\nstartxref\n%d\n%%%%EOF\n" % (len(data))
+    )
+    path.write_bytes(data)
+
+    with pytest.raises(pdf_info.PdfInfoError):
+        pdf_info.write_info(str(path), "New title", "Doe, J.")
+    assert path.read_bytes() == data
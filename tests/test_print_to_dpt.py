@@ -0,0 +1,222 @@
+import threading
+
+import pytest
+
+print_to_dpt = pytest.importorskip("wofi_pubs.print_to_dpt")
+
+from fake_dpt import FakeDigitalPaper  # noqa: E402
+
+ADDR = "192.168.1.101"
+
+
+class _Silent:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    new = staticmethod(lambda *args, **kwargs: _Silent())
+
+
+class FakeRepo:
+    """The parts of a pubs repository used by `Document`."""
+
+    def __init__(self, root):
+        self.root = root
+        self.conf = {"main": {"pubsdir": str(root / "library")}}
+        self.bib = dict()
+
+    def add(self, citekey, content=b"%PDF-1.4 document"):
+        doc = self.root / f"{citekey}.pdf"
+        doc.write_bytes(content)
+        self.bib[citekey] = {
+            "ENTRYTYPE": "article",
+            "title": f"Title of {citekey}",
+            "year": "2020",
+        }
+        return doc
+
+    @property
+    def databroker(self):
+        return self
+
+    def pull_bibentry(self, citekey):
+        return {citekey: self.bib[citekey]}
+
+    def pull_docpath(self, citekey):
+        return str(self.root / f"{citekey}.pdf")
+
+
+class FakeSessions:
+    def __init__(self, dpt=None, error=None):
+        self.dpt = dpt
+        self.error = error
+        self.invalidated = 0
+
+    def get(self, addr):
+        if self.error is not None:
+            raise self.error
+        return self.dpt
+
+    def invalidate(self, addr):
+        self.invalidated += 1
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    monkeypatch.setattr(print_to_dpt.Notify, "Notification", _Silent)
+    dpt = FakeDigitalPaper(ADDR)
+    inventory = print_to_dpt.DptInventory(str(tmp_path / "inventory.json"), ttl=0)
+    queue = print_to_dpt.DptUploadQueue(FakeSessions(dpt), inventory=inventory)
+    return dpt, inventory, queue, FakeRepo(tmp_path)
+
+
+def document(repo, citekey):
+    return print_to_dpt.Document(key=citekey, repo=repo, lib_name="main_library")
+
+
+def send(queue, docs):
+    done = threading.Event()
+    results = []
+    queue.submit(docs, ADDR, on_done=lambda r: (results.extend(r), done.set()))
+    assert done.wait(10), "on_done was not called"
+    return {key: status for key, _, status, _ in results}
+
+
+def test_send_again_is_unchanged(device):
+    dpt, _, queue, repo = device
+    repo.add("doe2020")
+    doc = document(repo, "doe2020")
+
+    assert send(queue, [doc]) == {"doe2020": "sent"}
+    assert send(queue, [doc]) == {"doe2020": "unchanged"}
+    assert dpt.calls.count("upload") == 1
+
+
+def test_changed_document_is_replaced(device):
+    dpt, _, queue, repo = device
+    path = repo.add("doe2020")
+    doc = document(repo, "doe2020")
+    send(queue, [doc])
+
+    path.write_bytes(b"%PDF-1.4 document with new metadata")
+    assert send(queue, [doc]) == {"doe2020": "replaced"}
+    assert dpt.download(doc.remote_path()) == path.read_bytes()
+    assert "delete_document" not in dpt.calls
+
+
+def test_annotated_document_is_not_replaced(device):
+    dpt, inventory, queue, repo = device
+    path = repo.add("doe2020")
+    doc = document(repo, "doe2020")
+    send(queue, [doc])
+    inventory.refresh(ADDR, dpt, doc.remote_path().parent, force=True)
+
+    dpt.annotate(doc.remote_path())
+    path.write_bytes(b"%PDF-1.4 document with new metadata")
+    assert send(queue, [doc]) == {"doe2020": "conflict"}
+    assert dpt.download(doc.remote_path()).endswith(b"% annotation\n")
+
+
+def test_missing_document_fails(device):
+    _, _, queue, repo = device
+    repo.add("doe2020")
+    # Known to the library, but not on disk
+    repo.bib["roe2021"] = dict(repo.bib["doe2020"], title="Missing")
+    missing = document(repo, "roe2021")
+
+    results = send(queue, [document(repo, "doe2020"), missing])
+    assert results == {"doe2020": "sent", "roe2021": "failed"}
+
+
+def test_annotated_document_is_downloaded_once(device):
+    dpt, inventory, queue, repo = device
+    repo.add("doe2020")
+    repo.add("roe2021")
+    docs = [document(repo, "doe2020"), document(repo, "roe2021")]
+    send(queue, docs)
+    print_to_dpt.sync_annotated_docs(dpt, ADDR, docs, inventory)
+
+    dpt.annotate(docs[0].remote_path())
+    dry_run = print_to_dpt.sync_annotated_docs(dpt, ADDR, docs, inventory, dry_run=True)
+    assert [key for key, *_ in dry_run] == ["doe2020"]
+    assert "download" not in dpt.calls
+
+    report = print_to_dpt.sync_annotated_docs(dpt, ADDR, docs, inventory)
+    assert [key for key, _, local in report if local is not None] == ["doe2020"]
+    assert report[0][2].read_bytes().endswith(b"% annotation\n")
+
+    assert print_to_dpt.sync_annotated_docs(dpt, ADDR, docs, inventory) == []
+    assert dpt.calls.count("download") == 1
+
+
+def test_dry_run_with_unreachable_device(tmp_path):
+    wofi_pubs_server = pytest.importorskip("wofi_pubs.wofi_pubs_server")
+    repo = FakeRepo(tmp_path)
+    repo.add("doe2020")
+    repo.all_papers = lambda: []
+    server = wofi_pubs_server.PubsServer.__new__(wofi_pubs_server.PubsServer)
+    server.repos = {"main.conf": repo}
+    server._dpt_sessions = FakeSessions(error=OSError("No route to host"))
+
+    report = server._sync_annotated_docs("main.conf", ADDR, dry_run=True)
+    assert report == {"error": "No route to host"}
+    assert server._dpt_sessions.invalidated == 1
+
+
+class HttpDevice:
+    """Device whose documents are written through a `requests` session."""
+
+    base_url = "https://192.168.1.101:8443"
+
+    def __init__(self, status=200):
+        requests = pytest.importorskip("requests")
+
+        class Session(requests.Session):
+            def send(session, request, **kwargs):
+                self.sent.append((request.url, kwargs.get("verify", session.verify)))
+                while request.body.read(65536):
+                    pass
+                response = requests.Response()
+                response.status_code = status
+                response.url = request.url
+                return response
+
+        self.session = Session()
+        self.session.verify = False
+        self.sent = []
+        self.deleted = []
+
+    def _get_object_id(self, remote_path):
+        return "folder-1"
+
+    def _post_endpoint(self, endpoint, data):
+        return type("Response", (), {"json": lambda r: {"document_id": "doc-1"}})()
+
+    def _delete_endpoint(self, endpoint):
+        self.deleted.append(endpoint)
+
+
+def test_upload_does_not_verify_with_the_ca_bundle(tmp_path, monkeypatch):
+    monkeypatch.setenv("REQUESTS_CA_BUNDLE", str(tmp_path / "ca.pem"))
+    monkeypatch.setenv("CURL_CA_BUNDLE", str(tmp_path / "ca.pem"))
+    dpt = HttpDevice()
+    path = FakeRepo(tmp_path).add("doe2020")
+    sent = []
+
+    print_to_dpt.upload_document(
+        dpt, str(path), "Document/doe2020.pdf", progress=sent.append
+    )
+    assert dpt.sent == [(f"{dpt.base_url}/documents/doc-1/file", False)]
+    assert sum(sent) > 0
+    assert dpt.deleted == []
+
+
+def test_failed_upload_deletes_the_new_document(tmp_path):
+    requests = pytest.importorskip("requests")
+    dpt = HttpDevice(status=500)
+    path = FakeRepo(tmp_path).add("doe2020")
+
+    with pytest.raises(requests.HTTPError):
+        print_to_dpt.upload_document(
+            dpt, str(path), "Document/doe2020.pdf", progress=lambda n: None
+        )
+    assert dpt.deleted == ["/documents/doc-1"]
@@ -0,0 +1,38 @@
+import json
+import subprocess
+
+from wofi_pubs import update_metadata
+
+
+class FakeExifTool:
+    def __init__(self, out):
+        self.out = out
+
+    def execute(self, *args):
+        return self.out
+
+
+def test_unchanged_file_is_written():
+    for out in ["    1 image files updated\n", "    1 image files unchanged\n"]:
+        exiftool = FakeExifTool(out)
+        assert update_metadata.write_pdf_metadata("doc.pdf", "T", "A", exiftool)
+    exiftool = FakeExifTool("    0 image files updated\n    1 files weren't updated")
+    assert not update_metadata.write_pdf_metadata("doc.pdf", "T", "A", exiftool)
+
+
+def test_paths_are_read_from_stdin(monkeypatch):
+    paths = [f"/library/doc/{k}.pdf" for k in range(100000)]
+    calls = []
+
+    def run(cmd, input=None, **kwargs):
+        calls.append((cmd, input))
+        out = [{"SourceFile": p, "Title": "T"} for p in paths[:2]]
+        return subprocess.CompletedProcess(cmd, 0, json.dumps(out).encode())
+
+    monkeypatch.setattr(update_metadata.subprocess, "run", run)
+    meta = update_metadata.read_pdf_metadata(paths)
+
+    assert meta == {paths[0]: ("T", ""), paths[1]: ("T", "")}
+    [(cmd, stdin)] = calls
+    assert cmd == ["exiftool", "-@", "-"]
+    assert stdin.decode().split("\n") == ["-json", "-Title", "-Author", *paths]